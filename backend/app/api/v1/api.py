@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import auth, customers, orders, services, users, reports
+from app.api.v1.endpoints import auth, customers, orders, services, users, reports, imports, backups, pickup_slots
 
 api_router = APIRouter()
 
@@ -10,4 +10,7 @@ api_router.include_router(customers.router, prefix="/customers", tags=["customer
 api_router.include_router(orders.router, prefix="/orders", tags=["orders"])
 api_router.include_router(services.router, prefix="/services", tags=["services"])
 api_router.include_router(users.router, prefix="/users", tags=["users"])
-api_router.include_router(reports.router, prefix="/reports", tags=["reports"])
\ No newline at end of file
+api_router.include_router(reports.router, prefix="/reports", tags=["reports"])
+api_router.include_router(imports.router, prefix="/import", tags=["import"])
+api_router.include_router(backups.router, prefix="/backups", tags=["backups"])
+api_router.include_router(pickup_slots.router, prefix="/pickup-slots", tags=["pickup-slots"])
\ No newline at end of file
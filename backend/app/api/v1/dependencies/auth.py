@@ -1,12 +1,14 @@
 from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.revocation import token_revocations
 from app.core.security import verify_token
+from app.core.tracing import start_span
 from app.models.user import User
 from app.schemas.user import TokenData
 
@@ -26,17 +28,28 @@ def get_current_user(
     )
     
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        with start_span("auth.decode_token"):
+            payload = jwt.decode(
+                token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+            )
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("typ") == "refresh":
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == token_data.username).first()
+    if settings.STATELESS_AUTH and payload.get("typ") == "access" and token_revocations.is_current():
+        if token_revocations.is_revoked(payload["uid"], payload["iat"]):
+            raise credentials_exception
+        # The user as the token describes it, attached to the session without
+        # a query; any other attribute is loaded when first read
+        user = User(id=payload["uid"], username=username, role=payload["role"], is_active=payload["active"])
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+    
+    with start_span("auth.load_user"):
+        user = db.query(User).filter(User.username == token_data.username).first()
     if user is None:
         raise credentials_exception
     return user
@@ -48,6 +61,25 @@ def get_current_active_user(
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+oauth2_scheme_optional = OAuth2PasswordBearer(
+    tokenUrl=f"{settings.API_V1_STR}/auth/login",
+    auto_error=False,
+)
+
+def get_current_stream_user(
+    db: Session = Depends(get_db),
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+    access_token: Optional[str] = Query(None, description="Bearer token, for EventSource clients that cannot send headers"),
+) -> User:
+    token = token or access_token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return get_current_active_user(get_current_user(db, token))
+
 def get_current_customer(
     current_user: User = Depends(get_current_active_user),
 ) -> User:
@@ -0,0 +1,40 @@
+from typing import Callable, Optional
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+
+from app.core.config import settings
+from app.core.rate_limit import rate_limiter, retry_after_header
+from app.models.user import User
+from app.api.v1.dependencies.auth import get_current_user
+
+def enforce_rate_limit(request: Request, group: str, username: Optional[str] = None) -> None:
+    """Raise 429 with Retry-After if the client or user has used up the group's limit"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    # Behind a proxy, uvicorn's proxy headers support sets client from X-Forwarded-For
+    ip = request.client.host if request.client else None
+    retry_after = rate_limiter.check(group, ip, username)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please try again later",
+            headers={"Retry-After": retry_after_header(retry_after)},
+        )
+
+def rate_limit(group: str) -> Callable[..., None]:
+    """Dependency applying the per-IP limit of a route group"""
+    def dependency(request: Request) -> None:
+        enforce_rate_limit(request, group)
+    return dependency
+
+def rate_limit_login(group: str = "login") -> Callable[..., None]:
+    """Dependency applying per-IP and per-attempted-username limits to the login form"""
+    def dependency(request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> None:
+        enforce_rate_limit(request, group, form_data.username)
+    return dependency
+
+def rate_limit_user(group: str) -> Callable[..., None]:
+    """Dependency applying per-IP and per-user limits to an authenticated route"""
+    def dependency(request: Request, current_user: User = Depends(get_current_user)) -> None:
+        enforce_rate_limit(request, group, current_user.username)
+    return dependency
@@ -1,4 +1,3 @@
-from datetime import timedelta
 from typing import Any
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
@@ -6,21 +5,25 @@ from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.core.database import get_db
+from jose import jwt, JWTError
+
 from app.core.security import (
-    create_access_token,
+    create_user_tokens,
     get_password_hash,
-    verify_password_with_salt,
+    verify_and_update_password_with_salt,
     generate_salt,
     hash_password_with_salt
 )
+from app.core.tracing import TracedRoute
 from app.models.user import User
 from app.models.customer import Customer
-from app.schemas.user import UserCreate, User as UserSchema, Token
+from app.schemas.user import UserCreate, User as UserSchema, Token, TokenRefresh
 from app.api.v1.dependencies.auth import get_current_active_user
+from app.api.v1.dependencies.rate_limit import rate_limit, rate_limit_login
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, response_model_exclude_none=True, dependencies=[Depends(rate_limit_login())])
 def login_for_access_token(
     db: Session = Depends(get_db),
     form_data: OAuth2PasswordRequestForm = Depends()
@@ -30,9 +33,10 @@ def login_for_access_token(
     """
     user = db.query(User).filter(User.username == form_data.username).first()
     
-    if not user or not verify_password_with_salt(
+    verified, new_hash = verify_and_update_password_with_salt(
         form_data.password, user.salt, user.password_hash
-    ):
+    ) if user else (False, None)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -47,19 +51,48 @@ def login_for_access_token(
     # Update last login
     from sqlalchemy.sql import func
     user.last_login = func.now()
+    if new_hash:
+        # The stored hash predates the current scheme or cost settings
+        user.password_hash = new_hash
     db.commit()
     
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        subject=user.username, expires_delta=access_token_expires
+    return create_user_tokens(user)
+
+@router.post("/refresh", response_model=Token, response_model_exclude_none=True)
+def refresh_access_token(
+    *,
+    db: Session = Depends(get_db),
+    token_in: TokenRefresh,
+) -> Any:
+    """
+    Exchange a refresh token (issued with STATELESS_AUTH) for a new access
+    token and refresh token, with the user's current role
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
+    try:
+        payload = jwt.decode(
+            token_in.refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+        )
+    except JWTError:
+        raise credentials_exception
+    if payload.get("typ") != "refresh" or payload.get("uid") is None:
+        raise credentials_exception
     
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-    }
+    user = db.get(User, payload["uid"])
+    if user is None or user.username != payload.get("sub"):
+        raise credentials_exception
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Inactive user"
+        )
+    return create_user_tokens(user)
 
-@router.post("/register", response_model=UserSchema)
+@router.post("/register", response_model=UserSchema, dependencies=[Depends(rate_limit("register"))])
 def register_user(
     *,
     db: Session = Depends(get_db),
@@ -0,0 +1,47 @@
+from typing import Any, List
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.core.tracing import TracedRoute
+from app.models.user import User
+from app.schemas.backup import BackupSnapshot
+from app.services.backup import BackupBusy, BackupError, create_snapshot, list_snapshots, snapshot_path, verify_snapshot
+from app.api.v1.dependencies.auth import get_current_admin
+
+router = APIRouter(route_class=TracedRoute)
+
+@router.get("/", response_model=List[BackupSnapshot])
+def read_backups(
+    current_user: User = Depends(get_current_admin),
+) -> Any:
+    """
+    List database snapshots, newest first
+    """
+    return list_snapshots()
+
+@router.post("/", response_model=BackupSnapshot)
+def create_backup(
+    current_user: User = Depends(get_current_admin),
+) -> Any:
+    """
+    Take a database snapshot now, verify it and drop the oldest beyond BACKUP_KEEP
+    """
+    try:
+        return create_snapshot()
+    except BackupBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except BackupError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{name}/verify", response_model=BackupSnapshot)
+def verify_backup(
+    name: str,
+    current_user: User = Depends(get_current_admin),
+) -> Any:
+    """
+    Restore a snapshot to a scratch file and check it; see ``verified`` and ``error``
+    """
+    try:
+        path = snapshot_path(name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Backup not found")
+    return verify_snapshot(path)
@@ -3,14 +3,15 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
+from app.core.tracing import TracedRoute
 from app.models.user import User
 from app.models.customer import Customer
-from app.models.order import Order
+from app.services.archive import orders_with_archive
 from app.schemas.customer import Customer as CustomerSchema, CustomerCreate, CustomerUpdate
 from app.api.v1.dependencies.auth import get_current_active_user, get_current_staff_or_admin
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 @router.get("/me", response_model=CustomerSchema)
 def read_customer_me(
@@ -27,11 +28,12 @@ def read_customer_me(
     if not customer:
         raise HTTPException(status_code=404, detail="Customer profile not found")
     
-    # Add computed fields
-    total_orders = db.query(func.count(Order.id)).filter(Order.customer_id == customer.id).scalar()
-    total_spent = db.query(func.coalesce(func.sum(Order.final_price), 0)).filter(
-        Order.customer_id == customer.id,
-        Order.status == "delivered"
+    # Add computed fields (lifetime totals, so archived orders count too)
+    orders = orders_with_archive()
+    total_orders = db.query(func.count(orders.id)).filter(orders.customer_id == customer.id).scalar()
+    total_spent = db.query(func.coalesce(func.sum(orders.final_price), 0)).filter(
+        orders.customer_id == customer.id,
+        orders.status == "delivered"
     ).scalar()
     
     customer_dict = customer.__dict__.copy()
@@ -75,7 +77,7 @@ def update_customer_me(
 
 @router.get("/", response_model=List[CustomerSchema])
 def read_customers(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_staff_or_admin),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
@@ -100,15 +102,16 @@ def read_customers(
     
     customers = query.offset(skip).limit(limit).all()
     
-    # Add computed fields for each customer
+    # Add computed fields for each customer (lifetime totals, so archived orders count too)
+    orders = orders_with_archive()
     result = []
     for customer in customers:
-        total_orders = db.query(func.count(Order.id)).filter(Order.customer_id == customer.id).scalar()
-        total_spent = db.query(func.coalesce(func.sum(Order.final_price), 0)).filter(
-            Order.customer_id == customer.id,
-            Order.status == "delivered"
+        total_orders = db.query(func.count(orders.id)).filter(orders.customer_id == customer.id).scalar()
+        total_spent = db.query(func.coalesce(func.sum(orders.final_price), 0)).filter(
+            orders.customer_id == customer.id,
+            orders.status == "delivered"
         ).scalar()
-        last_order = db.query(func.max(Order.created_at)).filter(Order.customer_id == customer.id).scalar()
+        last_order = db.query(func.max(orders.created_at)).filter(orders.customer_id == customer.id).scalar()
         
         customer_dict = customer.__dict__.copy()
         customer_dict['total_orders'] = total_orders or 0
@@ -122,7 +125,7 @@ def read_customers(
 @router.get("/{customer_id}", response_model=CustomerSchema)
 def read_customer(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     customer_id: int,
     current_user: User = Depends(get_current_staff_or_admin),
 ) -> Any:
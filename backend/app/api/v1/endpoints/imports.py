@@ -0,0 +1,57 @@
+from typing import Any, Iterator, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from anyio import from_thread, to_thread
+
+from app.core.tracing import TracedRoute
+from app.models.user import User
+from app.schemas.bulk_import import ImportReport
+from app.services.bulk_import import FORMATS, IMPORTERS, ChunkReader, run_import
+from app.api.v1.dependencies.auth import get_current_admin
+
+router = APIRouter(route_class=TracedRoute)
+
+CONTENT_TYPE_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json-seq": "ndjson",
+}
+
+def _body_chunks(request: Request) -> Iterator[bytes]:
+    """The request body, read from the worker thread a chunk at a time"""
+    stream = request.stream()
+    while True:
+        try:
+            chunk = from_thread.run(stream.__anext__)
+        except StopAsyncIteration:
+            return
+        if chunk:
+            yield chunk
+
+@router.post("/{kind}", response_model=ImportReport)
+async def import_records(
+    kind: str,
+    request: Request,
+    format: Optional[str] = Query(None, description="csv or ndjson; default: from the Content-Type"),
+    current_user: User = Depends(get_current_admin),
+) -> Any:
+    """
+    Import customers or historical orders from a CSV or NDJSON request body.
+
+    The body is streamed and imported in chunks, so files of any size can be
+    sent. Invalid rows are skipped and listed in the report with their row
+    number; every other row is imported.
+    """
+    if kind not in IMPORTERS:
+        raise HTTPException(status_code=404, detail=f"Unknown import; expected one of {', '.join(IMPORTERS)}")
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        format = CONTENT_TYPE_FORMATS.get(content_type)
+    if format not in FORMATS:
+        raise HTTPException(
+            status_code=415,
+            detail="Send text/csv or application/x-ndjson, or set format=csv or format=ndjson",
+        )
+    stream = ChunkReader(_body_chunks(request))
+    # Parsing, validation and the database writes run in a worker thread, off the event loop
+    return await to_thread.run_sync(run_import, kind, stream, format, current_user.username)
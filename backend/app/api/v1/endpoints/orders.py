@@ -1,17 +1,31 @@
 from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, desc, asc
-from datetime import datetime, date
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import func, desc, asc, and_, or_
+from datetime import datetime, date, timedelta
 import secrets
 import string
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.config import settings
+from app.core.events import order_event_stream, order_snapshot, record_order_event
+from app.core.idempotency import idempotent
+from app.core.outbox import publish_event
+from app.core.sync import SyncToken, as_utc
+from app.core.tracing import TracedRoute
 from app.models.user import User
 from app.models.customer import Customer
-from app.models.order import Order, OrderStatusHistory as OrderStatusHistoryModel, OrderReview
+from app.models.order import (
+    ORDER_STATUSES, ORDER_TRANSITIONS, OPEN_ORDER_STATUSES, Order, OrderStatusHistory as OrderStatusHistoryModel, OrderReview,
+    OrderTombstone, can_transition, utcnow,
+)
+from app.models.archive import ArchivedOrder, ArchivedOrderStatusHistory
 from app.models.service import Service
+from app.services.pickup_slots import (
+    InvalidPickupSlot, PickupSlotFull, availability_cache, default_location_id, release_pickup_slot, reserve_pickup_slot,
+)
 from app.schemas.order import (
     Order as OrderSchema,
     OrderCreate,
@@ -21,14 +35,17 @@ from app.schemas.order import (
     OrderReview as OrderReviewSchema,
     OrderReviewCreate,
     OrderStatusHistory as OrderStatusHistorySchema,
+    OrderSync,
 )
 from app.api.v1.dependencies.auth import (
     get_current_active_user,
     get_current_customer,
-    get_current_staff_or_admin
+    get_current_staff_or_admin,
+    get_current_stream_user,
 )
+from app.api.v1.dependencies.rate_limit import rate_limit_user
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 def generate_order_number() -> str:
     """Generate unique order number"""
@@ -43,7 +60,39 @@ def calculate_order_price(service: Service, weight: float) -> float:
     multiplier = settings.DEFAULT_SERVICE_MULTIPLIERS.get(service.service_type, 1.0)
     return base_price * multiplier
 
-@router.post("/", response_model=OrderSchema)
+def order_etag(order) -> str:
+    """Strong ETag of an order: its version, which every update of the order bumps"""
+    return f'"{order.version}"'
+
+def check_if_match(order: Order, if_match: Optional[str]) -> None:
+    """412 if the client sent If-Match and it does not name the order's current version"""
+    if if_match is None:
+        return
+    # W/ accepted too: the compression middleware weakens the ETag of encoded responses
+    tags = {tag.strip() for tag in if_match.split(",")}
+    tags = {tag[2:] if tag.startswith("W/") else tag for tag in tags}
+    if "*" not in tags and order_etag(order) not in tags:
+        raise HTTPException(
+            status_code=412,
+            detail="The order has changed since you loaded it. Reload it and try again.",
+        )
+
+def flush_order_update(db: Session) -> None:
+    """
+    Write the pending order changes: UPDATE ... WHERE id = ? AND version = ?
+    matches no row if someone else updated the order since it was read
+    """
+    try:
+        db.flush()
+    except StaleDataError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="The order was updated by someone else at the same time. Reload it and try again.",
+        )
+
+@router.post("/", response_model=OrderSchema, dependencies=[Depends(rate_limit_user("create_order"))])
+@idempotent
 def create_order(
     *,
     db: Session = Depends(get_db),
@@ -75,44 +124,53 @@ def create_order(
         # Calculate total price
         total_price = calculate_order_price(service, order_in.estimated_weight)
         
-        # Create order
+        # Take a place in the pickup window: one conditional UPDATE, rolled
+        # back with the order if anything below fails
+        location_id = pickup_slot_id = None
+        if settings.PICKUP_SLOTS_ENABLED:
+            location_id = order_in.location_id or default_location_id(db)
+            try:
+                pickup_slot_id = reserve_pickup_slot(db, location_id, order_in.pickup_date, order_in.pickup_time)
+            except InvalidPickupSlot as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except PickupSlotFull as e:
+                raise HTTPException(status_code=409, detail=str(e))
+        
+        # Create order, with its relationships filled in so the response
+        # needs no further queries
         order = Order(
             order_number=order_number,
-            customer_id=customer.id,
-            service_id=order_in.service_id,
+            customer=customer,
+            service=service,
             estimated_weight=order_in.estimated_weight,
             total_price=total_price,
             status="placed",
             pickup_date=order_in.pickup_date,
             pickup_time=order_in.pickup_time,
+            pickup_slot_id=pickup_slot_id,
             service_options=order_in.service_options,
-            special_instructions=order_in.special_instructions
+            special_instructions=order_in.special_instructions,
+            reviews=[],
         )
         
-        db.add(order)
-        db.flush()  # Flush to get the order ID
-        
         # Create initial status history
-        status_history = OrderStatusHistoryModel(
-            order_id=order.id,
+        order.status_history.append(OrderStatusHistoryModel(
             status="placed",
             notes="Order placed by customer",
             updated_by=current_user.username
-        )
+        ))
         
-        db.add(status_history)
+        db.add(order)
+        db.flush()  # Flush to get the order ID; created_at comes back with it
+        publish_event(db, "order.created", order_snapshot(order), aggregate_id=order.id)
+        db.expire_on_commit = False
         db.commit()
-        db.refresh(order)
-        
-        # Load relationships
-        order = db.query(Order).options(
-            joinedload(Order.customer),
-            joinedload(Order.service),
-            joinedload(Order.status_history),
-            joinedload(Order.reviews)
-        ).filter(Order.id == order.id).first()
+        if pickup_slot_id is not None:
+            availability_cache.invalidate(location_id)
         
         return order
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -120,7 +178,7 @@ def create_order(
 
 @router.get("/", response_model=List[OrderSchema])
 def read_orders(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
@@ -128,6 +186,7 @@ def read_orders(
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
     search: Optional[str] = Query(None),
+    updated_since: Optional[datetime] = Query(None, description="Only orders changed after this time; see /orders/sync for tombstones and paging"),
 ) -> Any:
     """
     Retrieve orders (customer sees own orders, staff/admin see all)
@@ -156,6 +215,9 @@ def read_orders(
     if date_to:
         query = query.filter(Order.created_at <= date_to)
     
+    if updated_since:
+        query = query.filter(Order.updated_at > as_utc(updated_since))
+    
     if search:
         query = query.filter(
             (Order.order_number.contains(search)) |
@@ -169,12 +231,117 @@ def read_orders(
     orders = query.offset(skip).limit(limit).all()
     return orders
 
+def _event_stream_response(order_id: Optional[int], last_event_id: Optional[int]) -> StreamingResponse:
+    return StreamingResponse(
+        order_event_stream(order_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/events", response_class=StreamingResponse)
+def stream_order_events(
+    *,
+    current_user: User = Depends(get_current_stream_user),
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+) -> Any:
+    """
+    Server-Sent Events stream of status and weight changes to all orders (staff/admin only)
+    """
+    if current_user.role not in ["staff", "admin"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return _event_stream_response(None, last_event_id)
+
+@router.get("/sync", response_model=OrderSync)
+def sync_orders(
+    # Always the primary: a lagging replica could hide changes behind the watermark
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    sync_token: Optional[str] = Query(None, description="Token from the previous sync; omit for the initial snapshot"),
+    limit: int = Query(500, ge=1, le=1000),
+) -> Any:
+    """
+    Incremental order sync (customer syncs own orders, staff/admin sync all).
+    
+    Without a token, returns the open orders; afterwards, only orders changed
+    since the token, with cancelled and removed orders as tombstones.
+    """
+    started = utcnow()
+    if sync_token:
+        try:
+            token = SyncToken.decode(sync_token)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+    else:
+        token = SyncToken(snapshot_started=started)
+    
+    query = db.query(Order).options(
+        joinedload(Order.customer),
+        joinedload(Order.service),
+        joinedload(Order.status_history),
+        joinedload(Order.reviews)
+    )
+    tombstones = db.query(OrderTombstone)
+    
+    # Customer can only see their own orders
+    if current_user.role == "customer":
+        customer = db.query(Customer).filter(Customer.user_id == current_user.id).first()
+        customer_id = customer.id if customer else -1
+        query = query.filter(Order.customer_id == customer_id)
+        tombstones = tombstones.filter(OrderTombstone.customer_id == customer_id)
+    
+    in_snapshot = token.snapshot_started is not None
+    if in_snapshot:
+        query = query.filter(Order.status.in_(OPEN_ORDER_STATUSES))
+    if token.since is not None:
+        query = query.filter(or_(
+            Order.updated_at > token.since,
+            and_(Order.updated_at == token.since, Order.id > token.after_id),
+        ))
+    
+    orders = query.order_by(Order.updated_at, Order.id).limit(limit + 1).all()
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    
+    removed = [
+        {"id": order.id, "order_number": order.order_number, "reason": "cancelled", "removed_at": order.updated_at}
+        for order in orders if order.status == "cancelled"
+    ]
+    if not in_snapshot:
+        if token.since is not None:
+            tombstones = tombstones.filter(OrderTombstone.removed_at > token.since)
+        if has_more:
+            tombstones = tombstones.filter(OrderTombstone.removed_at <= orders[-1].updated_at)
+        removed.extend(
+            {"id": row.order_id, "order_number": row.order_number, "reason": row.reason, "removed_at": row.removed_at}
+            for row in tombstones.order_by(OrderTombstone.removed_at)
+        )
+    
+    if has_more:
+        next_token = SyncToken(orders[-1].updated_at, orders[-1].id, token.snapshot_started)
+    else:
+        # Restart a little in the past: a transaction still open now may commit
+        # rows stamped earlier than this sync. Clients may see a change twice.
+        resume_from = (token.snapshot_started or started) - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS)
+        if not in_snapshot and token.since is not None and token.since >= resume_from:
+            next_token = SyncToken(token.since, token.after_id)
+        else:
+            next_token = SyncToken(resume_from)
+    
+    return {
+        "changed": [order for order in orders if order.status != "cancelled"],
+        "removed": removed,
+        "sync_token": next_token.encode(),
+        "has_more": has_more,
+    }
+
 @router.get("/{order_id}", response_model=OrderSchema)
 def read_order(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
+    response: Response,
     order_id: int,
     current_user: User = Depends(get_current_active_user),
+    include_archived: bool = Query(False, description="Also look among archived (long finished) orders"),
 ) -> Any:
     """
     Get order by ID
@@ -186,6 +353,14 @@ def read_order(
         joinedload(Order.reviews)
     ).filter(Order.id == order_id).first()
     
+    if not order and include_archived:
+        order = db.query(ArchivedOrder).options(
+            joinedload(ArchivedOrder.customer),
+            joinedload(ArchivedOrder.service),
+            joinedload(ArchivedOrder.status_history),
+            joinedload(ArchivedOrder.reviews)
+        ).filter(ArchivedOrder.id == order_id).first()
+    
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -195,31 +370,43 @@ def read_order(
         if not customer or order.customer_id != customer.id:
             raise HTTPException(status_code=403, detail="Not enough permissions")
     
+    response.headers["ETag"] = order_etag(order)
     return order
 
 @router.put("/{order_id}/status", response_model=OrderSchema)
+@idempotent
 def update_order_status(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     order_id: int,
     status_update: OrderStatusUpdate,
+    if_match: Optional[str] = Header(None, description="ETag of the order as last read; the update fails with 412 if it changed since"),
     current_user: User = Depends(get_current_staff_or_admin),
 ) -> Any:
     """
     Update order status (staff/admin only)
     """
-    order = db.query(Order).filter(Order.id == order_id).first()
+    # Loaded with everything the response shows, which stays usable after commit
+    order = db.query(Order).options(
+        joinedload(Order.customer),
+        joinedload(Order.service),
+        joinedload(Order.status_history),
+        joinedload(Order.reviews)
+    ).filter(Order.id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    check_if_match(order, if_match)
     
     # Validate status transition
-    valid_statuses = [
-        "placed", "confirmed", "collected", "washing", 
-        "ironing", "ready", "out_for_delivery", "delivered", "cancelled"
-    ]
-    
-    if status_update.status not in valid_statuses:
+    if status_update.status not in ORDER_STATUSES:
         raise HTTPException(status_code=400, detail="Invalid status")
+    if not can_transition(order.status, status_update.status):
+        allowed = ", ".join(ORDER_TRANSITIONS[order.status]) or "none, it is final"
+        raise HTTPException(
+            status_code=409,
+            detail=f"An order cannot go from {order.status} to {status_update.status} (next statuses: {allowed})",
+        )
     
     # Update order status
     old_status = order.status
@@ -230,44 +417,58 @@ def update_order_status(
         order.delivery_date = date.today()
     
     # Create status history entry
-    status_history = OrderStatusHistoryModel(
+    order.status_history.append(OrderStatusHistoryModel(
         order_id=order.id,
         status=status_update.status,
         notes=status_update.notes or f"Status changed from {old_status} to {status_update.status}",
         updated_by=current_user.username
+    ))
+    flush_order_update(db)
+    
+    # A cancelled order gives its pickup place back
+    released_location_id = None
+    if status_update.status == "cancelled" and order.pickup_slot_id is not None:
+        released_location_id = release_pickup_slot(db, order.pickup_slot_id)
+    
+    record_order_event(db, order, "order.status", previous_status=old_status)
+    publish_event(
+        db, "order.status_changed",
+        {**order_snapshot(order, previous_status=old_status), "changed_by": current_user.username},
+        aggregate_id=order.id,
     )
-    
-    db.add(status_history)
+    db.expire_on_commit = False
     db.commit()
-    db.refresh(order)
-    
-    # Load relationships
-    order = db.query(Order).options(
-        joinedload(Order.customer),
-        joinedload(Order.service),
-        joinedload(Order.status_history),
-        joinedload(Order.reviews)
-    ).filter(Order.id == order.id).first()
+    if released_location_id is not None:
+        availability_cache.invalidate(released_location_id)
     
+    response.headers["ETag"] = order_etag(order)
     return order
 
 @router.put("/{order_id}/weight", response_model=OrderSchema)
+@idempotent
 def update_order_weight(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     order_id: int,
     weight_update: OrderWeightUpdate,
+    if_match: Optional[str] = Header(None, description="ETag of the order as last read; the update fails with 412 if it changed since"),
     current_user: User = Depends(get_current_staff_or_admin),
 ) -> Any:
     """
     Update order actual weight and recalculate price (staff/admin only)
     """
+    # Loaded with everything the response shows, which stays usable after commit
     order = db.query(Order).options(
-        joinedload(Order.service)
+        joinedload(Order.customer),
+        joinedload(Order.service),
+        joinedload(Order.status_history),
+        joinedload(Order.reviews)
     ).filter(Order.id == order_id).first()
     
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    check_if_match(order, if_match)
     
     if weight_update.actual_weight <= 0:
         raise HTTPException(status_code=400, detail="Weight must be greater than 0")
@@ -279,25 +480,24 @@ def update_order_weight(
     order.final_price = calculate_order_price(order.service, weight_update.actual_weight)
     
     # Create status history entry
-    status_history = OrderStatusHistoryModel(
+    order.status_history.append(OrderStatusHistoryModel(
         order_id=order.id,
         status=order.status,
         notes=f"Weight updated to {weight_update.actual_weight}kg. Final price: KSH {order.final_price}",
         updated_by=current_user.username
+    ))
+    flush_order_update(db)
+    
+    record_order_event(db, order, "order.weight")
+    publish_event(
+        db, "order.weight_updated",
+        {**order_snapshot(order), "changed_by": current_user.username},
+        aggregate_id=order.id,
     )
-    
-    db.add(status_history)
+    db.expire_on_commit = False
     db.commit()
-    db.refresh(order)
-    
-    # Load relationships
-    order = db.query(Order).options(
-        joinedload(Order.customer),
-        joinedload(Order.service),
-        joinedload(Order.status_history),
-        joinedload(Order.reviews)
-    ).filter(Order.id == order.id).first()
     
+    response.headers["ETag"] = order_etag(order)
     return order
 
 @router.post("/{order_id}/review", response_model=OrderReviewSchema)
@@ -341,22 +541,55 @@ def create_order_review(
     )
     
     db.add(review)
+    publish_event(
+        db, "order.reviewed",
+        {**order_snapshot(order), "rating": review_in.rating, "comment": review_in.comment},
+        aggregate_id=order.id,
+    )
     db.commit()
     db.refresh(review)
     
     return review
 
+@router.get("/{order_id}/events", response_class=StreamingResponse)
+def stream_order(
+    *,
+    db: Session = Depends(get_read_db),
+    order_id: int,
+    current_user: User = Depends(get_current_stream_user),
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+) -> Any:
+    """
+    Server-Sent Events stream of status and weight changes to one order
+    """
+    order = db.query(Order).filter(Order.id == order_id).first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    
+    # Customer can only see their own orders
+    if current_user.role == "customer":
+        customer = db.query(Customer).filter(Customer.user_id == current_user.id).first()
+        if not customer or order.customer_id != customer.id:
+            raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    return _event_stream_response(order_id, last_event_id)
+
 @router.get("/{order_id}/status-history", response_model=List[OrderStatusHistorySchema])
 def get_order_status_history(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     order_id: int,
     current_user: User = Depends(get_current_active_user),
+    include_archived: bool = Query(False, description="Also look among archived (long finished) orders"),
 ) -> Any:
     """
     Get order status history
     """
     order = db.query(Order).filter(Order.id == order_id).first()
+    history_model = OrderStatusHistoryModel
+    if not order and include_archived:
+        order = db.query(ArchivedOrder).filter(ArchivedOrder.id == order_id).first()
+        history_model = ArchivedOrderStatusHistory
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -366,8 +599,8 @@ def get_order_status_history(
         if not customer or order.customer_id != customer.id:
             raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    status_history = db.query(OrderStatusHistoryModel).filter(
-        OrderStatusHistoryModel.order_id == order_id
-    ).order_by(asc(OrderStatusHistoryModel.timestamp)).all()
+    status_history = db.query(history_model).filter(
+        history_model.order_id == order_id
+    ).order_by(asc(history_model.timestamp)).all()
     
     return status_history
@@ -0,0 +1,59 @@
+from typing import Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.tracing import TracedRoute
+from app.models.pickup_slot import PickupSlot
+from app.models.user import User
+from app.schemas.pickup_slot import PickupAvailability, PickupSlot as PickupSlotSchema, PickupSlotCapacityUpdate
+from app.services.pickup_slots import availability_cache, default_location_id, set_slot_capacity
+from app.api.v1.dependencies.auth import get_current_active_user, get_current_admin
+
+router = APIRouter(route_class=TracedRoute)
+
+@router.get("/availability", response_model=PickupAvailability)
+def read_pickup_availability(
+    # The primary, not a replica: the figures are cached, and should be current when loaded
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    days: int = Query(7, ge=1, le=settings.PICKUP_SLOT_DAYS_AHEAD + 1, description="Days from today"),
+    location_id: Optional[int] = Query(None, description="Branch; default: the main branch"),
+) -> Any:
+    """
+    Remaining pickup places per window for the next days (cached for a few seconds)
+    """
+    location_id = location_id or default_location_id(db)
+    availability = availability_cache.get(db, location_id, days) if location_id else None
+    if availability is None:
+        raise HTTPException(status_code=404, detail="Branch not found")
+    return {"location_id": location_id, "days": availability}
+
+@router.put("/capacity", response_model=PickupSlotSchema)
+def update_pickup_slot_capacity(
+    *,
+    db: Session = Depends(get_db),
+    slot_in: PickupSlotCapacityUpdate,
+    current_user: User = Depends(get_current_admin),
+) -> Any:
+    """
+    Set how many pickups a branch takes in one window on one day (admin only)
+    """
+    if slot_in.pickup_time not in settings.PICKUP_SLOT_WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Pickup time must be one of: {', '.join(settings.PICKUP_SLOT_WINDOWS)}",
+        )
+    location_id = slot_in.location_id or default_location_id(db)
+    if location_id is None:
+        raise HTTPException(status_code=404, detail="Branch not found")
+    set_slot_capacity(db, location_id, slot_in.pickup_date, slot_in.pickup_time, slot_in.capacity)
+    slot = db.query(PickupSlot).filter(
+        PickupSlot.location_id == location_id,
+        PickupSlot.pickup_date == slot_in.pickup_date,
+        PickupSlot.pickup_time == slot_in.pickup_time,
+    ).one()
+    db.commit()
+    availability_cache.invalidate(location_id)
+    return slot
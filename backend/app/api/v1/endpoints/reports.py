@@ -1,29 +1,36 @@
 from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, extract
+from sqlalchemy import func, desc, extract, case, select
 from datetime import datetime, date, timedelta
 
-from app.core.database import get_db
-from app.models.user import User
-from app.models.order import Order
+from app.core.config import settings
+from app.core.database import get_read_db
+from app.core.tracing import TracedRoute
+from app.models.user import User, UserCount
+from app.models.order import Order, ORDER_STATUSES, OPEN_ORDER_STATUSES
 from app.models.customer import Customer
 from app.models.service import Service
+from app.services.archive import order_source
+from app.services.forecast import ForecastUnavailable, order_forecast
 # Update the import path below if the dependency has moved, or ensure the file exists at the specified location.
 from app.api.v1.dependencies.auth import get_current_staff_or_admin
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 @router.get("/overview")
 def get_overview_report(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_staff_or_admin),
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
+    include_archived: bool = Query(False, description="Include archived (long finished) orders"),
 ) -> Any:
     """
     Get overview report with key metrics
     """
+    orders = order_source(include_archived)
+    
     # Default date range (last 30 days)
     if not date_from:
         date_from = date.today() - timedelta(days=30)
@@ -31,20 +38,20 @@ def get_overview_report(
         date_to = date.today()
     
     # Base query for date range
-    base_query = db.query(Order).filter(
-        Order.created_at >= date_from,
-        Order.created_at <= date_to
+    base_query = db.query(orders).filter(
+        orders.created_at >= date_from,
+        orders.created_at <= date_to
     )
     
     # Order statistics
     total_orders = base_query.count()
-    completed_orders = base_query.filter(Order.status == "delivered").count()
-    pending_orders = base_query.filter(Order.status.in_(["placed", "confirmed"])).count()
-    cancelled_orders = base_query.filter(Order.status == "cancelled").count()
+    completed_orders = base_query.filter(orders.status == "delivered").count()
+    pending_orders = base_query.filter(orders.status.in_(["placed", "confirmed"])).count()
+    cancelled_orders = base_query.filter(orders.status == "cancelled").count()
     
     # Revenue statistics
-    total_revenue = base_query.filter(Order.status == "delivered").with_entities(
-        func.coalesce(func.sum(Order.final_price), 0)
+    total_revenue = base_query.filter(orders.status == "delivered").with_entities(
+        func.coalesce(func.sum(orders.final_price), 0)
     ).scalar() or 0
     
     avg_order_value = 0
@@ -87,14 +94,17 @@ def get_overview_report(
 
 @router.get("/revenue")
 def get_revenue_report(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_staff_or_admin),
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
+    include_archived: bool = Query(False, description="Include archived (long finished) orders"),
 ) -> Any:
     """
     Get detailed revenue report
     """
+    orders = order_source(include_archived)
+    
     if not date_from:
         date_from = date.today() - timedelta(days=30)
     if not date_to:
@@ -103,41 +113,41 @@ def get_revenue_report(
     # Revenue by service
     revenue_by_service = db.query(
         Service.name,
-        func.coalesce(func.sum(Order.final_price), 0).label("revenue"),
-        func.count(Order.id).label("orders")
-    ).join(Order).filter(
-        Order.created_at >= date_from,
-        Order.created_at <= date_to,
-        Order.status == "delivered"
+        func.coalesce(func.sum(orders.final_price), 0).label("revenue"),
+        func.count(orders.id).label("orders")
+    ).join(orders, orders.service_id == Service.id).filter(
+        orders.created_at >= date_from,
+        orders.created_at <= date_to,
+        orders.status == "delivered"
     ).group_by(Service.id, Service.name).all()
     
     # Daily revenue trend
     daily_revenue = db.query(
-        func.date(Order.created_at).label("date"),
-        func.coalesce(func.sum(Order.final_price), 0).label("revenue"),
-        func.count(Order.id).label("orders")
+        func.date(orders.created_at).label("date"),
+        func.coalesce(func.sum(orders.final_price), 0).label("revenue"),
+        func.count(orders.id).label("orders")
     ).filter(
-        Order.created_at >= date_from,
-        Order.created_at <= date_to,
-        Order.status == "delivered"
-    ).group_by(func.date(Order.created_at)).order_by(func.date(Order.created_at)).all()
+        orders.created_at >= date_from,
+        orders.created_at <= date_to,
+        orders.status == "delivered"
+    ).group_by(func.date(orders.created_at)).order_by(func.date(orders.created_at)).all()
     
     # Monthly revenue (last 12 months)
     twelve_months_ago = date.today().replace(day=1) - timedelta(days=365)
     monthly_revenue = db.query(
-        extract('year', Order.created_at).label('year'),
-        extract('month', Order.created_at).label('month'),
-        func.coalesce(func.sum(Order.final_price), 0).label("revenue"),
-        func.count(Order.id).label("orders")
+        extract('year', orders.created_at).label('year'),
+        extract('month', orders.created_at).label('month'),
+        func.coalesce(func.sum(orders.final_price), 0).label("revenue"),
+        func.count(orders.id).label("orders")
     ).filter(
-        Order.created_at >= twelve_months_ago,
-        Order.status == "delivered"
+        orders.created_at >= twelve_months_ago,
+        orders.status == "delivered"
     ).group_by(
-        extract('year', Order.created_at),
-        extract('month', Order.created_at)
+        extract('year', orders.created_at),
+        extract('month', orders.created_at)
     ).order_by(
-        extract('year', Order.created_at),
-        extract('month', Order.created_at)
+        extract('year', orders.created_at),
+        extract('month', orders.created_at)
     ).all()
     
     return {
@@ -151,7 +161,8 @@ def get_revenue_report(
         ],
         "daily_revenue": [
             {
-                "date": row.date.isoformat(),
+                # SQLite returns date() as a string, PostgreSQL as a date
+                "date": row.date if isinstance(row.date, str) else row.date.isoformat(),
                 "revenue": float(row.revenue),
                 "orders": row.orders
             }
@@ -170,23 +181,26 @@ def get_revenue_report(
 
 @router.get("/customers")
 def get_customer_report(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_staff_or_admin),
+    include_archived: bool = Query(False, description="Include archived (long finished) orders"),
 ) -> Any:
     """
     Get customer analytics report
     """
+    orders = order_source(include_archived)
+    
     # Top customers by revenue
     top_customers = db.query(
         Customer.id,
         Customer.name,
         Customer.phone,
-        func.count(Order.id).label("total_orders"),
-        func.coalesce(func.sum(Order.final_price), 0).label("total_spent")
-    ).join(Order).filter(
-        Order.status == "delivered"
+        func.count(orders.id).label("total_orders"),
+        func.coalesce(func.sum(orders.final_price), 0).label("total_spent")
+    ).join(orders, orders.customer_id == Customer.id).filter(
+        orders.status == "delivered"
     ).group_by(Customer.id, Customer.name, Customer.phone).order_by(
-        desc(func.coalesce(func.sum(Order.final_price), 0))
+        desc(func.coalesce(func.sum(orders.final_price), 0))
     ).limit(10).all()
     
     # Customer growth by month (last 12 months)
@@ -207,8 +221,8 @@ def get_customer_report(
     
     # Customer segments
     total_customers = db.query(Customer).count()
-    active_customers = db.query(Customer).join(Order).filter(
-        Order.created_at >= date.today() - timedelta(days=90)
+    active_customers = db.query(Customer).join(orders, orders.customer_id == Customer.id).filter(
+        orders.created_at >= date.today() - timedelta(days=90)
     ).distinct().count()
     
     return {
@@ -239,14 +253,17 @@ def get_customer_report(
 
 @router.get("/orders")
 def get_orders_report(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_staff_or_admin),
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
+    include_archived: bool = Query(False, description="Include archived (long finished) orders"),
 ) -> Any:
     """
     Get orders analytics report
     """
+    orders = order_source(include_archived)
+    
     if not date_from:
         date_from = date.today() - timedelta(days=30)
     if not date_to:
@@ -254,33 +271,33 @@ def get_orders_report(
     
     # Orders by status
     orders_by_status = db.query(
-        Order.status,
-        func.count(Order.id).label("count")
+        orders.status,
+        func.count(orders.id).label("count")
     ).filter(
-        Order.created_at >= date_from,
-        Order.created_at <= date_to
-    ).group_by(Order.status).all()
+        orders.created_at >= date_from,
+        orders.created_at <= date_to
+    ).group_by(orders.status).all()
     
     # Orders by service type
     orders_by_service = db.query(
         Service.service_type,
-        func.count(Order.id).label("count"),
-        func.avg(Order.final_price).label("avg_price")
-    ).join(Order).filter(
-        Order.created_at >= date_from,
-        Order.created_at <= date_to
+        func.count(orders.id).label("count"),
+        func.avg(orders.final_price).label("avg_price")
+    ).join(orders, orders.service_id == Service.id).filter(
+        orders.created_at >= date_from,
+        orders.created_at <= date_to
     ).group_by(Service.service_type).all()
     
     # Average turnaround time (for completed orders)
     avg_turnaround = db.query(
         func.avg(
-            func.julianday(Order.delivery_date) - func.julianday(Order.pickup_date)
+            func.julianday(orders.delivery_date) - func.julianday(orders.pickup_date)
         ).label("avg_days")
     ).filter(
-        Order.created_at >= date_from,
-        Order.created_at <= date_to,
-        Order.status == "delivered",
-        Order.delivery_date.isnot(None)
+        orders.created_at >= date_from,
+        orders.created_at <= date_to,
+        orders.status == "delivered",
+        orders.delivery_date.isnot(None)
     ).scalar()
     
     return {
@@ -302,4 +319,119 @@ def get_orders_report(
         "performance": {
             "avg_turnaround_days": float(avg_turnaround) if avg_turnaround else 0
         }
-    }
\ No newline at end of file
+    }
+
+@router.get("/dashboard")
+def get_dashboard(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_staff_or_admin),
+    per_status: int = Query(10, ge=0, le=100, description="Orders returned per status column"),
+) -> Any:
+    """
+    Everything the staff/admin dashboards show, in two grouped queries (three for admins)
+    """
+    today = date.today()
+    
+    # Per-status counts, with today's and overdue pickups/deliveries counted alongside
+    pickup_overdue = (Order.pickup_date < today) & Order.status.in_(["placed", "confirmed"])
+    delivery_overdue = (Order.delivery_date < today) & Order.status.in_(OPEN_ORDER_STATUSES)
+    facets = db.query(
+        Order.status,
+        func.count(Order.id).label("orders"),
+        func.sum(case((Order.pickup_date == today, 1), else_=0)).label("pickups_today"),
+        func.sum(case((Order.delivery_date == today, 1), else_=0)).label("deliveries_today"),
+        func.sum(case((pickup_overdue, 1), else_=0)).label("pickups_overdue"),
+        func.sum(case((delivery_overdue, 1), else_=0)).label("deliveries_overdue"),
+    ).group_by(Order.status).all()
+    
+    status_counts = {status: 0 for status in ORDER_STATUSES}
+    totals = {"pickups_today": 0, "deliveries_today": 0, "pickups_overdue": 0, "deliveries_overdue": 0}
+    for row in facets:
+        status_counts[row.status] = row.orders
+        for key in totals:
+            totals[key] += row._mapping[key] or 0
+    
+    # First orders of every status column: newest first, numbered per status
+    columns = {status: [] for status in ORDER_STATUSES}
+    if per_status:
+        position = func.row_number().over(
+            partition_by=Order.status,
+            order_by=(desc(Order.created_at), desc(Order.id)),
+        ).label("position")
+        ranked = select(
+            Order.id,
+            Order.order_number,
+            Order.status,
+            Order.pickup_date,
+            Order.pickup_time,
+            Order.delivery_date,
+            Order.estimated_weight,
+            Order.actual_weight,
+            Order.total_price,
+            Order.final_price,
+            Order.created_at,
+            Customer.name.label("customer_name"),
+            Customer.phone.label("customer_phone"),
+            Service.name.label("service_name"),
+            position,
+        ).join(Customer, Order.customer_id == Customer.id).join(Service, Order.service_id == Service.id).subquery()
+        rows = db.execute(
+            select(ranked).where(ranked.c.position <= per_status).order_by(ranked.c.status, ranked.c.position)
+        ).all()
+        for row in rows:
+            columns.setdefault(row.status, []).append({
+                "id": row.id,
+                "order_number": row.order_number,
+                "customer_name": row.customer_name,
+                "customer_phone": row.customer_phone,
+                "service_name": row.service_name,
+                "pickup_date": row.pickup_date,
+                "pickup_time": row.pickup_time,
+                "delivery_date": row.delivery_date,
+                "estimated_weight": row.estimated_weight,
+                "actual_weight": row.actual_weight,
+                "price": row.final_price if row.final_price is not None else row.total_price,
+                "created_at": row.created_at,
+            })
+    
+    dashboard = {
+        "date": today,
+        "status_counts": status_counts,
+        "open_orders": sum(status_counts[status] for status in OPEN_ORDER_STATUSES),
+        "today": {
+            "pickups": totals["pickups_today"],
+            "deliveries": totals["deliveries_today"],
+        },
+        "overdue": {
+            "pickups": totals["pickups_overdue"],
+            "deliveries": totals["deliveries_overdue"],
+        },
+        "columns": columns,
+    }
+    
+    # Admin dashboard: user counts by role and status from the maintained counters
+    if current_user.role == "admin":
+        users = {"total": 0, "by_role": {"customer": 0, "staff": 0, "admin": 0}, "active": 0, "inactive": 0}
+        for role, is_active, count in db.query(UserCount.role, UserCount.is_active, UserCount.count):
+            users["total"] += count
+            users["by_role"][role] = users["by_role"].get(role, 0) + count
+            users["active" if is_active else "inactive"] += count
+        dashboard["users"] = users
+    
+    return dashboard
+
+@router.get("/forecast")
+def get_forecast_report(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_staff_or_admin),
+    days: int = Query(settings.FORECAST_HORIZON_DAYS, ge=1, le=settings.FORECAST_HORIZON_DAYS),
+    location_id: Optional[int] = Query(None),
+    service_id: Optional[int] = Query(None),
+) -> Any:
+    """
+    Forecast orders and kilograms per day for the coming days, per branch and service and per branch
+    """
+    try:
+        return order_forecast(db, days, location_id=location_id, service_id=service_id)
+    except ForecastUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
@@ -3,17 +3,18 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
+from app.core.tracing import TracedRoute
 from app.models.user import User
 from app.models.service import Service
 from app.schemas.service import Service as ServiceSchema, ServiceCreate, ServiceUpdate
 from app.api.v1.dependencies.auth import get_current_active_user, get_current_admin
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 @router.get("/", response_model=List[ServiceSchema])
 def read_services(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     service_type: Optional[str] = Query(None),
@@ -43,7 +44,7 @@ def read_services(
 @router.get("/{service_id}", response_model=ServiceSchema)
 def read_service(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     service_id: int,
 ) -> Any:
     """
@@ -145,8 +146,9 @@ def delete_service(
         raise HTTPException(status_code=404, detail="Service not found")
     
     # Check if service has associated orders
-    from app.models.order import Order
-    orders_count = db.query(Order).filter(Order.service_id == service_id).count()
+    from app.services.archive import orders_with_archive
+    orders = orders_with_archive()
+    orders_count = db.query(orders).filter(orders.service_id == service_id).count()
     if orders_count > 0:
         # Don't delete, just deactivate
         service.is_active = False
@@ -3,18 +3,19 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.security import generate_salt, hash_password_with_salt
+from app.core.tracing import TracedRoute
 from app.models.user import User
 from app.models.customer import Customer
 from app.schemas.user import User as UserSchema, UserCreate, UserUpdate
 from ..dependencies.auth import get_current_admin
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 @router.get("/", response_model=List[UserSchema])
 def read_users(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_admin),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
@@ -51,7 +52,7 @@ def read_users(
 @router.get("/{user_id}", response_model=UserSchema)
 def read_user(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user_id: int,
     current_user: User = Depends(get_current_admin),
 ) -> Any:
@@ -183,8 +184,9 @@ def delete_user(
     if user.role == "customer":
         customer = db.query(Customer).filter(Customer.user_id == user_id).first()
         if customer:
-            from app.models.order import Order
-            orders_count = db.query(Order).filter(Order.customer_id == customer.id).count()
+            from app.services.archive import orders_with_archive
+            orders = orders_with_archive()
+            orders_count = db.query(orders).filter(orders.customer_id == customer.id).count()
             if orders_count > 0:
                 # Don't delete, just deactivate
                 user.is_active = False
@@ -199,41 +201,13 @@ def delete_user(
 
 @router.get("/stats/overview")
 def get_user_stats(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_admin),
 ) -> Any:
     """
     Get user statistics overview (admin only)
     """
-    from sqlalchemy import func
-    from datetime import datetime, timedelta
-    
-    # Total users by role
-    total_users = db.query(func.count(User.id)).scalar()
-    customers = db.query(func.count(User.id)).filter(User.role == "customer").scalar()
-    staff = db.query(func.count(User.id)).filter(User.role == "staff").scalar()
-    admins = db.query(func.count(User.id)).filter(User.role == "admin").scalar()
-    
-    # Active/Inactive users
-    active_users = db.query(func.count(User.id)).filter(User.is_active == True).scalar()
-    inactive_users = db.query(func.count(User.id)).filter(User.is_active == False).scalar()
-    
-    # Recent registrations (last 30 days)
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    recent_registrations = db.query(func.count(User.id)).filter(
-        User.created_at >= thirty_days_ago
-    ).scalar()
-    
-    return {
-        "total_users": total_users,
-        "users_by_role": {
-            "customers": customers,
-            "staff": staff,
-            "admins": admins
-        },
-        "users_by_status": {
-            "active": active_users,
-            "inactive": inactive_users
-        },
-        "recent_registrations": recent_registrations
-    }
\ No newline at end of file
+    from app.services.user_stats import user_stats
+    
+    # Maintained counters: a few rows to read however many users there are
+    return user_stats(db)
\ No newline at end of file
@@ -0,0 +1,224 @@
+import gzip
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+
+def available_encodings() -> List[str]:
+    """Content codings this process can produce, in no particular order"""
+    encodings = ["gzip"]
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        coding, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate_encoding(header: str, preferred: Iterable[str]) -> Optional[str]:
+    """Pick the first server-preferred coding the client accepts with q > 0"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    for coding in preferred:
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+class _Compressor:
+    """One-shot and streaming compression for a single content coding"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int, zstd_level: int):
+        self.encoding = encoding
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+        self._stream = None
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return brotli.compress(data, quality=self.brotli_quality)
+        if self.encoding == "zstd":
+            return zstandard.ZstdCompressor(level=self.zstd_level).compress(data)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def stream_chunk(self, data: bytes) -> bytes:
+        if self._stream is None:
+            if self.encoding == "br":
+                self._stream = brotli.Compressor(quality=self.brotli_quality)
+            elif self.encoding == "zstd":
+                self._stream = zstandard.ZstdCompressor(level=self.zstd_level).compressobj()
+            else:
+                self._stream = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        if self.encoding == "br":
+            return self._stream.process(data)
+        return self._stream.compress(data)
+
+    def stream_finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._stream.finish()
+        return self._stream.flush()
+
+
+class CompressionMiddleware:
+    """
+    Compress HTTP response bodies with gzip, Brotli or zstd.
+
+    Only responses whose content type is in the allowlist and whose body is at
+    least ``minimum_size`` bytes are compressed. Single-message bodies larger
+    than ``threadpool_min_size`` are compressed in a worker thread so large
+    order lists do not stall the event loop. A strong ``ETag`` on an encoded
+    response is made weak, as the representation is no longer byte-identical.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        content_types: Iterable[str] = ("application/json",),
+        encodings: Iterable[str] = ("br", "zstd", "gzip"),
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+        threadpool_min_size: int = 64 * 1024,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = tuple(ct.lower() for ct in content_types)
+        supported = available_encodings()
+        self.encodings = [enc for enc in encodings if enc in supported]
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+        self.threadpool_min_size = threadpool_min_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), self.encodings
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def is_compressible(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";", 1)[0].strip().lower()
+        return any(content_type.startswith(allowed) for allowed in self.content_types)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send) -> None:
+        self.middleware = middleware
+        self.downstream = send
+        self.compressor = _Compressor(
+            encoding,
+            middleware.gzip_level,
+            middleware.brotli_quality,
+            middleware.zstd_level,
+        )
+        self.start_message: Optional[Message] = None
+        self.started = False
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = not self.middleware.is_compressible(headers)
+            return
+
+        if message_type != "http.response.body":
+            await self.downstream(message)
+            return
+
+        if self.passthrough:
+            await self._send_start()
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started and not more_body:
+            # Whole body in one message: the common case for JSON responses
+            if len(body) < self.middleware.minimum_size:
+                await self._send_start()
+                await self.downstream(message)
+                return
+            if len(body) >= self.middleware.threadpool_min_size:
+                compressed = await anyio.to_thread.run_sync(self.compressor.compress, body)
+            else:
+                compressed = self.compressor.compress(body)
+            await self._send_start(encoded=True, content_length=len(compressed))
+            await self.downstream({"type": "http.response.body", "body": compressed})
+            return
+
+        # Streaming body: compress chunk by chunk
+        if not self.started:
+            await self._send_start(encoded=True)
+        chunk = self.compressor.stream_chunk(body)
+        if not more_body:
+            chunk += self.compressor.stream_finish()
+        await self.downstream({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _send_start(self, encoded: bool = False, content_length: Optional[int] = None) -> None:
+        """Send the buffered start message, rewriting headers if the body is encoded"""
+        if self.started:
+            return
+        self.started = True
+        message = self.start_message
+        if encoded:
+            headers = MutableHeaders(raw=message["headers"])
+            headers["Content-Encoding"] = self.compressor.encoding
+            headers.add_vary_header("Accept-Encoding")
+            # The encoded bytes differ from the identity ones: a strong validator no longer fits
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            if content_length is None:
+                if "content-length" in headers:
+                    del headers["content-length"]
+            else:
+                headers["Content-Length"] = str(content_length)
+        await self.downstream(message)
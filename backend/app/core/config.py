@@ -38,24 +38,59 @@ class Settings(BaseSettings):
     # For SQLite (development)
     SQLITE_URL: str = "sqlite:///./laundryconnect.db"
     
+    # Connection pool per worker process (PostgreSQL; SQLite shares one connection)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds
+    DB_POOL_PRE_PING: bool = True
+    
+    # Read replicas for read-only endpoints (same URL forms as DATABASE_URL)
+    DATABASE_REPLICA_URLS: List[str] = []
+    REPLICA_READ_YOUR_WRITES_SECONDS: float = 10  # a user's reads stay on the primary this long after a write
+    REPLICA_RETRY_SECONDS: float = 30  # skip a replica this long after it fails to connect
+    
     # Security Configuration
     SECRET_KEY: str = config("SECRET_KEY", default="your-super-secret-key-change-in-production")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30 * 24 * 8  # 8 days
     
+    # Password hashing policy (calibrate with python -m perf.hashing); hashes
+    # that do not match it are replaced at the user's next successful login
+    PASSWORD_SCHEME: str = "bcrypt"  # bcrypt, or argon2 (needs the argon2-cffi package)
+    BCRYPT_ROUNDS: int = 12  # log2 of the work factor; each step doubles the cost
+    ARGON2_TIME_COST: int = 3  # passes over memory
+    ARGON2_MEMORY_COST: int = 65536  # KiB per hash
+    ARGON2_PARALLELISM: int = 1  # lanes; hashing runs in one request thread either way
+    
+    # Stateless access tokens (POST /auth/refresh)
+    STATELESS_AUTH: bool = False  # tokens carry user id, role and active flag, so requests skip the user query
+    STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES: int = 15  # replaces ACCESS_TOKEN_EXPIRE_MINUTES when STATELESS_AUTH is on
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 14
+    TOKEN_REVOCATION_POLL_SECONDS: float = 1.0  # how soon other workers reject tokens of deactivated users
+    
     # Admin User Configuration
     FIRST_SUPERUSER_EMAIL: EmailStr = config("FIRST_SUPERUSER_EMAIL", default="admin@laundryconnect.co.ke")
     FIRST_SUPERUSER_USERNAME: str = config("FIRST_SUPERUSER_USERNAME", default="admin")
     FIRST_SUPERUSER_PASSWORD: str = config("FIRST_SUPERUSER_PASSWORD", default="admin123")
     
-    # Email Configuration (for future use)
-    SMTP_TLS: bool = True
-    SMTP_PORT: Optional[int] = None
+    # Email Configuration (order status notifications, sent by a background outbox consumer)
+    EMAILS_ENABLED: bool = False  # also needs SMTP_HOST and EMAILS_FROM_EMAIL
+    SMTP_TLS: bool = True  # STARTTLS
+    SMTP_PORT: Optional[int] = None  # 587 with SMTP_TLS, otherwise 25
     SMTP_HOST: Optional[str] = None
     SMTP_USER: Optional[str] = None
     SMTP_PASSWORD: Optional[str] = None
+    SMTP_TIMEOUT: float = 10  # seconds per SMTP command
+    SMTP_IDLE_SECONDS: float = 60  # reconnect rather than reuse a connection idle this long
     EMAILS_FROM_EMAIL: Optional[EmailStr] = None
     EMAILS_FROM_NAME: Optional[str] = None
+    EMAIL_NOTIFY_STATUSES: List[str] = [
+        "placed", "confirmed", "collected", "ready", "out_for_delivery", "delivered", "cancelled"
+    ]
+    EMAIL_DEBOUNCE_SECONDS: float = 60  # status changes are held this long, so quick flips send one email
+    EMAIL_BATCH_SIZE: int = 50  # events per batch; keep a batch's sending time within OUTBOX_LEASE_SECONDS
+    EMAIL_RATE_LIMIT_PER_MINUTE: int = 300  # emails sent by all workers together
     
     # Business Configuration
     DEFAULT_SERVICE_MULTIPLIERS: Dict[str, float] = {
@@ -68,6 +103,134 @@ class Settings(BaseSettings):
     DEFAULT_PAGE_SIZE: int = 20
     MAX_PAGE_SIZE: int = 100
     
+    # Response Compression (br/zstd are used only if brotli/zstandard are installed)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes
+    COMPRESSION_CONTENT_TYPES: List[str] = [
+        "application/json",
+        "text/plain",
+        "text/html",
+        "text/csv",
+    ]
+    COMPRESSION_ENCODINGS: List[str] = ["br", "zstd", "gzip"]  # server preference order
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_THREADPOOL_MIN_SIZE: int = 64 * 1024  # compress larger bodies off the event loop
+    
+    # Metrics (Prometheus text format at /metrics)
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: Optional[str] = None  # require "Authorization: Bearer <token>" on /metrics; unset: keep /metrics off public networks
+    
+    # SQL budgets and slow-query log
+    SQL_BUDGET_ENABLED: bool = True
+    SQL_QUERY_BUDGET: int = 25  # statements per request
+    SQL_ROUTE_BUDGETS: Dict[str, int] = {}  # per route template, e.g. {"/api/v1/customers/": 3}
+    SQL_REQUEST_TIME_BUDGET_MS: float = 250
+    SLOW_REQUEST_MS: float = 1000
+    SQL_SLOW_QUERY_MS: float = 100
+    SQL_EXPLAIN_SLOW_QUERIES: bool = True
+    SQL_BUDGET_RAISE: bool = False  # test mode: fail requests that exceed their statement budget
+    SQL_RAISE_ON_LAZY_LOAD: bool = False  # test mode: apply raiseload("*") to every ORM query
+    
+    # Request tracing (X-Trace-Id header, OTLP/JSON export)
+    TRACING_ENABLED: bool = True
+    TRACING_SAMPLE_RATE: float = 0.01
+    TRACING_SLOW_REQUEST_MS: float = 1000  # always export slower requests; 0 disables
+    TRACING_SLOW_ROUTE_SECONDS: float = 300  # after an unrecorded slow request, record its route this long
+    TRACING_EXPORT_PATH: Optional[str] = None  # e.g. ./traces.jsonl
+    TRACING_OTLP_ENDPOINT: Optional[str] = None  # e.g. http://localhost:4318/v1/traces
+    TRACING_SERVICE_NAME: str = "laundryconnect-api"
+    TRACING_MAX_SPANS: int = 1000  # per trace
+    TRACING_QUEUE_SIZE: int = 1000  # traces waiting for export
+    
+    # Rate limiting: per route group, "ip" and "username" limits such as "5/minute"
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # memory (per worker process) or database (shared by all workers)
+    RATE_LIMITS: Dict[str, Dict[str, str]] = {
+        "login": {"ip": "20/minute", "username": "5/minute"},
+        "register": {"ip": "10/hour"},
+        "create_order": {"ip": "30/minute", "username": "10/minute"},
+    }
+    
+    # Idempotency-Key support on order writes
+    IDEMPOTENCY_ENABLED: bool = True
+    IDEMPOTENCY_TTL_HOURS: int = 24  # how long a key and its stored response are kept
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 30  # seconds a duplicate waits for the first request to finish
+    IDEMPOTENCY_LOCK_TIMEOUT: float = 120  # seconds before an unfinished request is considered abandoned
+    
+    # Transactional outbox (background delivery of order events to in-process consumers)
+    OUTBOX_ENABLED: bool = True  # run the dispatcher thread in each worker
+    OUTBOX_POLL_INTERVAL: float = 1.0  # seconds; commits in the same worker wake it immediately
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_LEASE_SECONDS: float = 30  # a consumer moves to another worker if its holder stops renewing
+    OUTBOX_MAX_ATTEMPTS: int = 10  # then the event is logged and skipped
+    OUTBOX_RETRY_BASE_SECONDS: float = 1  # doubled after every failed attempt
+    OUTBOX_RETRY_MAX_SECONDS: float = 300
+    OUTBOX_RETENTION_HOURS: int = 72  # delivered events are kept this long
+    
+    # Archival of finished orders to the *_archive tables
+    ARCHIVE_ENABLED: bool = False  # run the job in each worker; also available as python -m app.services.archive
+    ARCHIVE_AFTER_MONTHS: int = 12  # delivered/cancelled orders untouched this long are archived
+    ARCHIVE_INTERVAL_HOURS: float = 24
+    ARCHIVE_BATCH_SIZE: int = 500  # orders moved per transaction
+    ARCHIVE_BATCH_PAUSE_SECONDS: float = 0.1  # between batches, so request writes are not starved
+    
+    # Bulk import (POST /import/customers, /import/orders)
+    IMPORT_CHUNK_SIZE: int = 1000  # rows validated and written per transaction
+    IMPORT_MAX_ERRORS: int = 1000  # failed rows listed in the report; the rest are only counted
+    
+    # Database backups (python -m app.services.backup, POST /backups)
+    BACKUP_ENABLED: bool = False  # take scheduled snapshots; with several workers only one runs at a time
+    BACKUP_DIR: str = "./backups"
+    BACKUP_INTERVAL_HOURS: float = 24
+    BACKUP_KEEP: int = 7  # newest good snapshots kept; older and unusable ones are deleted after each backup
+    BACKUP_PAGES_PER_STEP: int = 256  # SQLite pages copied per step of the online backup
+    BACKUP_STEP_PAUSE_SECONDS: float = 0.005  # between steps, so request writes are not starved
+    BACKUP_VERIFY: bool = True  # restore each new snapshot to a scratch file and check it
+    PG_DUMP_PATH: str = "pg_dump"
+    PG_RESTORE_PATH: str = "pg_restore"
+    
+    # User statistics (GET /users/stats/overview reads maintained counters)
+    USER_STATS_RECONCILE_HOURS: float = 6  # recount from the users table to correct drift; 0 only at startup
+    
+    # Pickup slot capacity (GET /pickup-slots/availability); new orders book a place in their window
+    PICKUP_SLOTS_ENABLED: bool = True
+    PICKUP_SLOT_WINDOWS: List[str] = ["morning", "afternoon", "evening"]  # accepted pickup_time values
+    PICKUP_SLOT_CAPACITY: int = 20  # pickups per branch and window, unless set for the slot (PUT /pickup-slots/capacity)
+    PICKUP_SLOT_DAYS_AHEAD: int = 14  # furthest pickup date that can be booked
+    PICKUP_AVAILABILITY_CACHE_SECONDS: float = 2  # other workers' bookings show in availability within this
+    
+    # Order volume forecasts (GET /reports/forecast; needs numpy)
+    FORECAST_HORIZON_DAYS: int = 14  # default and furthest day forecast
+    FORECAST_REFIT_DAYS: int = 7  # refit from the full history this often; other days only add the new day
+    
+    # Incremental order sync (GET /orders/sync)
+    SYNC_OVERLAP_SECONDS: float = 10  # each sync re-reads this much of the past, for transactions that commit late
+    
+    # Live order events (Server-Sent Events)
+    EVENTS_BACKEND: str = "database"  # database (workers poll order_events) or memory (this process only)
+    EVENTS_POLL_INTERVAL: float = 1.0  # seconds between polls for other workers' events
+    EVENTS_HEARTBEAT_SECONDS: float = 15  # comment line sent on idle streams to keep proxies from closing them
+    EVENTS_RETENTION_HOURS: int = 24  # how far back a client can resume with Last-Event-ID
+    EVENTS_REPLAY_LIMIT: int = 1000  # further behind than this, the client is told to reload
+    EVENTS_QUEUE_SIZE: int = 1000  # undelivered events per stream before it is closed
+    
+    # Production server (serve.py)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    WEB_CONCURRENCY: Optional[int] = None  # worker processes; derived from available CPUs if unset
+    SERVER_PRELOAD: bool = True  # import the app before forking so workers share memory copy-on-write
+    SERVER_MAX_REQUESTS: Optional[int] = 10000  # recycle a worker after this many requests
+    SERVER_MAX_REQUESTS_JITTER: int = 1000  # spread recycling so workers do not restart together
+    SERVER_MAX_MEMORY_MB: Optional[int] = None  # recycle a worker whose private memory exceeds this
+    SERVER_GRACEFUL_TIMEOUT: int = 30  # seconds to drain in-flight requests before cancelling them
+    SERVER_KEEPALIVE: int = 5
+    SERVER_BACKLOG: int = 2048
+    SERVER_LOOP: str = "auto"  # auto uses uvloop when installed
+    SERVER_HTTP: str = "auto"  # auto uses httptools when installed
+    THREADPOOL_SIZE: Optional[int] = None  # threads for sync endpoints per worker (anyio default 40)
+    
     class Config:
         case_sensitive = True
         env_file = ".env"
@@ -1,14 +1,30 @@
+from fastapi import Request
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from app.core.config import settings
+from app.core.events import install_order_events
+from app.core.metrics import instrument_engine
+from app.core.outbox import install_outbox
+from app.core.query_budget import install_query_budget
+from app.core.replicas import ReplicaRouter, install_write_tracking
+from app.core.revocation import install_token_revocations
+from app.core.tracing import instrument_engine_tracing, instrument_session_tracing
 
 # Database setup
 if settings.DATABASE_URL and settings.DATABASE_URL.startswith("postgresql"):
     # PostgreSQL
-    engine = create_engine(settings.DATABASE_URL)
+    engine = create_engine(
+        settings.DATABASE_URL,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
 elif settings.DATABASE_URL and settings.DATABASE_URL.startswith("sqlite"):
     # SQLite
     engine = create_engine(
@@ -24,15 +40,96 @@ else:
         poolclass=StaticPool,
     )
 
+# Background threads (outbox dispatcher, order event polling) run alongside
+# requests. On SQLite the request engine shares one connection, so they get
+# their own connections to the same file; on PostgreSQL they share the pool.
+if engine.dialect.name == "sqlite":
+    background_engine = create_engine(
+        engine.url,
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+else:
+    background_engine = engine
+
+def create_replica_engine(url: str):
+    """Engine for a read replica; SQLite replicas are opened read-only"""
+    if url.startswith("postgresql"):
+        return create_engine(
+            url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    # mode=ro also makes connecting fail if the file is missing, instead of creating it
+    sqlite_url = make_url(url)
+    sqlite_url = sqlite_url.set(
+        database=f"file:{sqlite_url.database}",
+        query={"mode": "ro", "uri": "true"},
+    )
+    return create_engine(
+        sqlite_url,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+replica_engines = [create_replica_engine(url) for url in settings.DATABASE_REPLICA_URLS]
+
+if background_engine is not engine and settings.METRICS_ENABLED:
+    instrument_engine(background_engine, "background")
+
+for name, instrumented in [("primary", engine)] + [(f"replica{i}", e) for i, e in enumerate(replica_engines)]:
+    if settings.METRICS_ENABLED:
+        instrument_engine(instrumented, name)
+    if settings.TRACING_ENABLED:
+        instrument_engine_tracing(instrumented)
+    if settings.SQL_BUDGET_ENABLED:
+        install_query_budget(instrumented)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if settings.SQL_BUDGET_ENABLED:
+    install_query_budget(session_factory=SessionLocal)
+if settings.TRACING_ENABLED:
+    instrument_session_tracing(SessionLocal)
+
+install_order_events(SessionLocal)
+install_outbox(SessionLocal)
+install_token_revocations(SessionLocal)
+
+replica_router = ReplicaRouter(engine, replica_engines)
+if replica_engines:
+    install_write_tracking(SessionLocal)
+
 # Base class for models
 Base = declarative_base()
 
+def dialect_insert(table):
+    """INSERT that supports ``on_conflict_do_*`` on the configured database (PostgreSQL or SQLite)"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
 # Dependency to get database session
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency for read-only endpoints: a replica session when one is usable
+def get_read_db(request: Request):
+    connection = replica_router.connect_for_read(request)
+    if connection is None:
+        yield from get_db()
+        return
+    db = SessionLocal(bind=connection)
+    try:
+        yield db
+    finally:
+        db.close()
+        connection.close()
\ No newline at end of file
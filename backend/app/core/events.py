@@ -0,0 +1,294 @@
+"""
+Live order events for Server-Sent Events streams.
+
+Order writes call ``record_order_event`` before committing, which adds a row
+to ``order_events`` in the same transaction. When the transaction commits
+the event is published to the streams open in this process. With the
+``database`` backend each worker also polls the table (one query per
+``EVENTS_POLL_INTERVAL``, however many streams are open), so streams served
+by other workers or hosts receive it too. Rows are kept for
+``EVENTS_RETENTION_HOURS`` so a reconnecting client can resume from its
+``Last-Event-ID``. Delivery is at least once; every event carries the
+order's current status, so applying one twice is harmless.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import anyio.to_thread
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Fraction of recorded events that also delete expired ones
+CLEANUP_PROBABILITY = 0.01
+# Rows fetched per poll; a full batch is followed by another poll straight away
+POLL_BATCH_SIZE = 500
+# How long a missing id is waited for (see IdSequence)
+GAP_TIMEOUT = 10.0
+# Larger jumps in ids are not tracked as gaps
+MAX_GAP = 1000
+# Reconnection delay suggested to EventSource clients
+RETRY_MS = 3000
+
+
+class IdSequence:
+    """
+    Position reached while reading a table in autoincrement id order.
+
+    Ids are allocated before commit, so a slower transaction can commit a
+    lower id after a higher one was read. Skipped ids are remembered as gaps
+    and read again for ``GAP_TIMEOUT`` seconds before being given up on.
+    """
+
+    def __init__(self, last_id: int = 0) -> None:
+        self.last_id = last_id
+        self._gaps: Dict[int, float] = {}  # missing id -> time to give up on it
+
+    def read_after(self) -> int:
+        """Every id up to this one has been read (or given up on); read rows above it"""
+        now = time.monotonic()
+        for missing in [i for i, deadline in self._gaps.items() if deadline < now]:
+            del self._gaps[missing]  # rolled back, or never coming
+        return min(min(self._gaps) - 1, self.last_id) if self._gaps else self.last_id
+
+    def is_new(self, id: int) -> bool:
+        """Record ``id`` as read; False if it already was"""
+        if id > self.last_id:
+            if id - self.last_id <= MAX_GAP:
+                deadline = time.monotonic() + GAP_TIMEOUT
+                for missing in range(self.last_id + 1, id):
+                    self._gaps[missing] = deadline
+            self.last_id = id
+            return True
+        return self._gaps.pop(id, None) is not None
+
+
+class OrderEventMessage:
+    __slots__ = ("id", "order_id", "event", "data")
+
+    def __init__(self, id: int, order_id: int, event: str, data: str) -> None:
+        self.id = id
+        self.order_id = order_id
+        self.event = event
+        self.data = data
+
+    def encode(self) -> bytes:
+        return f"id: {self.id}\nevent: {self.event}\ndata: {self.data}\n\n".encode()
+
+
+def order_snapshot(order, previous_status: Optional[str] = None, at: Optional[float] = None) -> dict:
+    """Compact JSON-serialisable view of an order for events"""
+    return {
+        "order_id": order.id,
+        "order_number": order.order_number,
+        "customer_id": order.customer_id,
+        "status": order.status,
+        "previous_status": previous_status,
+        "estimated_weight": order.estimated_weight,
+        "actual_weight": order.actual_weight,
+        "total_price": order.total_price,
+        "final_price": order.final_price,
+        "at": datetime.fromtimestamp(time.time() if at is None else at, timezone.utc).isoformat(),
+    }
+
+
+def record_order_event(db: Session, order, event_type: str, previous_status: Optional[str] = None) -> None:
+    """
+    Add an event for ``order`` to the current transaction.
+
+    It is published to open streams once ``db`` commits, and dropped if the
+    transaction rolls back.
+    """
+    from app.models.order import OrderEvent
+
+    now = time.time()
+    data = order_snapshot(order, previous_status, now)
+    row = OrderEvent(order_id=order.id, event=event_type, data=json.dumps(data, separators=(",", ":")), created_at=now)
+    db.add(row)
+    if random.random() < CLEANUP_PROBABILITY:
+        db.query(OrderEvent).filter(
+            OrderEvent.created_at < now - settings.EVENTS_RETENTION_HOURS * 3600
+        ).delete(synchronize_session=False)
+    db.flush()  # assigns the id the stream uses as its event id
+    db.info.setdefault("order_events", []).append(OrderEventMessage(row.id, row.order_id, row.event, row.data))
+
+
+def install_order_events(session_factory: sessionmaker) -> None:
+    """Publish events recorded in a session when it commits"""
+
+    @event.listens_for(session_factory, "after_commit")
+    def _after_commit(session):
+        messages = session.info.pop("order_events", None)
+        if messages:
+            order_events.publish(messages)
+
+    @event.listens_for(session_factory, "after_soft_rollback")
+    def _after_rollback(session, previous_transaction):
+        session.info.pop("order_events", None)
+
+
+def fetch_order_events(after_id: int, order_id: Optional[int] = None, limit: int = POLL_BATCH_SIZE) -> List[OrderEventMessage]:
+    from app.core.database import background_engine
+    from app.models.order import OrderEvent
+
+    query = select(OrderEvent.id, OrderEvent.order_id, OrderEvent.event, OrderEvent.data).where(OrderEvent.id > after_id)
+    if order_id is not None:
+        query = query.where(OrderEvent.order_id == order_id)
+    with background_engine.connect() as conn:
+        rows = conn.execute(query.order_by(OrderEvent.id).limit(limit)).all()
+    return [OrderEventMessage(*row) for row in rows]
+
+
+def _latest_event_id() -> int:
+    from app.core.database import background_engine
+    from app.models.order import OrderEvent
+
+    with background_engine.connect() as conn:
+        return conn.execute(select(func.max(OrderEvent.id))).scalar() or 0
+
+
+class Subscription:
+    """Events for one stream; ``order_id`` None receives every order's events"""
+
+    def __init__(self, order_id: Optional[int]) -> None:
+        self.order_id = order_id
+        # Unbounded so publishing never blocks; a stream that falls too far
+        # behind is ended instead and resumes from the table on reconnect
+        self.queue: "asyncio.Queue[Optional[OrderEventMessage]]" = asyncio.Queue()
+        self.closed = False
+
+    def deliver(self, message: OrderEventMessage) -> None:
+        if self.closed or (self.order_id is not None and message.order_id != self.order_id):
+            return
+        if self.queue.qsize() >= settings.EVENTS_QUEUE_SIZE:
+            self.closed = True
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(message)
+
+
+class OrderEventBroker:
+    """Fans out committed order events to the streams open in this process"""
+
+    def __init__(self, poll: bool) -> None:
+        self.poll = poll
+        self._subscriptions: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._starting: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._sequence = IdSequence()
+
+    async def subscribe(self, order_id: Optional[int] = None) -> Subscription:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First stream in this process (or after a fork)
+            self._loop = loop
+            self._poller = None
+            self._starting = asyncio.Lock()
+            self._wake = asyncio.Event()
+        subscription = Subscription(order_id)
+        self._subscriptions.add(subscription)
+        if self.poll:
+            async with self._starting:
+                if self._poller is None:
+                    self._sequence = IdSequence(await anyio.to_thread.run_sync(_latest_event_id))
+                    # Run outside the request's context so its SQL is not charged to this stream
+                    self._poller = contextvars.Context().run(loop.create_task, self._poll_loop())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    def publish(self, messages: List[OrderEventMessage]) -> None:
+        """Called after commit, from any thread"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        if self.poll:
+            # The poller picks the rows up, in id order with everything else
+            loop.call_soon_threadsafe(self._wake.set)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, messages)
+
+    def _dispatch(self, messages: List[OrderEventMessage]) -> None:
+        for message in messages:
+            for subscription in list(self._subscriptions):
+                subscription.deliver(message)
+
+    async def _poll_loop(self) -> None:
+        try:
+            while self._subscriptions:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), settings.EVENTS_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                try:
+                    messages, more = await anyio.to_thread.run_sync(self._poll_once)
+                except SQLAlchemyError:
+                    logger.exception("Polling order events failed")
+                    continue
+                self._dispatch(messages)
+                if more:
+                    self._wake.set()
+        finally:
+            self._poller = None
+
+    def _poll_once(self) -> Tuple[List[OrderEventMessage], bool]:
+        rows = fetch_order_events(self._sequence.read_after())
+        messages = [message for message in rows if self._sequence.is_new(message.id)]
+        return messages, len(rows) == POLL_BATCH_SIZE
+
+
+def _create_broker() -> OrderEventBroker:
+    if settings.EVENTS_BACKEND not in ("database", "memory"):
+        raise ValueError(f"Unknown EVENTS_BACKEND {settings.EVENTS_BACKEND!r}")
+    return OrderEventBroker(poll=settings.EVENTS_BACKEND == "database")
+
+
+order_events = _create_broker()
+
+
+async def order_event_stream(order_id: Optional[int], last_event_id: Optional[int]) -> AsyncIterator[bytes]:
+    """
+    Body of an SSE response: missed events after ``last_event_id``, then live
+    events, with a comment line every ``EVENTS_HEARTBEAT_SECONDS``.
+    """
+    subscription = await order_events.subscribe(order_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
+        replayed: Set[int] = set()
+        if last_event_id is not None:
+            backlog = await anyio.to_thread.run_sync(
+                fetch_order_events, last_event_id, order_id, settings.EVENTS_REPLAY_LIMIT
+            )
+            if len(backlog) == settings.EVENTS_REPLAY_LIMIT:
+                # Too far behind to catch up event by event: the client should reload
+                yield b"event: reset\ndata: {}\n\n"
+            else:
+                for message in backlog:
+                    replayed.add(message.id)
+                    yield message.encode()
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), settings.EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": heartbeat\n\n"
+                continue
+            if message is None:
+                return  # fell behind; the client reconnects with Last-Event-ID
+            if message.id not in replayed:
+                yield message.encode()
+    finally:
+        order_events.unsubscribe(subscription)
@@ -0,0 +1,326 @@
+"""
+``Idempotency-Key`` support for write endpoints.
+
+Endpoints opt in with the ``@idempotent`` decorator. When such a request
+carries an ``Idempotency-Key`` header, the first request with that key (per
+user) claims a row in ``idempotency_keys`` and runs normally; its response is
+stored. Later requests with the same key get the stored response back
+(marked ``Idempotent-Replayed: true``) without running the handler. A
+duplicate that arrives while the first is still running waits for it
+(polling the table, so this also works across workers), and a key reused
+with a different request body is rejected with 422.
+
+Only deterministic outcomes are stored: successes and 400/404/422. After a
+5xx or an auth/rate-limit error, the key is released so the client can retry.
+Rows expire after ``IDEMPOTENCY_TTL_HOURS``.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import anyio.to_thread
+from sqlalchemy import delete, select, update
+from starlette.datastructures import Headers
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.security import verify_token
+
+logger = logging.getLogger(__name__)
+
+HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+REPLAYABLE_ERRORS = {400, 404, 422}
+# Fraction of claims that also delete expired keys
+CLEANUP_PROBABILITY = 0.01
+
+
+def idempotent(endpoint: Callable) -> Callable:
+    """Mark an endpoint as honouring the Idempotency-Key header"""
+    endpoint.idempotent = True
+    return endpoint
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status", "response_status", "response_headers", "response_body")
+
+    def __init__(self, row) -> None:
+        self.fingerprint = row.fingerprint
+        self.status = row.status
+        self.response_status = row.response_status
+        self.response_headers = row.response_headers
+        self.response_body = row.response_body
+
+
+class IdempotencyStore:
+    """Synchronous access to the ``idempotency_keys`` table (run it off the event loop)"""
+
+    def __init__(self, engine) -> None:
+        self.engine = engine
+
+    def claim(self, owner: str, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Try to become the request that executes ``key``.
+
+        Returns None if claimed, otherwise the existing record.
+        """
+        from app.core.database import dialect_insert
+        from app.models.idempotency import IdempotencyKey
+
+        now = time.time()
+        vanished = False
+        with self.engine.begin() as conn:
+            if random.random() < CLEANUP_PROBABILITY:
+                conn.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+            claimed = conn.execute(
+                dialect_insert(IdempotencyKey).values(
+                    owner=owner,
+                    key=key,
+                    fingerprint=fingerprint,
+                    status="in_progress",
+                    locked_at=now,
+                    expires_at=now + settings.IDEMPOTENCY_TTL_HOURS * 3600,
+                ).on_conflict_do_nothing().returning(IdempotencyKey.id)
+            ).scalar()
+            if claimed is not None:
+                return None
+
+            row = conn.execute(
+                select(IdempotencyKey).where(IdempotencyKey.owner == owner, IdempotencyKey.key == key)
+            ).first()
+            if row is None:
+                vanished = True  # released between our insert and select
+            else:
+                expired = row.expires_at < now
+                abandoned = row.status == "in_progress" and now - row.locked_at > settings.IDEMPOTENCY_LOCK_TIMEOUT
+                if expired or abandoned:
+                    # Take over the row; the condition on locked_at makes this race-free
+                    taken = conn.execute(
+                        update(IdempotencyKey)
+                        .where(IdempotencyKey.id == row.id, IdempotencyKey.locked_at == row.locked_at)
+                        .values(
+                            fingerprint=fingerprint,
+                            status="in_progress",
+                            response_status=None,
+                            response_headers=None,
+                            response_body=None,
+                            locked_at=now,
+                            expires_at=now + settings.IDEMPOTENCY_TTL_HOURS * 3600,
+                        )
+                    ).rowcount
+                    if taken:
+                        if abandoned and not expired:
+                            logger.warning("Taking over abandoned idempotent request %s for %s", key, owner)
+                        return None
+                return StoredResponse(row)
+        return self.claim(owner, key, fingerprint) if vanished else None
+
+    def get(self, owner: str, key: str) -> Optional[StoredResponse]:
+        from app.models.idempotency import IdempotencyKey
+
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(IdempotencyKey).where(IdempotencyKey.owner == owner, IdempotencyKey.key == key)
+            ).first()
+        return StoredResponse(row) if row is not None else None
+
+    def complete(self, owner: str, key: str, status: int, headers: List[List[str]], body: bytes) -> None:
+        from app.models.idempotency import IdempotencyKey
+
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.owner == owner, IdempotencyKey.key == key)
+                .values(
+                    status="completed",
+                    response_status=status,
+                    response_headers=json.dumps(headers),
+                    response_body=body,
+                )
+            )
+
+    def release(self, owner: str, key: str) -> None:
+        from app.models.idempotency import IdempotencyKey
+
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.owner == owner,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.status == "in_progress",
+                )
+            )
+
+
+def _is_idempotent_route(scope: Scope) -> bool:
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(getattr(route, "endpoint", None), "idempotent", False)
+    return False
+
+
+def _request_owner(headers: Headers) -> Optional[str]:
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return verify_token(token)
+
+
+async def _json_response(send: Send, status: int, detail: str, extra_headers: Tuple = ()) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *extra_headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """Replay stored responses for repeated Idempotency-Key requests to ``@idempotent`` endpoints"""
+
+    def __init__(self, app: ASGIApp, store: Optional[IdempotencyStore] = None) -> None:
+        self.app = app
+        if store is None:
+            # Own connections: on SQLite the request engine's single connection
+            # would commit other requests' open transactions along with the key
+            from app.core.database import background_engine
+
+            store = IdempotencyStore(background_engine)
+        self.store = store
+        # Requests executing in this worker, so local duplicates wake up immediately
+        self._running: Dict[Tuple[str, str], asyncio.Event] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH", "DELETE"):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get(HEADER)
+        if key is None or not _is_idempotent_route(scope):
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _json_response(send, 400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+            return
+        owner = _request_owner(headers)
+        if owner is None:
+            # Let the endpoint reject the request; nothing is stored for anonymous calls
+            await self.app(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        fingerprint = hashlib.sha256(
+            b"\n".join([scope["method"].encode(), scope["path"].encode(), scope["query_string"], body])
+        ).hexdigest()
+
+        while True:
+            existing = await anyio.to_thread.run_sync(self.store.claim, owner, key, fingerprint)
+            if existing is None:
+                break
+            if existing.fingerprint != fingerprint:
+                await _json_response(send, 422, "Idempotency-Key was already used for a different request")
+                return
+            if existing.status == "in_progress":
+                existing = await self._wait(owner, key)
+                if existing is None:
+                    continue  # the first request failed and released the key
+                if existing.status == "in_progress":
+                    await _json_response(
+                        send, 409, "A request with this Idempotency-Key is still being processed",
+                        ((b"retry-after", b"1"),),
+                    )
+                    return
+            await self._replay(existing, send)
+            return
+
+        await self._execute(scope, body, send, owner, key)
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    async def _wait(self, owner: str, key: str) -> Optional[StoredResponse]:
+        """Wait for another execution of ``key`` to finish; return its record (None if released)"""
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        delay = 0.05
+        record = None
+        while time.monotonic() < deadline:
+            event = self._running.get((owner, key))
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(delay)
+            record = await anyio.to_thread.run_sync(self.store.get, owner, key)
+            if record is None or record.status != "in_progress":
+                return record
+            delay = min(delay * 2, 0.5)
+        return record
+
+    async def _replay(self, record: StoredResponse, send: Send) -> None:
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(record.response_headers)]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": record.response_status, "headers": headers})
+        await send({"type": "http.response.body", "body": record.response_body or b""})
+
+    async def _execute(self, scope: Scope, body: bytes, send: Send, owner: str, key: str) -> None:
+        event = self._running[(owner, key)] = asyncio.Event()
+        status = 500
+        raw_headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+        body_sent = False
+
+        async def receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # Nothing more to read; wait like a real server until the client goes away
+            await asyncio.Event().wait()
+            return {"type": "http.disconnect"}  # pragma: no cover
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, raw_headers
+            if message["type"] == "http.response.start":
+                # Copy now: outer middleware (compression, tracing) edit the message in place
+                status = message["status"]
+                raw_headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        stored = False
+        try:
+            await self.app(scope, receive, send_wrapper)
+            if status < 400 or status in REPLAYABLE_ERRORS:
+                headers = [[name.decode("latin-1"), value.decode("latin-1")] for name, value in raw_headers]
+                await anyio.to_thread.run_sync(self.store.complete, owner, key, status, headers, b"".join(chunks))
+                stored = True
+        finally:
+            if not stored:
+                # Release even if the request was cancelled, so retries are not blocked
+                with anyio.CancelScope(shield=True):
+                    await anyio.to_thread.run_sync(self.store.release, owner, key)
+            del self._running[(owner, key)]
+            event.set()
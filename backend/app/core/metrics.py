@@ -0,0 +1,394 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters and histograms are sharded per thread: the request path only touches
+a thread-local dict, and shards are summed when ``/metrics`` is scraped. This
+keeps instrumentation lock-free on the threadpool that runs sync endpoints.
+Threadpool threads exit when idle and are replaced; the shard of a thread that
+has exited is folded into a base shard, so the number of shards follows the
+number of live threads. Each worker process exposes its own series.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _Sharded(_Metric):
+    """Metric whose state lives in per-thread shards merged at scrape time"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._local = threading.local()
+        self._shards: Dict[threading.Thread, dict] = {}
+        self._retired: dict = {}  # shards of exited threads, merged
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._shards_lock:
+                self._retire_exited()
+                self._shards[threading.current_thread()] = shard
+            self._local.shard = shard
+            return shard
+
+    def _retire_exited(self) -> None:
+        # Called with _shards_lock held; an exited thread no longer writes its shard
+        for thread in [thread for thread in self._shards if not thread.is_alive()]:
+            self._merge(self._retired, self._shards.pop(thread))
+
+    def _merge(self, target: dict, shard: dict) -> None:
+        raise NotImplementedError
+
+    def _snapshot(self) -> List[dict]:
+        with self._shards_lock:
+            self._retire_exited()
+            return [dict(self._retired)] + [dict(shard) for shard in self._shards.values()]
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0.0) + amount
+
+    def _merge(self, target: dict, shard: dict) -> None:
+        for key, value in shard.items():
+            target[key] = target.get(key, 0.0) + value
+
+    def values(self) -> Dict[LabelValues, float]:
+        totals: Dict[LabelValues, float] = {}
+        for shard in self._snapshot():
+            self._merge(totals, shard)
+        return totals
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self.values().items())
+        ]
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        shard = self._shard()
+        state = shard.get(labelvalues)
+        if state is None:
+            # [per-bucket counts..., +Inf count, sum]
+            state = shard[labelvalues] = [0.0] * (len(self.buckets) + 2)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def _merge(self, target: dict, shard: dict) -> None:
+        for key, state in shard.items():
+            total = target.setdefault(key, [0.0] * len(state))
+            for i, value in enumerate(state):
+                total[i] += value
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def samples(self) -> List[str]:
+        merged: Dict[LabelValues, List[float]] = {}
+        for shard in self._snapshot():
+            self._merge(merged, shard)
+
+        lines = []
+        bounds = list(self.buckets) + [float("inf")]
+        for key, state in sorted(merged.items()):
+            cumulative = 0.0
+            for bound, count in zip(bounds, state[:-1]):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge whose value(s) are read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._callbacks: List[Callable[[], Dict[LabelValues, float]]] = []
+        if callback is not None:
+            self._callbacks.append(callback)
+
+    def add_callback(self, callback: Callable[[], Dict[LabelValues, float]]) -> None:
+        self._callbacks.append(callback)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for callback in self._callbacks:
+            for key, value in sorted(callback().items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests_total = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+))
+http_request_duration_seconds = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+))
+http_request_sql_queries = REGISTRY.register(Histogram(
+    "http_request_sql_queries", "SQL statements executed per request", ["method", "route"],
+    buckets=SQL_COUNT_BUCKETS,
+))
+http_request_sql_seconds = REGISTRY.register(Histogram(
+    "http_request_sql_seconds", "Total SQL time per request", ["method", "route"]
+))
+db_queries_total = REGISTRY.register(Counter(
+    "db_queries_total", "SQL statements executed", ["engine"]
+))
+db_query_duration_seconds = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "SQL statement latency", ["engine"]
+))
+db_pool_connections = REGISTRY.register(Gauge(
+    "db_pool_connections", "Database pool connections by state", ["engine", "state"]
+))
+threadpool_threads = REGISTRY.register(Gauge(
+    "threadpool_threads", "Worker threads running sync endpoints and dependencies", ["state"]
+))
+password_hash_duration_seconds = REGISTRY.register(Histogram(
+    "password_hash_duration_seconds", "Password hashing latency", ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0),
+))
+password_rehashes_total = REGISTRY.register(Counter(
+    "password_rehashes_total", "Stored password hashes replaced at login to follow the hashing policy, by old scheme", ["scheme"]
+))
+cache_requests_total = REGISTRY.register(Counter(
+    "cache_requests_total", "Cache lookups by result", ["cache", "result"]
+))
+outbox_deliveries_total = REGISTRY.register(Counter(
+    "outbox_deliveries_total", "Outbox events handed to consumers, by result (ok, retry, dead)", ["consumer", "result"]
+))
+outbox_lag_events = REGISTRY.register(Gauge(
+    "outbox_lag_events", "Outbox events not yet delivered to a consumer (reported by the worker holding its lease)", ["consumer"]
+))
+outbox_lag_seconds = REGISTRY.register(Gauge(
+    "outbox_lag_seconds", "Age of the oldest outbox event not yet delivered to a consumer", ["consumer"]
+))
+emails_sent_total = REGISTRY.register(Counter(
+    "emails_sent_total", "Notification emails by template and result (sent, rejected, failed)", ["template", "result"]
+))
+smtp_connections_total = REGISTRY.register(Counter(
+    "smtp_connections_total", "SMTP connections opened for notification emails"
+))
+backups_total = REGISTRY.register(Counter(
+    "backups_total", "Database snapshots by result (ok, failed)", ["result"]
+))
+backup_last_success_timestamp = REGISTRY.register(Gauge(
+    "backup_last_success_timestamp", "Unix time of the newest verified snapshot taken by this process"
+))
+
+
+def _cache_hit_ratios() -> Dict[LabelValues, float]:
+    lookups: Dict[str, List[float]] = {}
+    for (cache, result), value in cache_requests_total.values().items():
+        hits_and_total = lookups.setdefault(cache, [0.0, 0.0])
+        if result == "hit":
+            hits_and_total[0] += value
+        hits_and_total[1] += value
+    return {(cache,): hits / total for cache, (hits, total) in lookups.items() if total}
+
+
+cache_hit_ratio = REGISTRY.register(Gauge(
+    "cache_hit_ratio", "Fraction of cache lookups that were hits", ["cache"], callback=_cache_hit_ratios
+))
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    cache_requests_total.inc(cache, "hit" if hit else "miss")
+
+
+def _threadpool_state() -> Dict[LabelValues, float]:
+    # Only meaningful from inside the event loop, which is where /metrics runs
+    import anyio.to_thread
+
+    try:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+    except RuntimeError:
+        return {}
+    stats = limiter.statistics()
+    return {
+        ("in_use",): stats.borrowed_tokens,
+        ("queued",): stats.tasks_waiting,
+        ("limit",): limiter.total_tokens,
+    }
+
+
+threadpool_threads.add_callback(_threadpool_state)
+
+
+class RequestStats:
+    """Per-request accumulators, shared with threadpool workers via a context variable"""
+
+    __slots__ = ("sql_count", "sql_seconds")
+
+    def __init__(self) -> None:
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+def instrument_engine(engine: Engine, name: str = "primary") -> None:
+    """Count SQL statements and time per engine and per request, and expose pool gauges"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        db_queries_total.inc(name)
+        db_query_duration_seconds.observe(elapsed, name)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += elapsed
+
+    def _pool_state() -> Dict[LabelValues, float]:
+        pool = engine.pool
+        state = {}
+        for label, attr in (("size", "size"), ("checked_in", "checkedin"),
+                            ("checked_out", "checkedout"), ("overflow", "overflow")):
+            method = getattr(pool, attr, None)
+            if method is not None:
+                state[(name, label)] = method()
+        return state
+
+    db_pool_connections.add_callback(_pool_state)
+
+
+class MetricsMiddleware:
+    """Record per-route request counts, latency and SQL usage"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request_stats.reset(token)
+            route = scope.get("route")
+            # Label by route template, not raw path, to keep cardinality bounded
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            http_requests_total.inc(method, route_path, str(status_code))
+            http_request_duration_seconds.observe(elapsed, method, route_path)
+            http_request_sql_queries.observe(stats.sql_count, method, route_path)
+            http_request_sql_seconds.observe(stats.sql_seconds, method, route_path)
@@ -0,0 +1,368 @@
+"""
+Transactional outbox for reacting to order changes.
+
+Write paths call ``publish_event(db, topic, payload)`` before committing, so
+the event row commits or rolls back together with the change. Consumers
+(notifications, rollups, search indexing, accounting exports) register a
+handler instead of adding work to the request::
+
+    @outbox_handler("search-index", topics={"order.created", "order.status_changed"})
+    def index_order(event: OutboxMessage) -> None:
+        ...
+
+Every worker runs an ``OutboxDispatcher`` thread. For each consumer, one
+worker at a time holds a lease on its ``outbox_consumers`` row and delivers
+events to it in id order, ``OUTBOX_BATCH_SIZE`` at a time.
+
+Delivery is at least once: the position is saved after each batch, and a
+crash or a lost lease repeats what followed it, so handlers must be
+idempotent. A handler that raises is retried with exponential backoff and
+holds back later events for that consumer only; after
+``OUTBOX_MAX_ATTEMPTS`` the event is logged and skipped. Consumers that
+work more efficiently in bulk (sending mail over one SMTP connection) can
+take a list of events per call with ``batch=True``. Lag per consumer is
+exported as ``outbox_lag_events`` and ``outbox_lag_seconds``.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.core.events import IdSequence
+from app.core.metrics import outbox_deliveries_total, outbox_lag_events, outbox_lag_seconds
+
+logger = logging.getLogger(__name__)
+
+# Seconds between deletions of delivered events older than OUTBOX_RETENTION_HOURS
+CLEANUP_INTERVAL = 300
+
+
+class OutboxMessage:
+    __slots__ = ("id", "topic", "aggregate_id", "payload", "created_at")
+
+    def __init__(self, id: int, topic: str, aggregate_id: Optional[int], payload: dict, created_at: float) -> None:
+        self.id = id
+        self.topic = topic
+        self.aggregate_id = aggregate_id
+        self.payload = payload
+        self.created_at = created_at
+
+    def __repr__(self) -> str:
+        return f"OutboxMessage({self.id}, {self.topic!r}, aggregate_id={self.aggregate_id})"
+
+
+class Consumer:
+    __slots__ = ("name", "topics", "handler", "batch", "batch_size", "delay")
+
+    def __init__(
+        self,
+        name: str,
+        topics: Optional[frozenset],
+        handler: Callable,
+        batch: bool = False,
+        batch_size: Optional[int] = None,
+        delay: float = 0,
+    ) -> None:
+        self.name = name
+        self.topics = topics
+        self.handler = handler
+        self.batch = batch
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.delay = delay
+
+    def wants(self, topic: str) -> bool:
+        return self.topics is None or topic in self.topics
+
+
+consumers: Dict[str, Consumer] = {}
+
+
+def outbox_handler(
+    name: str,
+    topics: Optional[Iterable[str]] = None,
+    batch: bool = False,
+    batch_size: Optional[int] = None,
+    delay: float = 0,
+):
+    """
+    Register ``handler(message)`` as consumer ``name`` of ``topics`` (all topics if None).
+
+    With ``batch`` the handler is called once per batch of up to
+    ``batch_size`` events, with a list of messages; a failure retries the
+    whole batch. ``delay`` holds events back until they are that many
+    seconds old, so a handler sees several quick changes to the same
+    aggregate together.
+    """
+
+    def decorator(handler: Callable) -> Callable:
+        if name in consumers:
+            raise ValueError(f"Outbox consumer {name!r} is already registered")
+        consumers[name] = Consumer(
+            name, frozenset(topics) if topics is not None else None, handler, batch, batch_size, delay,
+        )
+        return handler
+
+    return decorator
+
+
+def publish_event(db: Session, topic: str, payload: dict, aggregate_id: Optional[int] = None) -> None:
+    """Add an outbox event to the current transaction of ``db``"""
+    from app.models.outbox import OutboxEvent
+
+    db.add(OutboxEvent(
+        topic=topic,
+        aggregate_id=aggregate_id,
+        payload=json.dumps(payload, separators=(",", ":"), default=str),
+        created_at=time.time(),
+    ))
+    db.info["outbox_pending"] = True
+
+
+def install_outbox(session_factory: sessionmaker) -> None:
+    """Wake this worker's dispatcher when a session commits outbox events"""
+
+    @event.listens_for(session_factory, "after_commit")
+    def _after_commit(session):
+        if session.info.pop("outbox_pending", False):
+            outbox_dispatcher.wake()
+
+    @event.listens_for(session_factory, "after_soft_rollback")
+    def _after_rollback(session, previous_transaction):
+        session.info.pop("outbox_pending", None)
+
+
+class OutboxDispatcher:
+    """Background thread delivering outbox events to the registered consumers"""
+
+    def __init__(self) -> None:
+        self.worker_id = ""
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._ensured: set = set()
+        self._sequences: Dict[str, IdSequence] = {}  # consumers this worker holds the lease for
+        self._lag: Dict[str, tuple] = {}  # consumer -> (events, seconds)
+        self._next_cleanup = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        # Per process: workers forked from a preloaded app each start their own
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping.clear()
+        self._sequences.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread.join(timeout)
+        self._thread = None
+        try:
+            self._release_leases()
+        except SQLAlchemyError:
+            logger.exception("Releasing outbox leases failed")
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def lag(self) -> Dict[str, tuple]:
+        return dict(self._lag)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            busy = False
+            for consumer in list(consumers.values()):
+                try:
+                    busy = self._service(consumer) or busy
+                except SQLAlchemyError:
+                    logger.exception("Outbox dispatch for %s failed", consumer.name)
+                    self._sequences.pop(consumer.name, None)
+            if time.time() >= self._next_cleanup:
+                self._next_cleanup = time.time() + CLEANUP_INTERVAL
+                try:
+                    self._cleanup()
+                except SQLAlchemyError:
+                    logger.exception("Outbox cleanup failed")
+            if not busy:
+                self._wake.wait(settings.OUTBOX_POLL_INTERVAL)
+                self._wake.clear()
+
+    def _acquire(self, conn, name: str, now: float):
+        """Take or renew the lease on ``name``; return its row, or None if another worker holds it"""
+        from app.core.database import dialect_insert
+        from app.models.outbox import OutboxConsumer, OutboxEvent
+
+        if name not in self._ensured:
+            # A new consumer starts with the events published after it was deployed
+            newest = select(func.coalesce(func.max(OutboxEvent.id), 0)).scalar_subquery()
+            conn.execute(dialect_insert(OutboxConsumer).values(name=name, last_event_id=newest).on_conflict_do_nothing())
+            self._ensured.add(name)
+        return conn.execute(
+            update(OutboxConsumer)
+            .where(
+                OutboxConsumer.name == name,
+                (OutboxConsumer.locked_by == self.worker_id) | (OutboxConsumer.locked_until < now),
+            )
+            .values(locked_by=self.worker_id, locked_until=now + settings.OUTBOX_LEASE_SECONDS)
+            .returning(OutboxConsumer.last_event_id, OutboxConsumer.attempts, OutboxConsumer.retry_at)
+        ).first()
+
+    def _service(self, consumer: Consumer) -> bool:
+        """Deliver one batch to ``consumer`` if this worker holds its lease; True if more are waiting"""
+        from app.core.database import background_engine
+        from app.models.outbox import OutboxEvent
+
+        now = time.time()
+        with background_engine.begin() as conn:
+            state = self._acquire(conn, consumer.name, now)
+            if state is None:
+                self._sequences.pop(consumer.name, None)
+                self._lag.pop(consumer.name, None)
+                return False
+            sequence = self._sequences.get(consumer.name)
+            if sequence is None:
+                # Newly acquired (or after a failure): continue from the saved position
+                sequence = self._sequences[consumer.name] = IdSequence(state.last_event_id)
+            if state.retry_at > now:
+                return False  # backing off after a failure
+            rows = conn.execute(
+                select(
+                    OutboxEvent.id, OutboxEvent.topic, OutboxEvent.aggregate_id,
+                    OutboxEvent.payload, OutboxEvent.created_at,
+                )
+                .where(OutboxEvent.id > sequence.read_after())
+                .order_by(OutboxEvent.id)
+                .limit(consumer.batch_size)
+            ).all()
+
+        # (position to resume from if delivery fails, messages)
+        deliveries: List[tuple] = []
+        held_back = False
+        for row in rows:
+            if row.created_at > now - consumer.delay:
+                held_back = True  # this and later events wait until they are old enough
+                break
+            position = sequence.read_after()
+            if not sequence.is_new(row.id) or not consumer.wants(row.topic):
+                continue
+            message = OutboxMessage(row.id, row.topic, row.aggregate_id, json.loads(row.payload), row.created_at)
+            if consumer.batch and deliveries:
+                deliveries[0][1].append(message)
+            else:
+                deliveries.append((position, [message]))
+
+        attempts = state.attempts
+        for position, messages in deliveries:
+            try:
+                consumer.handler(messages if consumer.batch else messages[0])
+            except Exception as exc:
+                attempts += 1
+                if attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                    logger.warning("Outbox consumer %s failed on event %d (attempt %d): %s",
+                                   consumer.name, messages[0].id, attempts, exc)
+                    outbox_deliveries_total.inc(consumer.name, "retry", amount=len(messages))
+                    # Resume from just before this event once the backoff has passed
+                    self._sequences.pop(consumer.name, None)
+                    self._save(consumer.name, position, attempts, exc)
+                    return False
+                logger.exception("Outbox consumer %s gave up on event %d after %d attempts",
+                                 consumer.name, messages[0].id, attempts)
+                outbox_deliveries_total.inc(consumer.name, "dead", amount=len(messages))
+            else:
+                outbox_deliveries_total.inc(consumer.name, "ok", amount=len(messages))
+            attempts = 0
+
+        self._save(consumer.name, sequence.read_after(), 0, None)
+        return len(rows) == consumer.batch_size and not held_back
+
+    def _save(self, name: str, position: int, attempts: int, error: Optional[Exception]) -> None:
+        """Record the position (and any failure) of ``name``, and measure its lag"""
+        from app.core.database import background_engine
+        from app.models.outbox import OutboxConsumer, OutboxEvent
+
+        now = time.time()
+        retry_at = 0.0
+        if attempts:
+            delay = settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+            retry_at = now + min(delay, settings.OUTBOX_RETRY_MAX_SECONDS)
+        with background_engine.begin() as conn:
+            saved = conn.execute(
+                update(OutboxConsumer)
+                .where(OutboxConsumer.name == name, OutboxConsumer.locked_by == self.worker_id)
+                .values(
+                    last_event_id=position,
+                    attempts=attempts,
+                    retry_at=retry_at,
+                    last_error=repr(error)[:2000] if error is not None else None,
+                )
+            ).rowcount
+            newest = conn.execute(select(func.max(OutboxEvent.id))).scalar() or 0
+            oldest_pending = conn.execute(
+                select(OutboxEvent.created_at).where(OutboxEvent.id > position).order_by(OutboxEvent.id).limit(1)
+            ).scalar()
+        if not saved:
+            # The lease expired mid-batch and another worker took over
+            self._sequences.pop(name, None)
+            self._lag.pop(name, None)
+            return
+        self._lag[name] = (newest - position, now - oldest_pending if oldest_pending is not None else 0.0)
+
+    def _cleanup(self) -> None:
+        """Delete old events that every registered consumer has been given"""
+        from app.core.database import background_engine
+        from app.models.outbox import OutboxConsumer, OutboxEvent
+
+        cutoff = time.time() - settings.OUTBOX_RETENTION_HOURS * 3600
+        with background_engine.begin() as conn:
+            query = delete(OutboxEvent).where(OutboxEvent.created_at < cutoff)
+            if consumers:
+                positions = conn.execute(
+                    select(OutboxConsumer.last_event_id).where(OutboxConsumer.name.in_(list(consumers)))
+                ).scalars().all()
+                if len(positions) < len(consumers):
+                    return  # a consumer has not started yet
+                query = query.where(OutboxEvent.id <= min(positions))
+            conn.execute(query)
+
+    def _release_leases(self) -> None:
+        from app.core.database import background_engine
+        from app.models.outbox import OutboxConsumer
+
+        if not self._sequences:
+            return
+        with background_engine.begin() as conn:
+            conn.execute(
+                update(OutboxConsumer)
+                .where(OutboxConsumer.locked_by == self.worker_id)
+                .values(locked_by=None, locked_until=0)
+            )
+        self._sequences.clear()
+        self._lag.clear()
+
+
+outbox_dispatcher = OutboxDispatcher()
+
+
+def _lag_events() -> Dict[tuple, float]:
+    return {(name,): events for name, (events, _) in outbox_dispatcher.lag().items()}
+
+
+def _lag_seconds() -> Dict[tuple, float]:
+    return {(name,): seconds for name, (_, seconds) in outbox_dispatcher.lag().items()}
+
+
+outbox_lag_events.add_callback(_lag_events)
+outbox_lag_seconds.add_callback(_lag_seconds)
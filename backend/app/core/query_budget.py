@@ -0,0 +1,228 @@
+"""
+Per-request SQL budgets and slow-query logging.
+
+Every statement executed while handling a request is attributed to that
+request. Requests that run more statements than their budget, or spend more
+than the configured time in SQL, are logged with the most repeated and the
+slowest statements (with EXPLAIN output for the slowest one). Individual
+statements slower than ``SQL_SLOW_QUERY_MS`` are logged as they happen.
+
+For CI, ``SQL_BUDGET_RAISE`` turns budget violations into exceptions and
+``SQL_RAISE_ON_LAZY_LOAD`` applies ``raiseload("*")`` to every ORM query, so an
+N+1 regression fails the test that triggers it.
+"""
+import logging
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import raiseload, sessionmaker
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.sql")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in test mode when a request exceeds its SQL budget"""
+
+
+class _StatementStats:
+    __slots__ = ("count", "total", "slowest", "slowest_parameters")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_parameters: Any = None
+
+
+class QueryLog:
+    """Statements executed on behalf of one request, grouped by SQL text"""
+
+    def __init__(self, scope: Scope) -> None:
+        self.scope = scope
+        self.count = 0
+        self.total = 0.0
+        self.statements: Dict[str, _StatementStats] = {}
+        self.plans: Dict[str, str] = {}
+
+    @property
+    def route(self) -> str:
+        # The route is only known once routing has run
+        return getattr(self.scope.get("route"), "path", self.scope["path"])
+
+    @property
+    def budget(self) -> int:
+        return settings.SQL_ROUTE_BUDGETS.get(self.route, settings.SQL_QUERY_BUDGET)
+
+    def record(self, statement: str, parameters: Any, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        stats = self.statements.get(statement)
+        if stats is None:
+            stats = self.statements[statement] = _StatementStats()
+        stats.count += 1
+        stats.total += elapsed
+        if elapsed >= stats.slowest:
+            stats.slowest = elapsed
+            stats.slowest_parameters = parameters
+
+    def most_repeated(self, limit: int = 3) -> List[Tuple[str, _StatementStats]]:
+        return sorted(self.statements.items(), key=lambda item: item[1].count, reverse=True)[:limit]
+
+    def slowest(self) -> Optional[Tuple[str, _StatementStats]]:
+        if not self.statements:
+            return None
+        return max(self.statements.items(), key=lambda item: item[1].slowest)
+
+
+current_query_log: ContextVar[Optional[QueryLog]] = ContextVar("current_query_log", default=None)
+
+
+def _short(statement: str, length: int = 300) -> str:
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return statement if len(statement) <= length else statement[:length] + "..."
+
+
+def explain(cursor, dialect_name: str, statement: str, parameters: Any) -> str:
+    """
+    Return the query plan for a SELECT, or an empty string if it is not one.
+
+    Runs on the DBAPI connection that executed the statement, so it sees the
+    same transaction and never checks a connection in or out of the pool.
+    """
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return ""
+    prefix = "EXPLAIN QUERY PLAN " if dialect_name == "sqlite" else "EXPLAIN "
+    try:
+        explain_cursor = cursor.connection.cursor()
+        try:
+            explain_cursor.execute(prefix + statement, parameters or ())
+            rows = explain_cursor.fetchall()
+        finally:
+            explain_cursor.close()
+    except Exception as exc:  # the plan is diagnostic only
+        return f"<explain failed: {exc}>"
+    return "\n".join(" | ".join(str(col) for col in row) for row in rows)
+
+
+def install_query_budget(engine: Optional[Engine] = None, session_factory: Optional[sessionmaker] = None) -> None:
+    """Attach statement accounting to ``engine`` and, in test mode, raiseload to ``session_factory``"""
+    if engine is not None:
+        _install_statement_accounting(engine)
+
+    if session_factory is not None and settings.SQL_RAISE_ON_LAZY_LOAD:
+        @event.listens_for(session_factory, "do_orm_execute")
+        def _raise_on_lazy_load(orm_execute_state):
+            if (
+                orm_execute_state.is_select
+                and not orm_execute_state.is_relationship_load
+                and not orm_execute_state.is_column_load
+            ):
+                orm_execute_state.statement = orm_execute_state.statement.options(raiseload("*"))
+
+
+def _install_statement_accounting(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("budget_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["budget_query_start"].pop()
+        log = current_query_log.get()
+
+        can_explain = settings.SQL_EXPLAIN_SLOW_QUERIES and not executemany
+
+        if elapsed * 1000 >= settings.SQL_SLOW_QUERY_MS:
+            plan = explain(cursor, engine.dialect.name, statement, parameters) if can_explain else ""
+            if log is not None and plan:
+                log.plans[statement] = plan
+            logger.warning(
+                "Slow query (%.1f ms) in %s: %s\nparameters: %r\n%s",
+                elapsed * 1000, log.route if log else "<no request>", _short(statement, 1000), parameters, plan,
+            )
+
+        if log is None:
+            return
+        log.record(statement, parameters, elapsed)
+        if log.count == log.budget + 1:
+            # Usually the statement that crossed the budget is the repeated N+1 one
+            if can_explain and statement not in log.plans:
+                log.plans[statement] = explain(cursor, engine.dialect.name, statement, parameters)
+            if settings.SQL_BUDGET_RAISE:
+                raise QueryBudgetExceeded(
+                    f"{log.route} executed {log.count} SQL statements (budget {log.budget}); "
+                    f"last: {_short(statement)}"
+                )
+
+
+def _report(log: QueryLog, elapsed: float) -> str:
+    lines = [
+        f"{log.route}: {log.count} SQL statements (budget {log.budget}), "
+        f"{log.total * 1000:.1f} ms in SQL, {elapsed * 1000:.1f} ms total"
+    ]
+    for statement, stats in log.most_repeated():
+        if stats.count > 1:
+            lines.append(f"  x{stats.count} ({stats.total * 1000:.1f} ms): {_short(statement)}")
+    slowest = log.slowest()
+    if slowest is not None:
+        statement, stats = slowest
+        lines.append(f"  slowest ({stats.slowest * 1000:.1f} ms): {_short(statement, 1000)}")
+        lines.append(f"  parameters: {stats.slowest_parameters!r}")
+    for statement, plan in log.plans.items():
+        if plan:
+            lines.append(f"  plan for {_short(statement, 120)}:\n    " + plan.replace("\n", "\n    "))
+    return "\n".join(lines)
+
+
+class QueryBudgetMiddleware:
+    """Attribute SQL statements to requests and report requests over budget"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog(scope)
+        token = current_query_log.set(log)
+        start = time.perf_counter()
+        streaming = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                streaming = Headers(raw=message.get("headers", [])).get("content-type", "").startswith("text/event-stream")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_log.reset(token)
+
+        elapsed = time.perf_counter() - start
+        over_count = log.count > log.budget
+        over_time = (
+            log.total * 1000 > settings.SQL_REQUEST_TIME_BUDGET_MS
+            # An event stream stays open as long as the client listens
+            or (elapsed * 1000 > settings.SLOW_REQUEST_MS and not streaming)
+        )
+        if not (over_count or over_time):
+            return
+
+        report = _report(log, elapsed)
+        logger.warning("Request over SQL/latency budget: %s", report)
+        # Only the statement count is enforced in test mode; timings are too noisy for CI
+        if settings.SQL_BUDGET_RAISE and over_count:
+            raise QueryBudgetExceeded(report)
@@ -0,0 +1,214 @@
+"""
+Rate limiting for expensive endpoints.
+
+Limits are configured per route group in ``RATE_LIMITS`` as strings like
+``"5/minute"`` for the client IP and, where the route knows one, the
+username. Two backends implement the same ``hit`` interface:
+
+* ``memory``: an exact token bucket per key (capacity = the limit, refilled
+  evenly over the period). Per worker process, so with N workers a client
+  can get up to N times the limit. At ``MAX_KEYS`` buckets, full ones are
+  dropped first (a new bucket starts full anyway), then the least recently
+  used, so flooding new keys cannot reset a bucket that is in use.
+* ``database``: a sliding-window counter in the ``rate_limit_counters``
+  table, shared by every worker and host using the database. It keeps two
+  fixed-window counts per key and weights the previous window by how much
+  of it still overlaps the sliding window, which approximates the same rate
+  with one upsert per request.
+"""
+import math
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+
+from app.core.config import settings
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_LIMIT_RE = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+
+
+class RateLimit:
+    """``limit`` requests per ``period`` seconds"""
+
+    __slots__ = ("limit", "period")
+
+    def __init__(self, limit: int, period: float) -> None:
+        self.limit = limit
+        self.period = period
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        """Parse ``"10/minute"`` or ``"100/15minutes"``"""
+        match = _LIMIT_RE.match(value)
+        if not match:
+            raise ValueError(f"Invalid rate limit {value!r}, expected e.g. '10/minute'")
+        count, multiplier, unit = match.groups()
+        return cls(int(count), int(multiplier or 1) * _PERIODS[unit])
+
+    def __repr__(self) -> str:
+        return f"RateLimit({self.limit}/{self.period}s)"
+
+
+class MemoryBackend:
+    """Token buckets held in this process"""
+
+    # Prune once there are this many keys, down to PRUNE_TO of it
+    MAX_KEYS = 10000
+    PRUNE_TO = 0.9
+
+    def __init__(self) -> None:
+        # key -> [tokens, last refill time, capacity, tokens per second]; least recently used first
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, rate: RateLimit, now: Optional[float] = None) -> Tuple[bool, float]:
+        """Take one token; return (allowed, seconds until a token is available)"""
+        now = time.monotonic() if now is None else now
+        refill_per_second = rate.limit / rate.period
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.MAX_KEYS:
+                    self._prune(now)
+                bucket = self._buckets[key] = [float(rate.limit), now, float(rate.limit), refill_per_second]
+            else:
+                bucket[0] = min(rate.limit, bucket[0] + (now - bucket[1]) * refill_per_second)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0.0
+            return False, (1 - bucket[0]) / refill_per_second
+
+    def _prune(self, now: float) -> None:
+        # Full buckets carry no state: dropping one changes nothing
+        full = [
+            key for key, (tokens, last, capacity, refill_per_second) in self._buckets.items()
+            if tokens + (now - last) * refill_per_second >= capacity
+        ]
+        for key in full:
+            del self._buckets[key]
+        # Then the least recently used, leaving room so this does not run for every new key
+        while len(self._buckets) > self.MAX_KEYS * self.PRUNE_TO:
+            self._buckets.popitem(last=False)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class DatabaseBackend:
+    """Sliding-window counters in the application database, shared across workers"""
+
+    # Fraction of hits that also delete expired counter rows
+    CLEANUP_PROBABILITY = 0.01
+
+    def __init__(self, engine) -> None:
+        self.engine = engine
+
+    def hit(self, key: str, rate: RateLimit, now: Optional[float] = None) -> Tuple[bool, float]:
+        from app.core.database import dialect_insert
+        from app.models.rate_limit import RateLimitCounter
+
+        now = time.time() if now is None else now
+        window = int(now // rate.period)
+        elapsed = now - window * rate.period
+        upsert = dialect_insert(RateLimitCounter).values(
+            key=key, window=window, count=1, expires_at=(window + 2) * rate.period,
+        )
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[RateLimitCounter.key, RateLimitCounter.window],
+            set_={"count": RateLimitCounter.count + 1},
+        ).returning(RateLimitCounter.count)
+
+        with self.engine.begin() as conn:
+            current = conn.execute(upsert).scalar_one()
+            previous = conn.execute(
+                select(RateLimitCounter.count).where(
+                    RateLimitCounter.key == key, RateLimitCounter.window == window - 1
+                )
+            ).scalar() or 0
+            estimate = previous * (1 - elapsed / rate.period) + current
+            allowed = estimate <= rate.limit
+            if not allowed:
+                # Rejected requests do not use up the allowance
+                conn.execute(
+                    update(RateLimitCounter)
+                    .where(RateLimitCounter.key == key, RateLimitCounter.window == window)
+                    .values(count=RateLimitCounter.count - 1)
+                )
+            if random.random() < self.CLEANUP_PROBABILITY:
+                conn.execute(delete(RateLimitCounter).where(RateLimitCounter.expires_at < now))
+
+        if allowed:
+            return True, 0.0
+        return False, self._retry_after(rate, elapsed, previous, current - 1)
+
+    @staticmethod
+    def _retry_after(rate: RateLimit, elapsed: float, previous: int, current: int) -> float:
+        """Seconds until ``previous * (1 - f) + current + 1 <= limit`` for the window fraction f"""
+        room = rate.limit - 1 - current
+        if room >= 0 and previous:
+            # The previous window's weight decays enough within this window
+            return max(0.0, rate.period * (1 - room / previous) - elapsed)
+        # This window is full: wait for it to become the (decaying) previous window
+        until_next = rate.period - elapsed
+        return until_next + rate.period * max(0.0, 1 - (rate.limit - 1) / max(current, 1))
+
+    def reset(self) -> None:
+        from app.models.rate_limit import RateLimitCounter
+
+        with self.engine.begin() as conn:
+            conn.execute(delete(RateLimitCounter))
+
+
+class RateLimiter:
+    """Checks requests against the per-group limits in ``RATE_LIMITS``"""
+
+    def __init__(self, backend, limits: Dict[str, Dict[str, str]]) -> None:
+        self.backend = backend
+        self.limits = {
+            group: {scope: RateLimit.parse(value) for scope, value in scopes.items()}
+            for group, scopes in limits.items()
+        }
+
+    def check(self, group: str, ip: Optional[str], username: Optional[str] = None) -> Optional[float]:
+        """
+        Count one request against every applicable bucket of ``group``.
+
+        Returns None if allowed, otherwise the number of seconds to wait.
+        """
+        for scope, identity in (("ip", ip), ("username", username)):
+            rate = self.limits.get(group, {}).get(scope)
+            if rate is None or not identity:
+                continue
+            allowed, wait = self.backend.hit(f"{group}:{scope}:{identity.lower()}", rate)
+            if not allowed:
+                return wait
+        return None
+
+
+def _create_limiter() -> RateLimiter:
+    if settings.RATE_LIMIT_BACKEND == "database":
+        # Its own connections: on SQLite the request engine is one shared
+        # connection, and begin()/commit here would end requests' transactions
+        from app.core.database import background_engine
+
+        backend = DatabaseBackend(background_engine)
+    elif settings.RATE_LIMIT_BACKEND == "memory":
+        backend = MemoryBackend()
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND {settings.RATE_LIMIT_BACKEND!r}")
+    return RateLimiter(backend, settings.RATE_LIMITS)
+
+
+rate_limiter = _create_limiter()
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
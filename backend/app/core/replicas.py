@@ -0,0 +1,156 @@
+"""
+Routing reads to replica databases.
+
+Read-only endpoints take their session from ``get_read_db`` (see
+``app.core.database``), which uses a randomly chosen healthy replica from
+``DATABASE_REPLICA_URLS``. The primary is used instead when:
+
+* no replica is configured or reachable (a replica that fails to connect is
+  skipped for ``REPLICA_RETRY_SECONDS``), or
+* the same user wrote through the primary within the last
+  ``REPLICA_READ_YOUR_WRITES_SECONDS``, so they never read data older than
+  their own change from a lagging replica.
+
+Writes are detected on primary sessions (flushes and ORM UPDATE/DELETE) and
+remembered both in this worker, keyed by token subject, and in a short-lived
+cookie so the next request is routed correctly whichever worker serves it.
+"""
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.security import verify_token
+
+logger = logging.getLogger(__name__)
+
+COOKIE_NAME = "read_primary_until"
+
+
+class _WriteTracker:
+    __slots__ = ("wrote",)
+
+    def __init__(self) -> None:
+        self.wrote = False
+
+
+current_write_tracker: ContextVar[Optional[_WriteTracker]] = ContextVar("current_write_tracker", default=None)
+
+
+def request_subject(headers: Headers) -> Optional[str]:
+    """Username from a valid bearer token, if any"""
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return verify_token(token)
+
+
+class ReplicaRouter:
+    """Chooses the engine for a read-only request"""
+
+    def __init__(self, primary: Engine, replicas: List[Engine]) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self._down_until: Dict[int, float] = {}
+        self._recent_writers: Dict[str, float] = {}  # subject -> time of last write
+        self._lock = threading.Lock()
+
+    def record_write(self, subject: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writers[subject] = now
+            if len(self._recent_writers) > 10000:
+                horizon = now - settings.REPLICA_READ_YOUR_WRITES_SECONDS
+                self._recent_writers = {s: t for s, t in self._recent_writers.items() if t > horizon}
+
+    def wrote_recently(self, request: Request) -> bool:
+        try:
+            if float(request.cookies.get(COOKIE_NAME, 0)) > time.time():
+                return True
+        except ValueError:
+            pass
+        subject = request_subject(request.headers)
+        last_write = self._recent_writers.get(subject) if subject else None
+        return last_write is not None and time.monotonic() - last_write < settings.REPLICA_READ_YOUR_WRITES_SECONDS
+
+    def connect_for_read(self, request: Request) -> Optional[Connection]:
+        """
+        Return a connection to a healthy replica, or None to use the primary.
+        """
+        if not self.replicas or self.wrote_recently(request):
+            return None
+        now = time.monotonic()
+        candidates = [i for i in range(len(self.replicas)) if self._down_until.get(i, 0) <= now]
+        random.shuffle(candidates)
+        for index in candidates:
+            try:
+                return self.replicas[index].connect()
+            except DBAPIError as exc:
+                logger.warning(
+                    "Replica %d unavailable, using the primary for %ss: %s",
+                    index, settings.REPLICA_RETRY_SECONDS, exc,
+                )
+                self._down_until[index] = now + settings.REPLICA_RETRY_SECONDS
+        return None
+
+
+def install_write_tracking(session_factory: sessionmaker) -> None:
+    """Flag the current request as having written when a primary session writes"""
+
+    def _mark(session) -> None:
+        tracker = current_write_tracker.get()
+        if tracker is not None and not isinstance(session.bind, Connection):
+            tracker.wrote = True
+
+    @event.listens_for(session_factory, "after_flush")
+    def _after_flush(session, flush_context):
+        _mark(session)
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def _do_orm_execute(orm_execute_state):
+        if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+            _mark(orm_execute_state.session)
+
+
+class ReadYourWritesMiddleware:
+    """Remember users who just wrote so their next reads go to the primary"""
+
+    def __init__(self, app: ASGIApp, router: ReplicaRouter) -> None:
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        tracker = _WriteTracker()
+        token = current_write_tracker.set(tracker)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and tracker.wrote:
+                subject = request_subject(Headers(scope=scope))
+                if subject:
+                    self.router.record_write(subject)
+                window = settings.REPLICA_READ_YOUR_WRITES_SECONDS
+                MutableHeaders(scope=message).append(
+                    "set-cookie",
+                    f"{COOKIE_NAME}={time.time() + window:.0f}; Max-Age={window:.0f}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_write_tracker.reset(token)
@@ -0,0 +1,155 @@
+"""
+Revocation of stateless access tokens.
+
+With ``STATELESS_AUTH`` an access token carries the user's id, role and
+active flag, and requests trust it instead of loading the user. Changing a
+user's role or active flag, or deleting the user, adds a row to
+``token_revocations`` in the same transaction: tokens of that user issued
+before that moment are no longer accepted. The user logs in again, or
+refreshes, to get a token with the new role.
+
+Each worker keeps the recent revocations in memory, one entry per user,
+and checks tokens against it without a query. The committing worker adds
+its own revocations when the transaction commits; the others poll the
+table every ``TOKEN_REVOCATION_POLL_SECONDS``. Access tokens expire after
+``STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES``, so older revocations are
+dropped, and the set stays as small as the number of users changed in
+that window. If polling stops working the set is stale. Requests then
+load the user from the database again until polling recovers.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.events import IdSequence
+
+logger = logging.getLogger(__name__)
+
+# Fraction of revocations that also delete expired ones
+CLEANUP_PROBABILITY = 0.05
+# Polls missed before the set counts as stale
+STALE_AFTER_POLLS = 10
+
+
+def _token_lifetime() -> float:
+    return settings.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+
+def revoke_user_tokens(connection, session, user_id: int) -> None:
+    """
+    Record in the current transaction that ``user_id``'s access tokens
+    issued until now are revoked; ``session``, if given, adds it to this
+    worker's set when it commits
+    """
+    from app.models.user import TokenRevocation
+
+    now = time.time()
+    table = TokenRevocation.__table__
+    connection.execute(insert(table).values(user_id=user_id, revoked_at=now))
+    if random.random() < CLEANUP_PROBABILITY:
+        connection.execute(table.delete().where(table.c.revoked_at < now - _token_lifetime()))
+    if session is not None:
+        session.info.setdefault("token_revocations", []).append((user_id, now))
+
+
+def install_token_revocations(session_factory: sessionmaker) -> None:
+    """Apply revocations recorded in a session to this worker's set when it commits"""
+
+    @event.listens_for(session_factory, "after_commit")
+    def _after_commit(session):
+        revoked = session.info.pop("token_revocations", None)
+        if revoked:
+            token_revocations.add(revoked)
+
+    @event.listens_for(session_factory, "after_soft_rollback")
+    def _after_rollback(session, previous_transaction):
+        session.info.pop("token_revocations", None)
+
+
+class RevocationSet:
+    """Recent revocations by user id, kept current by a polling thread"""
+
+    def __init__(self) -> None:
+        self._revoked: Dict[int, float] = {}  # user id -> tokens issued before this are revoked
+        self._lock = threading.Lock()
+        self._sequence = IdSequence()
+        self._polled_at = 0.0  # monotonic time of the last successful poll
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def add(self, revoked: List[Tuple[int, float]]) -> None:
+        with self._lock:
+            for user_id, revoked_at in revoked:
+                if revoked_at > self._revoked.get(user_id, 0):
+                    self._revoked[user_id] = revoked_at
+
+    def is_revoked(self, user_id: int, issued_at: float) -> bool:
+        return issued_at < self._revoked.get(user_id, 0)
+
+    def is_current(self) -> bool:
+        """False until the first poll, and when polling has been failing"""
+        return time.monotonic() - self._polled_at < settings.TOKEN_REVOCATION_POLL_SECONDS * STALE_AFTER_POLLS
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def poll(self) -> None:
+        from app.core.database import background_engine
+        from app.models.user import TokenRevocation
+
+        since = time.time() - _token_lifetime()
+        query = select(TokenRevocation.id, TokenRevocation.user_id, TokenRevocation.revoked_at).where(
+            TokenRevocation.id > self._sequence.read_after(), TokenRevocation.revoked_at >= since
+        )
+        with background_engine.connect() as conn:
+            rows = conn.execute(query.order_by(TokenRevocation.id)).all()
+        self.add([(row.user_id, row.revoked_at) for row in rows if self._sequence.is_new(row.id)])
+        with self._lock:
+            # Every token issued before these has expired by now
+            for user_id in [user_id for user_id, revoked_at in self._revoked.items() if revoked_at < since]:
+                del self._revoked[user_id]
+        self._polled_at = time.monotonic()
+
+    def _latest_id(self) -> int:
+        from app.core.database import background_engine
+        from app.models.user import TokenRevocation
+
+        with background_engine.connect() as conn:
+            return conn.execute(
+                select(func.min(TokenRevocation.id) - 1).where(TokenRevocation.revoked_at >= time.time() - _token_lifetime())
+            ).scalar() or 0
+
+    def start(self) -> None:
+        """Load the revocations still in force, then keep polling in the background"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._sequence = IdSequence(self._latest_id())
+        self.poll()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="token-revocations", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.wait(settings.TOKEN_REVOCATION_POLL_SECONDS):
+            try:
+                self.poll()
+            except SQLAlchemyError:
+                logger.exception("Polling token revocations failed")
+
+
+token_revocations = RevocationSet()
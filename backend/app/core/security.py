@@ -1,19 +1,51 @@
 from datetime import datetime, timedelta
-from typing import Any, Union, Optional
+from typing import Any, Union, Optional, Tuple
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from passlib.hash import bcrypt
 from fastapi import HTTPException, status
 import secrets
 import string
+import time
 
 from app.core.config import settings
+from app.core.metrics import password_hash_duration_seconds, password_rehashes_total
+
+PASSWORD_SCHEMES = ("bcrypt", "argon2")
+
+def create_password_context(
+    scheme: str = None,
+    bcrypt_rounds: int = None,
+    argon2_time_cost: int = None,
+    argon2_memory_cost: int = None,
+    argon2_parallelism: int = None,
+) -> CryptContext:
+    """
+    Hashing policy: new hashes use ``scheme`` with these costs (default: the
+    settings); hashes of the other scheme or with other costs still verify,
+    and ``needs_update`` reports them
+    """
+    scheme = scheme or settings.PASSWORD_SCHEME
+    if scheme not in PASSWORD_SCHEMES:
+        raise ValueError(f"Unknown PASSWORD_SCHEME {scheme!r}; expected one of {', '.join(PASSWORD_SCHEMES)}")
+    if scheme == "argon2":
+        from passlib.hash import argon2
+        if not argon2.has_backend():
+            raise RuntimeError("PASSWORD_SCHEME=argon2 needs the argon2-cffi package")
+    return CryptContext(
+        schemes=[scheme] + [other for other in PASSWORD_SCHEMES if other != scheme],
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds or settings.BCRYPT_ROUNDS,
+        argon2__time_cost=argon2_time_cost or settings.ARGON2_TIME_COST,
+        argon2__memory_cost=argon2_memory_cost or settings.ARGON2_MEMORY_COST,
+        argon2__parallelism=argon2_parallelism or settings.ARGON2_PARALLELISM,
+    )
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = create_password_context()
 
 def create_access_token(
-    subject: Union[str, Any], expires_delta: timedelta = None
+    subject: Union[str, Any], expires_delta: timedelta = None, claims: Optional[dict] = None
 ) -> str:
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -22,10 +54,40 @@ def create_access_token(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
     
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {"exp": expire, "sub": str(subject), **(claims or {})}
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+def create_user_tokens(user) -> dict:
+    """
+    Login response for ``user``: a long-lived access token, or with
+    STATELESS_AUTH a short-lived one carrying the user's id, role and active
+    flag plus a refresh token
+    """
+    if not settings.STATELESS_AUTH:
+        return {
+            "access_token": create_access_token(user.username),
+            "token_type": "bearer",
+        }
+    # Sub-second issue time, so a token refreshed right after a revocation is not caught by it
+    issued_at = round(time.time(), 3)
+    access_token = create_access_token(
+        user.username,
+        timedelta(minutes=settings.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES),
+        {"typ": "access", "iat": issued_at, "uid": user.id, "role": user.role, "active": bool(user.is_active)},
+    )
+    refresh_token = create_access_token(
+        user.username,
+        timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        {"typ": "refresh", "iat": issued_at, "uid": user.id},
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": settings.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
 def verify_token(token: str) -> Optional[str]:
     try:
         payload = jwt.decode(
@@ -37,10 +99,12 @@ def verify_token(token: str) -> Optional[str]:
         return None
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with password_hash_duration_seconds.time("verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    with password_hash_duration_seconds.time("hash"):
+        return pwd_context.hash(password)
 
 def generate_salt(length: int = 32) -> str:
     """Generate a random salt for additional password security"""
@@ -56,4 +120,16 @@ def hash_password_with_salt(password: str, salt: str) -> str:
 def verify_password_with_salt(password: str, salt: str, hashed_password: str) -> bool:
     """Verify password with custom salt"""
     salted_password = password + salt
-    return verify_password(salted_password, hashed_password)
\ No newline at end of file
+    return verify_password(salted_password, hashed_password)
+
+def verify_and_update_password_with_salt(password: str, salt: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify password with custom salt; when it matches but the stored hash does
+    not follow the current policy, also return a new hash to store
+    """
+    if not verify_password_with_salt(password, salt, hashed_password):
+        return False, None
+    if not pwd_context.needs_update(hashed_password):
+        return True, None
+    password_rehashes_total.inc(pwd_context.identify(hashed_password) or "unknown")
+    return True, hash_password_with_salt(password, salt)
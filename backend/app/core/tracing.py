@@ -0,0 +1,456 @@
+"""
+Lightweight request tracing.
+
+Every request gets a trace id (returned as ``X-Trace-Id``). Whether it
+records spans is decided once, when it starts: sampled requests
+(``TRACING_SAMPLE_RATE`` or an incoming sampled ``traceparent``) do, and so
+does every request to a route that recently had a slow request (see below).
+A recording request has spans for dependency resolution, authentication,
+each SQL statement, the endpoint body, response-model validation and JSON
+rendering. The others skip all span and ORM hooks and only time the request.
+
+A trace is exported when it was sampled or when the request was slower than
+``TRACING_SLOW_REQUEST_MS`` (event streams excepted), so slow outliers are
+always kept. A slow request that was not recording is exported as its root
+span alone (``trace.partial``), and its route then records for
+``TRACING_SLOW_ROUTE_SECONDS``, so the next slow requests there come with all
+their spans.
+
+Spans are written as OTLP/JSON, either appended to ``TRACING_EXPORT_PATH``
+(one ``{"resourceSpans": ...}`` document per line) or POSTed to an OTLP/HTTP
+collector at ``TRACING_OTLP_ENDPOINT``, from a background thread.
+"""
+import asyncio
+import functools
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int = SPAN_KIND_INTERNAL,
+                 start_ns: Optional[int] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = end_ns if end_ns is not None else time.time_ns()
+            if len(self.trace.spans) < settings.TRACING_MAX_SPANS:
+                self.trace.spans.append(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "recording", "spans")
+
+    def __init__(self, trace_id: Optional[str] = None, sampled: bool = False):
+        self.trace_id = trace_id or "%032x" % random.getrandbits(128)
+        self.sampled = sampled
+        self.recording = sampled  # child spans are recorded; set before the route runs
+        self.spans: List[Span] = []
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+# Route template -> monotonic time until which its requests record spans
+_slow_routes: Dict[str, float] = {}
+
+
+def recording_trace() -> Optional[Trace]:
+    """The current trace if it records spans, else None"""
+    trace = current_trace.get()
+    return trace if trace is not None and trace.recording else None
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any):
+    """Record a child of the current span; a no-op outside a recording request"""
+    trace = recording_trace()
+    if trace is None:
+        yield None
+        return
+    parent = current_span.get()
+    span = Span(trace, name, parent.span_id if parent else None, kind, attributes=attributes)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.error = repr(exc)
+        raise
+    finally:
+        current_span.reset(token)
+        span.end()
+
+
+# Export
+
+
+class _Exporter:
+    """Ships finished traces from a background thread so requests never wait on I/O"""
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=settings.TRACING_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, trace: Trace) -> None:
+        if not (settings.TRACING_EXPORT_PATH or settings.TRACING_OTLP_ENDPOINT):
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            logger.warning("Trace export queue full, dropping trace %s", trace.trace_id)
+
+    def _ensure_started(self) -> None:
+        # is_alive() also catches a thread that did not survive a fork
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 64:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.export(batch)
+            except Exception:
+                logger.exception("Trace export failed")
+
+    def export(self, traces: List[Trace]) -> None:
+        document = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", settings.TRACING_SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [span.to_otlp() for trace in traces for span in trace.spans],
+                }],
+            }]
+        }
+        payload = json.dumps(document, separators=(",", ":"))
+        if settings.TRACING_EXPORT_PATH:
+            with open(settings.TRACING_EXPORT_PATH, "a", encoding="utf-8") as fh:
+                fh.write(payload + "\n")
+        if settings.TRACING_OTLP_ENDPOINT:
+            request = urllib.request.Request(
+                settings.TRACING_OTLP_ENDPOINT,
+                data=payload.encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+
+exporter = _Exporter()
+
+
+# Request instrumentation
+
+
+def _parse_traceparent(header: str):
+    """Return (trace_id, parent_span_id, sampled) from a W3C traceparent header"""
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None, False
+    return parts[1], parts[2], parts[3] == "01"
+
+
+class TracingMiddleware:
+    """Open a server span per request, add X-Trace-Id and export the trace if kept"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id, sampled = None, None, False
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                trace_id, parent_id, sampled = _parse_traceparent(value.decode("latin-1"))
+                break
+        trace = Trace(trace_id, sampled or random.random() < settings.TRACING_SAMPLE_RATE)
+        root = Span(trace, f"{scope['method']} {scope['path']}", parent_id, SPAN_KIND_SERVER,
+                    attributes={"http.method": scope["method"], "http.target": scope["path"]})
+        trace_token = current_trace.set(trace)
+        span_token = current_span.set(root)
+        streaming = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Trace-Id", trace.trace_id)
+                streaming = headers.get("content-type", "").startswith("text/event-stream")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as exc:
+            root.error = repr(exc)
+            raise
+        finally:
+            current_span.reset(span_token)
+            current_trace.reset(trace_token)
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                root.name = f"{scope['method']} {route}"
+                root.attributes["http.route"] = route
+            root.end()
+            slow_ns = settings.TRACING_SLOW_REQUEST_MS * 1_000_000
+            # An event stream lasts as long as the client listens; its duration says nothing
+            slow = bool(slow_ns) and not streaming and root.end_ns - root.start_ns >= slow_ns
+            if slow and not trace.recording:
+                root.attributes["trace.partial"] = True
+                if route is not None and settings.TRACING_SLOW_ROUTE_SECONDS > 0:
+                    _slow_routes[route] = time.monotonic() + settings.TRACING_SLOW_ROUTE_SECONDS
+            if trace.sampled or slow:
+                exporter.submit(trace)
+
+
+def instrument_engine_tracing(engine: Engine) -> None:
+    """Record one span per SQL statement"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        trace = recording_trace()
+        span = None
+        if trace is not None:
+            parent = current_span.get()
+            span = Span(trace, "db.query", parent.span_id if parent else None, SPAN_KIND_CLIENT, attributes={
+                "db.system": engine.dialect.name,
+                "db.statement": statement[:2000],
+            })
+        conn.info.setdefault("tracing_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = conn.info["tracing_spans"].pop()
+        if span is not None:
+            span.end()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        spans = exception_context.connection.info.get("tracing_spans") if exception_context.connection else None
+        if spans:
+            span = spans.pop()
+            if span is not None:
+                span.error = repr(exception_context.original_exception)
+                span.end()
+
+
+def instrument_session_tracing(session_factory: sessionmaker) -> None:
+    """
+    Record an ``orm.query`` span per ORM statement covering SQL and hydration.
+
+    The result is consumed inside the span (``freeze()``, as in SQLAlchemy's
+    caching recipe) so building ORM objects is attributed to the query rather
+    than to whatever code iterates it later. Only in recording requests:
+    elsewhere results stream as usual (``yield_per``).
+    """
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def _do_orm_execute(orm_execute_state):
+        if recording_trace() is None or not orm_execute_state.is_select:
+            return None
+        entity = orm_execute_state.bind_mapper.class_.__name__ if orm_execute_state.bind_mapper else ""
+        kind = "relationship" if orm_execute_state.is_relationship_load else "query"
+        with start_span("orm.query", **{"orm.entity": entity, "orm.load": kind}):
+            return orm_execute_state.invoke_statement().freeze()()
+
+
+class _RouteTimings:
+    __slots__ = ("route_span", "dependencies_span", "endpoint_end_ns")
+
+    def __init__(self, route_span: Span, dependencies_span: Span) -> None:
+        self.route_span = route_span
+        self.dependencies_span = dependencies_span
+        self.endpoint_end_ns: Optional[int] = None
+
+
+_route_timings: ContextVar[Optional[_RouteTimings]] = ContextVar("route_timings", default=None)
+
+
+def _begin_endpoint(timings: Optional[_RouteTimings]):
+    """Close the dependency span and open the endpoint span"""
+    timings.dependencies_span.end()
+    span = Span(timings.route_span.trace, "endpoint", timings.route_span.span_id)
+    return span, current_span.set(span)
+
+
+def _trace_endpoint(endpoint: Callable) -> Callable:
+    if getattr(endpoint, "_traced_endpoint", False):
+        return endpoint
+
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def traced_endpoint(*args, **kwargs):
+            timings = _route_timings.get()
+            if timings is None:
+                return await endpoint(*args, **kwargs)
+            span, token = _begin_endpoint(timings)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                current_span.reset(token)
+                span.end()
+                timings.endpoint_end_ns = span.end_ns
+    else:
+        @functools.wraps(endpoint)
+        def traced_endpoint(*args, **kwargs):
+            timings = _route_timings.get()
+            if timings is None:
+                return endpoint(*args, **kwargs)
+            span, token = _begin_endpoint(timings)
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                current_span.reset(token)
+                span.end()
+                timings.endpoint_end_ns = span.end_ns
+
+    traced_endpoint._traced_endpoint = True
+    return traced_endpoint
+
+
+def _traced_response_class(response_class: type) -> type:
+    if getattr(response_class, "_traced_response", False):
+        return response_class
+
+    class TracedResponse(response_class):
+        _traced_response = True
+
+        def render(self, content: Any) -> bytes:
+            timings = _route_timings.get()
+            if timings is None:
+                return super().render(content)
+            route_span = timings.route_span
+            start_ns = time.time_ns()
+            if timings.endpoint_end_ns is not None:
+                # Between the endpoint returning and rendering, FastAPI validates
+                # and serializes the return value against the response model
+                Span(route_span.trace, "response.validate", route_span.span_id,
+                     start_ns=timings.endpoint_end_ns).end(start_ns)
+            span = Span(route_span.trace, "response.render", route_span.span_id, start_ns=start_ns)
+            try:
+                return super().render(content)
+            finally:
+                span.end()
+
+    TracedResponse.__name__ = f"Traced{response_class.__name__}"
+    return TracedResponse
+
+
+class TracedRoute(APIRoute):
+    """
+    APIRoute that splits request handling into dependency, endpoint,
+    validation and render spans. Use as ``APIRouter(route_class=TracedRoute)``.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, _trace_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+        self.response_class = _traced_response_class(response_class)
+        handler = super().get_route_handler()
+
+        async def traced_handler(request: Request) -> Response:
+            trace = current_trace.get()
+            if trace is not None and not trace.recording and _slow_routes.get(self.path, 0) > time.monotonic():
+                trace.recording = True
+            if trace is None or not trace.recording:
+                return await handler(request)
+            parent = current_span.get()
+            route_span = Span(trace, "route", parent.span_id if parent else None,
+                              attributes={"http.route": self.path})
+            dependencies_span = Span(trace, "dependencies", route_span.span_id)
+            timings = _RouteTimings(route_span, dependencies_span)
+            timings_token = _route_timings.set(timings)
+            span_token = current_span.set(dependencies_span)
+            try:
+                return await handler(request)
+            except BaseException as exc:
+                route_span.error = repr(exc)
+                raise
+            finally:
+                current_span.reset(span_token)
+                _route_timings.reset(timings_token)
+                # Requests rejected during dependency resolution never reach the endpoint
+                dependencies_span.end()
+                route_span.end()
+
+        return traced_handler
@@ -5,6 +5,7 @@ from app.core.security import generate_salt, hash_password_with_salt
 from app.models.user import User
 from app.models.customer import Customer
 from app.models.service import Service
+from app.models.location import Location
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -129,5 +130,10 @@ def init_db(db: Session) -> None:
             db.add(service)
             logger.info(f"Created service: {service_data['name']}")
     
+    # Pickup slots are booked per branch; start with one
+    if settings.PICKUP_SLOTS_ENABLED and not db.query(Location.id).first():
+        db.add(Location(name="Main branch", address="Nairobi", phone=""))
+        logger.info("Created location: Main branch")
+    
     db.commit()
     logger.info("Database initialization completed")
\ No newline at end of file
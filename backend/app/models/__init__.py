@@ -1,19 +1,39 @@
-from app.models.user import User
+from app.models.user import User, UserCount, UserRegistrationDay, TokenRevocation
 from app.models.customer import Customer
 from app.models.service import Service
-from app.models.order import Order, OrderStatusHistory, OrderReview
+from app.models.order import Order, OrderStatusHistory, OrderReview, OrderEvent, OrderTombstone
 from app.models.location import Location
+from app.models.pickup_slot import PickupSlot
+from app.models.rate_limit import RateLimitCounter
+from app.models.idempotency import IdempotencyKey
+from app.models.outbox import OutboxEvent, OutboxConsumer
+from app.models.notification import EmailNotification
+from app.models.archive import ArchivedOrder, ArchivedOrderStatusHistory, ArchivedOrderReview
 
 # Import Base for alembic
 from app.core.database import Base
 
 __all__ = [
     "User",
+    "UserCount",
+    "UserRegistrationDay",
+    "TokenRevocation",
     "Customer", 
     "Service",
     "Order",
     "OrderStatusHistory", 
     "OrderReview",
+    "OrderEvent",
+    "OrderTombstone",
     "Location",
+    "PickupSlot",
+    "RateLimitCounter",
+    "IdempotencyKey",
+    "OutboxEvent",
+    "OutboxConsumer",
+    "EmailNotification",
+    "ArchivedOrder",
+    "ArchivedOrderStatusHistory",
+    "ArchivedOrderReview",
     "Base"
 ]
\ No newline at end of file
@@ -0,0 +1,66 @@
+from sqlalchemy import Column, Integer, String, Text, Float, Date, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+from app.core.database import Base
+
+# Cold storage for finished orders (see app.services.archive). Columns match
+# the hot tables so rows move with INSERT ... SELECT and read back through the
+# same response schemas; keep them in step when the hot tables change.
+
+class ArchivedOrder(Base):
+    __tablename__ = "orders_archive"
+
+    id = Column(Integer, primary_key=True)  # same id as in orders
+    order_number = Column(String(20), nullable=False, index=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    estimated_weight = Column(Float, nullable=False)
+    actual_weight = Column(Float, nullable=True)
+    total_price = Column(Float, nullable=False)
+    final_price = Column(Float, nullable=True)
+    status = Column(String(20), nullable=False)
+    pickup_date = Column(Date, nullable=False)
+    pickup_time = Column(String(20), nullable=False)
+    pickup_slot_id = Column(Integer, ForeignKey("pickup_slots.id"), nullable=True)
+    delivery_date = Column(Date, nullable=True)
+    service_options = Column(String(20), nullable=True)
+    special_instructions = Column(Text, nullable=True)
+    customer_notes = Column(Text, nullable=True)
+    staff_notes = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), index=True)
+    updated_at = Column(DateTime(timezone=True))
+    version = Column(Integer, nullable=False, server_default="1")
+    archived_at = Column(DateTime(timezone=True), nullable=False)
+
+    # Relationships
+    customer = relationship("Customer")
+    service = relationship("Service")
+    status_history = relationship("ArchivedOrderStatusHistory", order_by="ArchivedOrderStatusHistory.id")
+    reviews = relationship("ArchivedOrderReview")
+
+    def __repr__(self):
+        return f"<ArchivedOrder(id={self.id}, number='{self.order_number}', status='{self.status}')>"
+
+class ArchivedOrderStatusHistory(Base):
+    __tablename__ = "order_status_history_archive"
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey("orders_archive.id"), nullable=False, index=True)
+    status = Column(String(20), nullable=False)
+    timestamp = Column(DateTime(timezone=True))
+    notes = Column(Text, nullable=True)
+    updated_by = Column(String(100), nullable=True)
+
+    def __repr__(self):
+        return f"<ArchivedOrderStatusHistory(order_id={self.order_id}, status='{self.status}')>"
+
+class ArchivedOrderReview(Base):
+    __tablename__ = "order_reviews_archive"
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey("orders_archive.id"), nullable=False, index=True)
+    rating = Column(Integer, nullable=False)
+    comment = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return f"<ArchivedOrderReview(order_id={self.order_id}, rating={self.rating})>"
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, Text, Float, LargeBinary, UniqueConstraint
+from app.core.database import Base
+
+class IdempotencyKey(Base):
+    """A write request made with an Idempotency-Key header and, once finished, its response"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("owner", "key", name="uq_idempotency_keys_owner_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner = Column(String(100), nullable=False)  # username the key belongs to
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)  # sha256 of method, path and body
+    status = Column(String(20), nullable=False, default="in_progress")  # in_progress, completed
+    response_status = Column(Integer, nullable=True)
+    response_headers = Column(Text, nullable=True)  # JSON list of [name, value]
+    response_body = Column(LargeBinary, nullable=True)
+    locked_at = Column(Float, nullable=False)  # unix time the current execution started
+    expires_at = Column(Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey(owner='{self.owner}', key='{self.key}', status='{self.status}')>"
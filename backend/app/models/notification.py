@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, Float
+from app.core.database import Base
+
+class EmailNotification(Base):
+    """An order email the notification worker sent (or the mail server refused)"""
+    __tablename__ = "email_notifications"
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, nullable=False, index=True)
+    event_id = Column(Integer, nullable=False)  # outbox event that triggered it
+    status = Column(String(20), nullable=False)  # order status the email announced
+    template = Column(String(50), nullable=False)
+    recipient = Column(String(100), nullable=False)
+    result = Column(String(20), nullable=False)  # sent or rejected
+    sent_at = Column(Float, nullable=False)  # unix time
+
+    def __repr__(self):
+        return f"<EmailNotification(order_id={self.order_id}, status='{self.status}', result='{self.result}')>"
@@ -1,10 +1,48 @@
-from sqlalchemy import Column, Integer, String, Text, Float, Date, DateTime, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, Text, Float, Date, DateTime, ForeignKey, Boolean, Index, event, update
+from sqlalchemy.orm import object_session, relationship
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.sql import func
 from app.core.database import Base
 
+# In workflow order
+ORDER_STATUSES = [
+    "placed", "confirmed", "collected", "washing",
+    "ironing", "ready", "out_for_delivery", "delivered", "cancelled"
+]
+# Orders still in the workflow
+OPEN_ORDER_STATUSES = [status for status in ORDER_STATUSES if status not in ("delivered", "cancelled")]
+
+# Statuses an order may move to from each status. Washing or ironing can be
+# skipped for orders that only need the other; a failed delivery goes back
+# to ready. Delivered and cancelled are final.
+ORDER_TRANSITIONS = {
+    "placed": ("confirmed", "cancelled"),
+    "confirmed": ("collected", "cancelled"),
+    "collected": ("washing", "ironing", "cancelled"),
+    "washing": ("ironing", "ready"),
+    "ironing": ("ready",),
+    "ready": ("out_for_delivery",),
+    "out_for_delivery": ("delivered", "ready"),
+    "delivered": (),
+    "cancelled": (),
+}
+
+def can_transition(old_status: str, new_status: str) -> bool:
+    return new_status in ORDER_TRANSITIONS.get(old_status, ())
+
+def utcnow() -> datetime:
+    # Set in Python rather than by the database: microsecond precision on
+    # SQLite too, which delta sync relies on to order changes
+    return datetime.now(timezone.utc)
+
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Delta sync: changes after a watermark, in (updated_at, id) order
+        Index("ix_orders_updated_at_id", "updated_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_number = Column(String(20), unique=True, nullable=False, index=True)
@@ -17,13 +55,22 @@ class Order(Base):
     status = Column(String(20), default="placed", nullable=False)
     pickup_date = Column(Date, nullable=False)
     pickup_time = Column(String(20), nullable=False)
+    pickup_slot_id = Column(Integer, ForeignKey("pickup_slots.id"), nullable=True)  # the booked capacity, released on cancellation
     delivery_date = Column(Date, nullable=True)
     service_options = Column(String(20), nullable=True)  # washing, ironing, both
     special_instructions = Column(Text, nullable=True)
     customer_notes = Column(Text, nullable=True)
     staff_notes = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)  # also bumped by new history rows and reviews
+    version = Column(Integer, nullable=False, server_default="1")  # ETag; bumped by every UPDATE of the row
+    
+    __mapper_args__ = {
+        # created_at comes back in the INSERT's RETURNING instead of a later SELECT
+        "eager_defaults": True,
+        # Each UPDATE is made conditional on the version that was read (UPDATE ... WHERE version = ?)
+        "version_id_col": version,
+    }
     
     # Relationships
     customer = relationship("Customer", back_populates="orders")
@@ -36,6 +83,7 @@ class Order(Base):
 
 class OrderStatusHistory(Base):
     __tablename__ = "order_status_history"
+    __mapper_args__ = {"eager_defaults": True}  # timestamp, from RETURNING
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
@@ -63,4 +111,57 @@ class OrderReview(Base):
     order = relationship("Order", back_populates="reviews")
     
     def __repr__(self):
-        return f"<OrderReview(order_id={self.order_id}, rating={self.rating})>"
\ No newline at end of file
+        return f"<OrderReview(order_id={self.order_id}, rating={self.rating})>"
+
+class OrderTombstone(Base):
+    """An order removed from the orders table, reported to delta sync clients"""
+    __tablename__ = "order_tombstones"
+    
+    order_id = Column(Integer, primary_key=True)
+    order_number = Column(String(20), nullable=False)
+    customer_id = Column(Integer, nullable=False, index=True)
+    reason = Column(String(20), nullable=False)  # archived, deleted
+    removed_at = Column(DateTime(timezone=True), nullable=False, default=utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<OrderTombstone(order_id={self.order_id}, reason='{self.reason}')>"
+
+class OrderEvent(Base):
+    """A change to an order, kept briefly for live streams and their resumption"""
+    __tablename__ = "order_events"
+    
+    id = Column(Integer, primary_key=True)  # SSE event id
+    order_id = Column(Integer, nullable=False, index=True)  # no FK: the log is append-only and may outlive the order row
+    event = Column(String(30), nullable=False)  # order.status, order.weight
+    data = Column(Text, nullable=False)  # compact JSON sent to clients
+    created_at = Column(Float, nullable=False, index=True)  # unix time
+    
+    def __repr__(self):
+        return f"<OrderEvent(id={self.id}, order_id={self.order_id}, event='{self.event}')>"
+
+def _touch_order(mapper, connection, target):
+    """A new history row or review changes the order as clients see it"""
+    now = utcnow()
+    connection.execute(
+        update(Order.__table__).where(Order.__table__.c.id == target.order_id).values(updated_at=now)
+    )
+    # Keep the order in step if it is loaded, so a response built from it shows the new time
+    session = object_session(target)
+    order = session.identity_map.get(session.identity_key(Order, target.order_id)) if session else None
+    if order is not None:
+        set_committed_value(order, "updated_at", now)
+
+def _record_tombstone(mapper, connection, target):
+    connection.execute(
+        OrderTombstone.__table__.insert().values(
+            order_id=target.id,
+            order_number=target.order_number,
+            customer_id=target.customer_id,
+            reason="deleted",
+            removed_at=utcnow(),
+        )
+    )
+
+event.listen(OrderStatusHistory, "after_insert", _touch_order)
+event.listen(OrderReview, "after_insert", _touch_order)
+event.listen(Order, "after_delete", _record_tombstone)
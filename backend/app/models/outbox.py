@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, Text, Float
+from app.core.database import Base
+
+class OutboxEvent(Base):
+    """A domain event written in the same transaction as the change it describes"""
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True)  # delivery order
+    topic = Column(String(50), nullable=False)  # e.g. order.created, order.status_changed
+    aggregate_id = Column(Integer, nullable=True)  # e.g. the order id
+    payload = Column(Text, nullable=False)  # JSON
+    created_at = Column(Float, nullable=False, index=True)  # unix time
+
+    def __repr__(self):
+        return f"<OutboxEvent(id={self.id}, topic='{self.topic}')>"
+
+class OutboxConsumer(Base):
+    """Delivery position of one outbox handler, and the lease of the worker delivering to it"""
+    __tablename__ = "outbox_consumers"
+
+    name = Column(String(100), primary_key=True)
+    last_event_id = Column(Integer, nullable=False, default=0)  # every event up to this one is delivered
+    attempts = Column(Integer, nullable=False, default=0)  # failed attempts at the next event
+    retry_at = Column(Float, nullable=False, default=0)  # unix time of the next attempt after a failure
+    last_error = Column(Text, nullable=True)
+    locked_by = Column(String(100), nullable=True)  # host:pid holding the lease
+    locked_until = Column(Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<OutboxConsumer(name='{self.name}', last_event_id={self.last_event_id})>"
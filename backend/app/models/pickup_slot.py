@@ -0,0 +1,28 @@
+from sqlalchemy import CheckConstraint, Column, Integer, String, Date, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.core.database import Base
+
+class PickupSlot(Base):
+    """
+    One pickup window on one day at one branch. Rows are created when first
+    booked or when capacity is set; ``booked`` only changes through
+    conditional UPDATEs (see app.services.pickup_slots)
+    """
+    __tablename__ = "pickup_slots"
+    __table_args__ = (
+        # Also the index availability queries read: one branch, a range of dates
+        UniqueConstraint("location_id", "pickup_date", "pickup_time", name="uq_pickup_slots_location_date_time"),
+        CheckConstraint("booked >= 0", name="ck_pickup_slots_booked"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    location_id = Column(Integer, ForeignKey("locations.id"), nullable=False)
+    pickup_date = Column(Date, nullable=False)
+    pickup_time = Column(String(20), nullable=False)  # window: morning, afternoon, evening
+    capacity = Column(Integer, nullable=False)
+    booked = Column(Integer, nullable=False, default=0)  # may exceed capacity if capacity is lowered later
+
+    location = relationship("Location")
+
+    def __repr__(self):
+        return f"<PickupSlot(location_id={self.location_id}, date={self.pickup_date}, time='{self.pickup_time}', booked={self.booked}/{self.capacity})>"
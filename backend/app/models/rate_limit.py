@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, Float
+from app.core.database import Base
+
+class RateLimitCounter(Base):
+    """Request count for one rate-limit key in one fixed window (shared rate-limit backend)"""
+    __tablename__ = "rate_limit_counters"
+
+    key = Column(String(255), primary_key=True)
+    window = Column(Integer, primary_key=True)  # window start / period
+    count = Column(Integer, nullable=False, default=0)
+    expires_at = Column(Float, nullable=False, index=True)  # unix time after which the row is unused
+
+    def __repr__(self):
+        return f"<RateLimitCounter(key='{self.key}', window={self.window}, count={self.count})>"
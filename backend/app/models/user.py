@@ -1,4 +1,7 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text
+from datetime import date, datetime, timezone
+from typing import Optional
+from sqlalchemy import Boolean, Column, Integer, String, Date, DateTime, Float, Text, event, inspect
+from sqlalchemy.orm import object_session
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -21,4 +24,91 @@ class User(Base):
     customer = relationship("Customer", back_populates="user", uselist=False)
     
     def __repr__(self):
-        return f"<User(id={self.id}, username='{self.username}', role='{self.role}')>"
\ No newline at end of file
+        return f"<User(id={self.id}, username='{self.username}', role='{self.role}')>"
+
+class UserCount(Base):
+    """Users per role and active flag, kept current as users change (see app.services.user_stats)"""
+    __tablename__ = "user_counts"
+    
+    role = Column(String(20), primary_key=True)
+    is_active = Column(Boolean, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<UserCount(role='{self.role}', is_active={self.is_active}, count={self.count})>"
+
+class UserRegistrationDay(Base):
+    """Users per day of creation (UTC), for recent registration counts"""
+    __tablename__ = "user_registration_days"
+    
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<UserRegistrationDay(day={self.day}, count={self.count})>"
+
+class TokenRevocation(Base):
+    """Access tokens of ``user_id`` issued before ``revoked_at`` are no longer accepted (see app.core.revocation)"""
+    __tablename__ = "token_revocations"
+    
+    id = Column(Integer, primary_key=True)  # read order for the workers' revocation sets
+    user_id = Column(Integer, nullable=False)
+    revoked_at = Column(Float, nullable=False, index=True)  # unix time
+    
+    def __repr__(self):
+        return f"<TokenRevocation(user_id={self.user_id}, revoked_at={self.revoked_at})>"
+
+def _day(created_at: Optional[datetime]) -> date:
+    if created_at is None:
+        return datetime.now(timezone.utc).date()
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date()
+
+def count_users(connection, role: str, is_active: bool, delta: int, created_at: Optional[datetime] = None, registered: bool = False) -> None:
+    """
+    Add ``delta`` to the user counters in the caller's transaction; with
+    ``registered``, to the registrations on the day of ``created_at`` too
+    """
+    from app.core.database import dialect_insert
+
+    counts = UserCount.__table__
+    connection.execute(
+        dialect_insert(counts)
+        .values(role=role, is_active=bool(is_active), count=delta)
+        .on_conflict_do_update(index_elements=[counts.c.role, counts.c.is_active], set_={"count": counts.c.count + delta})
+    )
+    if registered:
+        days = UserRegistrationDay.__table__
+        connection.execute(
+            dialect_insert(days)
+            .values(day=_day(created_at), count=delta)
+            .on_conflict_do_update(index_elements=[days.c.day], set_={"count": days.c.count + delta})
+        )
+
+def _user_inserted(mapper, connection, target):
+    count_users(connection, target.role or "customer", target.is_active is not False, 1, target.created_at, registered=True)
+
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    role, is_active = state.attrs.role.history, state.attrs.is_active.history
+    if not (role.has_changes() or is_active.has_changes()):
+        return
+    old_role = role.deleted[0] if role.deleted else target.role
+    old_active = is_active.deleted[0] if is_active.deleted else target.is_active
+    count_users(connection, old_role, old_active, -1)
+    count_users(connection, target.role, target.is_active, 1)
+    # Stateless access tokens carry the role and active flag; stop accepting the old ones
+    from app.core.revocation import revoke_user_tokens
+    revoke_user_tokens(connection, object_session(target), target.id)
+
+def _user_deleted(mapper, connection, target):
+    # created_at is only known if it was loaded; otherwise reconciliation fixes the day's count
+    created_at = inspect(target).dict.get("created_at")
+    count_users(connection, target.role, target.is_active, -1, created_at, registered=created_at is not None)
+    from app.core.revocation import revoke_user_tokens
+    revoke_user_tokens(connection, object_session(target), target.id)
+
+event.listen(User, "after_insert", _user_inserted)
+event.listen(User, "after_update", _user_updated)
+event.listen(User, "after_delete", _user_deleted)
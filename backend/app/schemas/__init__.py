@@ -1,4 +1,4 @@
-from app.schemas.user import User, UserCreate, UserUpdate, Token, TokenData
+from app.schemas.user import User, UserCreate, UserUpdate, Token, TokenData, TokenRefresh
 from app.schemas.customer import Customer, CustomerCreate, CustomerUpdate
 from app.schemas.service import Service, ServiceCreate, ServiceUpdate
 from app.schemas.order import (
@@ -13,7 +13,7 @@ from app.schemas.order import (
 )
 
 __all__ = [
-    "User", "UserCreate", "UserUpdate", "Token", "TokenData",
+    "User", "UserCreate", "UserUpdate", "Token", "TokenData", "TokenRefresh",
     "Customer", "CustomerCreate", "CustomerUpdate",
     "Service", "ServiceCreate", "ServiceUpdate", 
     "Order", "OrderCreate", "OrderUpdate", "OrderStatusUpdate", "OrderWeightUpdate",
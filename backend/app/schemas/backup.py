@@ -0,0 +1,15 @@
+from typing import Optional, Dict, Union
+from pydantic import BaseModel
+from datetime import datetime
+
+class BackupSnapshot(BaseModel):
+    name: str
+    engine: str  # sqlite or postgresql
+    created_at: datetime
+    size: int  # bytes, compressed
+    sha256: Optional[str] = None
+    seconds: Optional[float] = None  # time taken to copy and compress
+    tables: Optional[Union[Dict[str, int], int]] = None  # SQLite: rows per table; PostgreSQL: tables dumped
+    verified: bool
+    verified_at: Optional[datetime] = None
+    error: Optional[str] = None  # why verification failed
@@ -0,0 +1,94 @@
+from functools import lru_cache
+from typing import Optional, List
+from pydantic import BaseModel, Field, field_validator
+from datetime import datetime, date
+from email_validator import EmailNotValidError, validate_email
+from email_validator.syntax import validate_email_local_part
+
+from app.models.order import ORDER_STATUSES
+
+@lru_cache(maxsize=1024)
+def _email_domain(domain: str) -> str:
+    return validate_email(f"postmaster@{domain}", check_deliverability=False).domain
+
+def check_email(address: str) -> str:
+    """
+    Same check as ``EmailStr``, with the domain part (the expensive IDNA
+    step) validated once per domain rather than once per row
+    """
+    local, at, domain = address.strip().rpartition("@")
+    if not at:
+        raise ValueError("value is not a valid email address: an email address must have an @-sign")
+    try:
+        return f"{validate_email_local_part(local)['local_part']}@{_email_domain(domain)}"
+    except EmailNotValidError as exc:
+        raise ValueError(f"value is not a valid email address: {exc}") from None
+
+class CustomerImportRow(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    phone: str = Field(..., min_length=1, max_length=15)
+    email: Optional[str] = Field(None, max_length=100)
+    address: Optional[str] = None
+    location_name: Optional[str] = Field(None, max_length=50)
+    location_lat: Optional[float] = None
+    location_lng: Optional[float] = None
+    username: Optional[str] = Field(None, min_length=3, max_length=50)  # default: derived from the phone number
+    created_at: Optional[datetime] = None  # customer since; default: now
+
+    @field_validator("phone")
+    @classmethod
+    def normalise_phone(cls, v: str) -> str:
+        return v.replace(" ", "").replace("-", "")
+
+    @field_validator("email")
+    @classmethod
+    def valid_email(cls, v: Optional[str]) -> Optional[str]:
+        return check_email(v) if v else v
+
+class OrderImportRow(BaseModel):
+    # Customer by phone number or id, service by name or id
+    customer_phone: Optional[str] = None
+    customer_id: Optional[int] = None
+    service: Optional[str] = None
+    service_id: Optional[int] = None
+    order_number: Optional[str] = Field(None, max_length=20)  # default: generated
+    status: str = "delivered"
+    estimated_weight: float = Field(..., gt=0)
+    actual_weight: Optional[float] = Field(None, gt=0)
+    total_price: Optional[float] = Field(None, ge=0)  # default: priced like a new order
+    final_price: Optional[float] = Field(None, ge=0)  # default: priced from actual_weight
+    pickup_date: date
+    pickup_time: str = Field("09:00", max_length=20)
+    delivery_date: Optional[date] = None
+    service_options: Optional[str] = Field(None, max_length=20)
+    special_instructions: Optional[str] = None
+    customer_notes: Optional[str] = None
+    staff_notes: Optional[str] = None
+    created_at: Optional[datetime] = None  # default: the pickup date
+
+    @field_validator("customer_phone")
+    @classmethod
+    def normalise_phone(cls, v: Optional[str]) -> Optional[str]:
+        return v.replace(" ", "").replace("-", "") if v else v
+
+    @field_validator("status")
+    @classmethod
+    def known_status(cls, v: str) -> str:
+        if v not in ORDER_STATUSES:
+            raise ValueError(f"must be one of {', '.join(ORDER_STATUSES)}")
+        return v
+
+class ImportRowError(BaseModel):
+    row: int  # CSV record or NDJSON line number, counting the header as row 1
+    error: str
+
+class ImportReport(BaseModel):
+    kind: str
+    format: str
+    rows: int
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+    errors_truncated: bool  # more rows failed than are listed
+    seconds: float
+    rows_per_second: float
@@ -41,7 +41,7 @@ class OrderBase(BaseModel):
     special_instructions: Optional[str] = None
 
 class OrderCreate(OrderBase):
-    pass
+    location_id: Optional[int] = None  # branch whose pickup slot is booked; default: the main branch
 
 class OrderUpdate(BaseModel):
     service_id: Optional[int] = None
@@ -71,10 +71,12 @@ class OrderInDB(OrderBase):
     final_price: Optional[float] = None
     status: str
     delivery_date: Optional[date] = None
+    pickup_slot_id: Optional[int] = None
     customer_notes: Optional[str] = None
     staff_notes: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
+    version: int = 1  # also the ETag; send it back as If-Match to update the order
     
     class Config:
         from_attributes = True
@@ -83,4 +85,16 @@ class Order(OrderInDB):
     customer: Optional[Customer] = None
     service: Optional[Service] = None
     status_history: Optional[List[OrderStatusHistory]] = None
-    reviews: Optional[List[OrderReview]] = None
\ No newline at end of file
+    reviews: Optional[List[OrderReview]] = None
+
+class OrderTombstone(BaseModel):
+    id: int
+    order_number: str
+    reason: str  # cancelled, archived, deleted
+    removed_at: datetime
+
+class OrderSync(BaseModel):
+    changed: List[Order]
+    removed: List[OrderTombstone]
+    sync_token: str  # pass back as ?sync_token= on the next sync
+    has_more: bool  # another page is available right away
@@ -0,0 +1,34 @@
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from datetime import date
+
+class PickupWindowAvailability(BaseModel):
+    pickup_time: str  # window, as sent in OrderCreate.pickup_time
+    capacity: int
+    booked: int
+    remaining: int
+
+class PickupDayAvailability(BaseModel):
+    pickup_date: date
+    windows: List[PickupWindowAvailability]
+
+class PickupAvailability(BaseModel):
+    location_id: int
+    days: List[PickupDayAvailability]
+
+class PickupSlotCapacityUpdate(BaseModel):
+    location_id: Optional[int] = None  # default: the main branch
+    pickup_date: date
+    pickup_time: str
+    capacity: int = Field(..., ge=0)
+
+class PickupSlot(BaseModel):
+    id: int
+    location_id: int
+    pickup_date: date
+    pickup_time: str
+    capacity: int
+    booked: int
+    
+    class Config:
+        from_attributes = True
@@ -43,6 +43,11 @@ class User(UserInDB):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None  # with STATELESS_AUTH
+    expires_in: Optional[int] = None  # seconds the access token is valid
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
\ No newline at end of file
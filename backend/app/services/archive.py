@@ -0,0 +1,202 @@
+"""
+Archival of finished orders.
+
+Orders delivered or cancelled more than ``ARCHIVE_AFTER_MONTHS`` ago move,
+with their status history and reviews, from the hot tables to
+``orders_archive``, ``order_status_history_archive`` and
+``order_reviews_archive``. Each batch of ``ARCHIVE_BATCH_SIZE`` orders is
+copied and deleted in one short transaction, so requests are never blocked
+for long, and leaves a tombstone (reason ``archived``) for delta sync
+clients. Lists, searches and the dashboard then only touch recent orders;
+order detail, status history and reports read the archive too when asked
+with ``include_archived=true``.
+
+With ``ARCHIVE_ENABLED`` every worker runs the job every
+``ARCHIVE_INTERVAL_HOURS``; it can also be run by hand::
+
+    python -m app.services.archive [--months 12] [--batch-size 500] [--dry-run]
+"""
+import argparse
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.models.archive import ArchivedOrder, ArchivedOrderReview, ArchivedOrderStatusHistory
+from app.models.order import Order, OrderReview, OrderStatusHistory, OrderTombstone, utcnow
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("delivered", "cancelled")
+
+
+def orders_with_archive():
+    """
+    ``Order`` aliased to the union of hot and archived orders.
+
+    Use it in place of ``Order`` in queries that must see every order, such
+    as lifetime totals and reports over old date ranges.
+    """
+    columns = [column.name for column in Order.__table__.columns]
+    archived = ArchivedOrder.__table__
+    union = union_all(
+        select(*[Order.__table__.c[name] for name in columns]),
+        select(*[archived.c[name] for name in columns]),
+    ).subquery("all_orders")
+    return aliased(Order, union, name="all_orders")
+
+
+def order_source(include_archived: bool):
+    """``Order``, or with ``include_archived`` every order including archived ones"""
+    return orders_with_archive() if include_archived else Order
+
+
+def _copy(conn, source, target, where, **extra) -> None:
+    """INSERT INTO target SELECT the columns both tables share FROM source WHERE ..."""
+    names = [column.name for column in source.__table__.columns]
+    values = [source.__table__.c[name] for name in names] + [literal(value) for value in extra.values()]
+    conn.execute(
+        target.__table__.insert().from_select(names + list(extra), select(*values).where(where))
+    )
+
+
+def archive_batch(conn, cutoff, batch_size: int) -> int:
+    """Move up to ``batch_size`` orders finished before ``cutoff``; return how many moved"""
+    order_table = Order.__table__
+    ids = conn.execute(
+        select(order_table.c.id)
+        .where(order_table.c.status.in_(FINISHED_STATUSES), order_table.c.updated_at < cutoff)
+        .order_by(order_table.c.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)  # PostgreSQL: workers running the job at once take different orders
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    now = utcnow()
+    _copy(conn, Order, ArchivedOrder, order_table.c.id.in_(ids), archived_at=now)
+    _copy(conn, OrderStatusHistory, ArchivedOrderStatusHistory, OrderStatusHistory.__table__.c.order_id.in_(ids))
+    _copy(conn, OrderReview, ArchivedOrderReview, OrderReview.__table__.c.order_id.in_(ids))
+    conn.execute(
+        OrderTombstone.__table__.insert().from_select(
+            ["order_id", "order_number", "customer_id", "reason", "removed_at"],
+            select(
+                order_table.c.id, order_table.c.order_number, order_table.c.customer_id,
+                literal("archived"), literal(now),
+            ).where(order_table.c.id.in_(ids)),
+        )
+    )
+    conn.execute(OrderReview.__table__.delete().where(OrderReview.__table__.c.order_id.in_(ids)))
+    conn.execute(OrderStatusHistory.__table__.delete().where(OrderStatusHistory.__table__.c.order_id.in_(ids)))
+    conn.execute(order_table.delete().where(order_table.c.id.in_(ids)))
+    return len(ids)
+
+
+def archive_orders(
+    months: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    stop: Optional[threading.Event] = None,
+) -> int:
+    """Archive every order finished more than ``months`` ago, a batch per transaction; return the count"""
+    from app.core.database import background_engine
+
+    months = settings.ARCHIVE_AFTER_MONTHS if months is None else months
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    cutoff = utcnow() - timedelta(days=30 * months)
+    total = 0
+    while stop is None or not stop.is_set():
+        with background_engine.begin() as conn:
+            moved = archive_batch(conn, cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+        # Let queued request writes in between batches (SQLite has one writer at a time)
+        time.sleep(settings.ARCHIVE_BATCH_PAUSE_SECONDS)
+    if total:
+        logger.info("Archived %d orders finished before %s", total, cutoff.date())
+    return total
+
+
+def count_archivable(months: Optional[int] = None) -> int:
+    from app.core.database import background_engine
+
+    months = settings.ARCHIVE_AFTER_MONTHS if months is None else months
+    cutoff = utcnow() - timedelta(days=30 * months)
+    with background_engine.connect() as conn:
+        return conn.execute(
+            select(func.count()).select_from(Order.__table__).where(
+                Order.status.in_(FINISHED_STATUSES), Order.updated_at < cutoff
+            )
+        ).scalar()
+
+
+class OrderArchiver:
+    """Background thread running ``archive_orders`` every ``ARCHIVE_INTERVAL_HOURS``"""
+
+    def __init__(self) -> None:
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="order-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        interval = settings.ARCHIVE_INTERVAL_HOURS * 3600
+        # Spread the workers' first runs out rather than start them all with the server
+        delay = random.uniform(60, min(interval, 3600))
+        while not self._stopping.wait(delay):
+            try:
+                archive_orders(stop=self._stopping)
+            except DBAPIError as exc:
+                # Typically another worker archiving the same batch on SQLite; the next run continues
+                logger.warning("Order archival stopped early: %s", exc)
+            except Exception:
+                logger.exception("Order archival failed")
+            delay = interval
+
+
+order_archiver = OrderArchiver()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move finished orders to the archive tables")
+    parser.add_argument("--months", type=int, default=settings.ARCHIVE_AFTER_MONTHS,
+                        help="archive orders finished more than this many months ago")
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only count the orders that would move")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app.core.database import engine
+    from app.models import Base
+
+    Base.metadata.create_all(bind=engine)
+    if args.dry_run:
+        print(f"{count_archivable(args.months)} orders would be archived")
+        return
+    started = time.perf_counter()
+    moved = archive_orders(args.months, args.batch_size)
+    print(f"Archived {moved} orders in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
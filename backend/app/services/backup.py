@@ -0,0 +1,473 @@
+"""
+Database snapshots.
+
+SQLite databases are copied with SQLite's online backup API,
+``BACKUP_PAGES_PER_STEP`` pages at a time with a short pause in between, so
+requests keep reading and writing while the copy runs and the result is a
+consistent image of one moment (a copy made with ``cp`` can be torn
+mid-write). The copy is gzipped into ``BACKUP_DIR``. PostgreSQL databases
+are dumped with ``pg_dump --format=custom``, which is compressed already and
+restores with ``pg_restore``.
+
+Each snapshot gets a ``.json`` manifest beside it with its checksum and, for
+SQLite, the row count of every table. With ``BACKUP_VERIFY`` a new snapshot
+is restored to a scratch file, integrity checked and compared against those
+counts (PostgreSQL: its table of contents is read back with ``pg_restore
+--list``) before it counts as good. Only the newest ``BACKUP_KEEP`` good
+snapshots are kept; snapshots that failed verification are deleted, and so,
+while verification is on, are those never verified (check a snapshot copied
+in by hand with ``verify`` before the next backup).
+
+With ``BACKUP_ENABLED`` the workers take a snapshot every
+``BACKUP_INTERVAL_HOURS``; a lock file makes sure only one runs at a time.
+Admins can also take one with ``POST /backups``, or from the command line::
+
+    python -m app.services.backup create
+    python -m app.services.backup list
+    python -m app.services.backup verify laundryconnect-20250101T020000Z.db.gz
+    python -m app.services.backup restore laundryconnect-20250101T020000Z.db.gz ./restored.db
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+from app.core.metrics import backup_last_success_timestamp, backups_total
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, scheduled backups may overlap
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SUFFIX = ".db.gz"
+POSTGRES_SUFFIX = ".dump"
+SNAPSHOT_NAME = re.compile(r"^[\w.-]+(\.db\.gz|\.dump)$")
+COPY_BUFFER_SIZE = 1 << 20
+
+_last_success: Dict[tuple, float] = {}
+backup_last_success_timestamp.add_callback(lambda: dict(_last_success))
+
+
+class BackupError(Exception):
+    pass
+
+
+class BackupBusy(BackupError):
+    """Another backup is running (in this or another worker)"""
+
+
+def _backup_dir() -> Path:
+    path = Path(settings.BACKUP_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _database_url():
+    from app.core.database import engine
+
+    return engine.url
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(COPY_BUFFER_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _backup_lock() -> Iterator[None]:
+    """Held while a snapshot is taken; raises ``BackupBusy`` if it is taken already"""
+    with open(_backup_dir() / ".backup.lock", "w") as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise BackupBusy("Another backup is running") from None
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def sqlite_online_backup(source_path: str, target_path: str, pages: int, pause: float) -> None:
+    """
+    Copy a live SQLite database ``pages`` pages per step. Between steps the
+    source is unlocked and writers carry on; if one changes a page already
+    copied, SQLite starts the copy over, so the result is always consistent.
+    """
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True, timeout=30)
+    target = sqlite3.connect(target_path)
+
+    def pause_between_steps(status: int, remaining: int, total: int) -> None:
+        if remaining and pause:
+            time.sleep(pause)
+
+    try:
+        source.backup(target, pages=pages, progress=pause_between_steps)
+    finally:
+        target.close()
+        source.close()
+
+
+def sqlite_table_counts(path: str) -> Dict[str, int]:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        tables = [
+            name for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            )
+        ]
+        return {table: conn.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+
+
+def _sqlite_integrity_error(path: str) -> Optional[str]:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return None if problems == ["ok"] else "; ".join(problems[:5])
+
+
+def _postgres_command(program: str, url) -> tuple:
+    """Connection argument and environment for a libpq program; the password goes in the environment"""
+    env = dict(os.environ)
+    if url.password:
+        env["PGPASSWORD"] = url.password
+    dbname = url.set(drivername="postgresql", password=None).render_as_string(hide_password=False)
+    return [program, f"--dbname={dbname}"], env
+
+
+def _postgres_table_entries(path: Path) -> int:
+    result = subprocess.run(
+        [settings.PG_RESTORE_PATH, "--list", str(path)], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise BackupError(f"pg_restore --list failed: {result.stderr.strip()}")
+    return sum(1 for line in result.stdout.splitlines() if " TABLE DATA " in line)
+
+
+def _manifest_path(snapshot: Path) -> Path:
+    return snapshot.with_name(snapshot.name + ".json")
+
+
+def _write_manifest(snapshot: Path, manifest: dict) -> None:
+    path = _manifest_path(snapshot)
+    part = path.with_name(path.name + ".part")
+    part.write_text(json.dumps(manifest, indent=2))
+    os.replace(part, path)
+
+
+def read_manifest(snapshot: Path) -> dict:
+    try:
+        return json.loads(_manifest_path(snapshot).read_text())
+    except (OSError, ValueError):
+        # Snapshot copied in by hand, or its manifest lost
+        stat = snapshot.stat()
+        return {
+            "name": snapshot.name,
+            "engine": "sqlite" if snapshot.name.endswith(SQLITE_SUFFIX) else "postgresql",
+            "created_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+            "size": stat.st_size,
+            "verified": False,
+        }
+
+
+def snapshot_path(name: str) -> Path:
+    """Path of the snapshot called ``name`` in ``BACKUP_DIR``; raises ``FileNotFoundError``"""
+    path = _backup_dir() / name
+    if not SNAPSHOT_NAME.match(name) or not path.is_file():
+        raise FileNotFoundError(name)
+    return path
+
+
+def list_snapshots() -> List[dict]:
+    """Manifests of the snapshots in ``BACKUP_DIR``, newest first"""
+    snapshots = [
+        path for path in _backup_dir().iterdir()
+        if path.is_file() and SNAPSHOT_NAME.match(path.name)
+    ]
+    return [read_manifest(path) for path in sorted(snapshots, key=lambda path: path.name, reverse=True)]
+
+
+def _is_good(manifest: dict, verified_only: bool) -> bool:
+    """
+    Snapshots that failed verification are never good; with ``verified_only``,
+    neither are those that were not verified
+    """
+    return bool(manifest.get("verified") or not (verified_only or manifest.get("error")))
+
+
+def _prune(keep: int, verified_only: bool) -> None:
+    """Keep the newest ``keep`` good snapshots and delete the rest, so bad ones cannot push good ones out"""
+    kept = 0
+    for manifest in list_snapshots():
+        good = _is_good(manifest, verified_only)
+        if good and kept < keep:
+            kept += 1
+            continue
+        path = _backup_dir() / manifest["name"]
+        path.unlink(missing_ok=True)
+        _manifest_path(path).unlink(missing_ok=True)
+        if good:
+            logger.info("Deleted old snapshot %s", manifest["name"])
+        else:
+            logger.warning("Deleted unusable snapshot %s: %s", manifest["name"], manifest.get("error") or "not verified")
+
+
+def verify_snapshot(path: Path) -> dict:
+    """
+    Restore ``path`` to a scratch location and check it against its
+    manifest; record and return the outcome (``verified`` and ``error``).
+    """
+    manifest = read_manifest(path)
+    error = None
+    try:
+        if manifest.get("sha256") and _sha256(path) != manifest["sha256"]:
+            raise BackupError("checksum does not match the manifest")
+        if path.name.endswith(SQLITE_SUFFIX):
+            with tempfile.TemporaryDirectory(dir=_backup_dir()) as scratch:
+                restored = os.path.join(scratch, "restored.db")
+                with gzip.open(path, "rb") as source, open(restored, "wb") as target:
+                    shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+                problem = _sqlite_integrity_error(restored)
+                if problem:
+                    raise BackupError(f"integrity check failed: {problem}")
+                counts = sqlite_table_counts(restored)
+            if manifest.get("tables") is not None and counts != manifest["tables"]:
+                different = sorted(
+                    table for table in set(counts) | set(manifest["tables"])
+                    if counts.get(table) != manifest["tables"].get(table)
+                )
+                raise BackupError(f"row counts differ from the manifest in {', '.join(different)}")
+        else:
+            entries = _postgres_table_entries(path)
+            if manifest.get("tables") is not None and entries != manifest["tables"]:
+                raise BackupError(f"{entries} table data entries, expected {manifest['tables']}")
+    except (BackupError, OSError, EOFError, sqlite3.DatabaseError) as exc:
+        error = str(exc)
+    manifest.update(
+        verified=error is None,
+        verified_at=datetime.now(timezone.utc).isoformat(),
+        error=error,
+    )
+    _write_manifest(path, manifest)
+    if error:
+        logger.error("Snapshot %s failed verification: %s", path.name, error)
+    return manifest
+
+
+def _take_sqlite_snapshot(url, target: Path) -> Dict[str, int]:
+    source = url.database
+    if not source or source == ":memory:":
+        raise BackupError("In-memory SQLite databases cannot be backed up")
+    with tempfile.TemporaryDirectory(dir=_backup_dir()) as scratch:
+        copy = os.path.join(scratch, "snapshot.db")
+        sqlite_online_backup(source, copy, settings.BACKUP_PAGES_PER_STEP, settings.BACKUP_STEP_PAUSE_SECONDS)
+        counts = sqlite_table_counts(copy)
+        with open(copy, "rb") as source_file, gzip.open(target, "wb", compresslevel=6) as target_file:
+            shutil.copyfileobj(source_file, target_file, COPY_BUFFER_SIZE)
+    return counts
+
+
+def _take_postgres_snapshot(url, target: Path) -> int:
+    command, env = _postgres_command(settings.PG_DUMP_PATH, url)
+    result = subprocess.run(
+        command + ["--format=custom", f"--file={target}"], env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise BackupError(f"pg_dump failed: {result.stderr.strip()}")
+    return _postgres_table_entries(target)
+
+
+def create_snapshot(verify: Optional[bool] = None) -> dict:
+    """Take, verify and rotate in a snapshot of the database; return its manifest"""
+    verify = settings.BACKUP_VERIFY if verify is None else verify
+    url = _database_url()
+    try:
+        with _backup_lock():
+            started = time.perf_counter()
+            created = datetime.now(timezone.utc)
+            if url.get_backend_name() == "sqlite":
+                stem, suffix = Path(url.database or "memory").stem, SQLITE_SUFFIX
+            else:
+                stem, suffix = url.database or "postgres", POSTGRES_SUFFIX
+            path = _backup_dir() / f"{stem}-{created:%Y%m%dT%H%M%SZ}{suffix}"
+            part = path.with_name(path.name + ".part")
+            try:
+                if suffix == SQLITE_SUFFIX:
+                    tables = _take_sqlite_snapshot(url, part)
+                else:
+                    tables = _take_postgres_snapshot(url, part)
+                os.replace(part, path)
+            finally:
+                part.unlink(missing_ok=True)
+            manifest = {
+                "name": path.name,
+                "engine": url.get_backend_name(),
+                "created_at": created.isoformat(),
+                "size": path.stat().st_size,
+                "sha256": _sha256(path),
+                "seconds": round(time.perf_counter() - started, 3),
+                "tables": tables,
+                "verified": False,
+            }
+            _write_manifest(path, manifest)
+            if verify:
+                manifest = verify_snapshot(path)
+            # Also clears out this snapshot if it failed
+            _prune(settings.BACKUP_KEEP, verified_only=verify)
+            if verify and not manifest["verified"]:
+                raise BackupError(f"Snapshot {path.name} failed verification: {manifest['error']}")
+    except BackupBusy:
+        raise
+    except Exception:
+        backups_total.inc("failed")
+        raise
+    backups_total.inc("ok")
+    _last_success[()] = created.timestamp()
+    logger.info("Snapshot %s taken in %.1fs (%d bytes)", path.name, manifest["seconds"], manifest["size"])
+    return manifest
+
+
+def restore_snapshot(name: str, target: Optional[str] = None, force: bool = False) -> None:
+    """
+    Restore a snapshot: SQLite snapshots to the file ``target``, PostgreSQL
+    dumps into the configured database (``pg_restore --clean``). Stop the
+    API first.
+    """
+    path = snapshot_path(name)
+    if path.name.endswith(SQLITE_SUFFIX):
+        if not target:
+            raise BackupError("Give the file to restore the SQLite snapshot to")
+        if os.path.exists(target) and not force:
+            raise BackupError(f"{target} exists; pass --force to overwrite it")
+        part = f"{target}.part"
+        with gzip.open(path, "rb") as source, open(part, "wb") as restored:
+            shutil.copyfileobj(source, restored, COPY_BUFFER_SIZE)
+        os.replace(part, target)
+        return
+    url = make_url(target) if target else _database_url()
+    command, env = _postgres_command(settings.PG_RESTORE_PATH, url)
+    result = subprocess.run(
+        command + ["--clean", "--if-exists", "--no-owner", str(path)], env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise BackupError(f"pg_restore failed: {result.stderr.strip()}")
+
+
+class BackupScheduler:
+    """Background thread taking a snapshot whenever the newest is ``BACKUP_INTERVAL_HOURS`` old"""
+
+    def __init__(self) -> None:
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        self._thread = None
+
+    @staticmethod
+    def _seconds_until_due() -> float:
+        # The schedule follows the snapshots on disk, so every worker agrees
+        # on it and restarts do not reset it
+        interval = settings.BACKUP_INTERVAL_HOURS * 3600
+        good = [manifest for manifest in list_snapshots() if _is_good(manifest, settings.BACKUP_VERIFY)]
+        if not good:
+            return 0
+        newest = datetime.fromisoformat(good[0]["created_at"]).timestamp()
+        return max(0.0, newest + interval - time.time())
+
+    def _run(self) -> None:
+        # Jitter, so workers started together do not all race for the lock
+        delay = random.uniform(30, 90)
+        while not self._stopping.wait(delay):
+            try:
+                delay = self._seconds_until_due()
+                if delay == 0:
+                    create_snapshot()
+                    delay = self._seconds_until_due()
+            except BackupBusy:
+                delay = 0
+            except Exception:
+                logger.exception("Scheduled backup failed")
+                delay = 0
+            # Re-check at least hourly; after a failure or a lost race, retry in a few minutes
+            delay = min(delay, 3600) or random.uniform(240, 360)
+
+
+backup_scheduler = BackupScheduler()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Take, list, verify and restore database snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="take a snapshot now")
+    create.add_argument("--no-verify", action="store_true")
+    commands.add_parser("list", help="list snapshots, newest first")
+    verify = commands.add_parser("verify", help="restore a snapshot to a scratch file and check it")
+    verify.add_argument("name")
+    restore = commands.add_parser("restore", help="restore a snapshot (stop the API first)")
+    restore.add_argument("name")
+    restore.add_argument("target", nargs="?",
+                         help="SQLite: file to restore to; PostgreSQL: database URL (default: DATABASE_URL)")
+    restore.add_argument("--force", action="store_true", help="overwrite an existing SQLite file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "create":
+        manifest = create_snapshot(verify=not args.no_verify)
+        print(f"{manifest['name']}: {manifest['size']} bytes in {manifest['seconds']}s, verified={manifest['verified']}")
+    elif args.command == "list":
+        for manifest in list_snapshots():
+            status = "verified" if manifest.get("verified") else manifest.get("error") or "not verified"
+            print(f"{manifest['name']}  {manifest['size']:>12} bytes  {status}")
+    elif args.command == "verify":
+        manifest = verify_snapshot(snapshot_path(args.name))
+        print("OK" if manifest["verified"] else f"FAILED: {manifest['error']}")
+        raise SystemExit(0 if manifest["verified"] else 1)
+    else:
+        try:
+            restore_snapshot(args.name, args.target, force=args.force)
+        except (BackupError, FileNotFoundError) as exc:
+            raise SystemExit(f"Restore failed: {exc}")
+        print(f"Restored {args.name}")
+
+
+if __name__ == "__main__":
+    main()
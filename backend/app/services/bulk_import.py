@@ -0,0 +1,487 @@
+"""
+Bulk import of customers and historical orders from CSV or NDJSON.
+
+Input is read as a stream and handled ``IMPORT_CHUNK_SIZE`` rows at a time.
+A chunk is validated row by row, checked against the database with one
+query per lookup (existing phones, usernames, order numbers, customers),
+and written in one transaction with one multi-row statement per table:
+executemany on SQLite and ``COPY`` on PostgreSQL. Invalid rows are reported
+with their row number and skipped; the rest of the chunk and the file are
+still imported. If the database rejects a chunk anyway (a concurrent insert
+of the same username, say), that chunk is retried row by row to find the
+offending rows.
+
+Imported customers get a login with a random, unknown password, shared by
+one import run so that bcrypt runs once rather than once per row; an admin
+sets a real password when the customer first needs to log in. Imported
+orders get a status history running from ``created_at`` (default: the
+pickup date) through each workflow step to their status, ending on the
+delivery date for delivered orders. They publish no events and send no
+emails, and count as changed at import time for delta sync.
+
+CLI::
+
+    python -m app.services.bulk_import customers customers.csv
+    python -m app.services.bulk_import orders orders.ndjson
+"""
+import argparse
+import collections
+import csv
+import io
+import itertools
+import json
+import logging
+import secrets
+import time
+from datetime import datetime, time as dtime, timedelta, timezone
+from functools import lru_cache
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select, text
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.security import generate_salt, hash_password_with_salt
+from app.models.archive import ArchivedOrder
+from app.models.customer import Customer
+from app.models.order import ORDER_STATUSES, Order, OrderStatusHistory, utcnow
+from app.models.service import Service
+from app.models.user import User, count_users
+from app.schemas.bulk_import import CustomerImportRow, ImportReport, OrderImportRow
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+# Hours between generated status history entries when no delivery date says otherwise
+TIMELINE_STEP_HOURS = 4
+
+
+class ChunkReader(io.RawIOBase):
+    """Binary file object over an iterator of byte chunks (e.g. a request body)"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            try:
+                self._pending = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def read_records(stream: BinaryIO, fmt: str) -> Iterator[Tuple[int, object]]:
+    """
+    Yield ``(row number, fields)`` for each record, or ``(row number, error
+    message)`` for records that cannot be parsed. Empty values are dropped.
+    """
+    text_stream = io.TextIOWrapper(io.BufferedReader(stream), encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text_stream)
+        for number, record in enumerate(reader, start=2):  # row 1 is the header
+            if None in record:
+                yield number, f"has {len(record[None])} more field(s) than the header"
+                continue
+            yield number, {key.strip(): value for key, value in record.items() if key and value not in ("", None)}
+    elif fmt == "ndjson":
+        for number, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield number, f"invalid JSON: {exc}"
+                continue
+            if not isinstance(record, dict):
+                yield number, "expected a JSON object"
+                continue
+            yield number, {key: value for key, value in record.items() if value not in ("", None)}
+    else:
+        raise ValueError(f"Unknown import format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+
+def _copy_rows(conn, table, rows: List[dict]) -> None:
+    """PostgreSQL COPY ... FROM STDIN of ``rows`` (all with the same keys)"""
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    # Strings are quoted, so "" stays an empty string; None is written unquoted, i.e. NULL
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+
+
+def bulk_insert(conn, table, rows: List[dict], key: Optional[str] = None) -> Optional[List[int]]:
+    """
+    Insert ``rows`` with one statement: COPY on PostgreSQL, executemany
+    elsewhere. With ``key``, the name of a unique column, return the new
+    primary keys in row order.
+    """
+    if not rows:
+        return [] if key else None
+    if conn.dialect.name == "postgresql":
+        ids = None
+        if key:
+            # COPY returns nothing, so take the ids from the sequence first
+            ids = conn.execute(
+                text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+                {"table": table.name, "count": len(rows)},
+            ).scalars().all()
+            rows = [{"id": id, **row} for id, row in zip(ids, rows)]
+        _copy_rows(conn, table, rows)
+        return ids
+    conn.execute(insert(table), rows)
+    if not key:
+        return None
+    # RETURNING in parameter order would make SQLAlchemy insert row by row
+    # on SQLite; look the ids up by the unique key instead
+    ids = dict(conn.execute(
+        select(table.c[key], table.c.id).where(table.c[key].in_([row[key] for row in rows]))
+    ).all())
+    return [ids[row[key]] for row in rows]
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+@lru_cache(maxsize=4096)  # orders in an import share few (status, dates) combinations
+def status_timeline(status: str, started: datetime, finished: Optional[datetime] = None) -> Tuple[Tuple[str, datetime], ...]:
+    """
+    Status history for an order that reached ``status``: every workflow step
+    up to it (placed -> cancelled for cancelled orders), spread evenly from
+    ``started`` to ``finished``.
+    """
+    if status == "cancelled":
+        steps = ["placed", "cancelled"]
+    else:
+        steps = ORDER_STATUSES[:ORDER_STATUSES.index(status) + 1]
+    if len(steps) == 1:
+        return ((steps[0], started),)
+    if finished is None or finished <= started:
+        finished = started + timedelta(hours=TIMELINE_STEP_HOURS * (len(steps) - 1))
+    step = timedelta(seconds=(finished - started).total_seconds() // (len(steps) - 1))
+    return tuple((name, started + step * index) for index, name in enumerate(steps[:-1])) + ((steps[-1], finished),)
+
+
+class _Importer:
+    kind = ""
+    row_model = None
+
+    def __init__(self, engine, actor: str) -> None:
+        self.engine = engine
+        self.actor = actor
+
+    def prepare(self, conn, rows: List[Tuple[int, object]], fail) -> List[tuple]:
+        """Check validated rows against the database; return what to write"""
+        raise NotImplementedError
+
+    def write(self, conn, prepared: List[tuple]) -> None:
+        raise NotImplementedError
+
+
+class CustomerImporter(_Importer):
+    kind = "customers"
+    row_model = CustomerImportRow
+
+    def __init__(self, engine, actor: str) -> None:
+        super().__init__(engine, actor)
+        self.salt = generate_salt()
+        self.password_hash = hash_password_with_salt(secrets.token_urlsafe(32), self.salt)
+        # Seen earlier in this file
+        self.phones = set()
+        self.usernames = set()
+        self.emails = set()
+
+    @staticmethod
+    def username_for(row: CustomerImportRow) -> str:
+        return row.username or "c" + "".join(ch for ch in row.phone if ch.isdigit())
+
+    def prepare(self, conn, rows, fail):
+        phones = {row.phone for _, row in rows}
+        usernames = {self.username_for(row) for _, row in rows}
+        emails = {row.email for _, row in rows if row.email}
+        existing_phones = set(conn.execute(select(Customer.phone).where(Customer.phone.in_(phones))).scalars())
+        existing_usernames = set(conn.execute(select(User.username).where(User.username.in_(usernames))).scalars())
+        existing_emails = set(conn.execute(select(User.email).where(User.email.in_(emails))).scalars()) if emails else set()
+
+        prepared = []
+        for number, row in rows:
+            username = self.username_for(row)
+            if row.phone in existing_phones or row.phone in self.phones:
+                fail(number, f"a customer with phone {row.phone} already exists")
+            elif username in existing_usernames or username in self.usernames:
+                fail(number, f"username {username} is already taken")
+            elif row.email and (row.email in existing_emails or row.email in self.emails):
+                fail(number, f"a user with email {row.email} already exists")
+            else:
+                self.phones.add(row.phone)
+                self.usernames.add(username)
+                if row.email:
+                    self.emails.add(row.email)
+                prepared.append((number, row, username))
+        return prepared
+
+    def write(self, conn, prepared):
+        now = utcnow()
+        user_ids = bulk_insert(conn, User.__table__, [
+            {
+                "username": username,
+                "email": row.email,
+                "password_hash": self.password_hash,
+                "salt": self.salt,
+                "role": "customer",
+                "is_active": True,
+                "created_at": _utc(row.created_at) if row.created_at else now,
+            }
+            for _, row, username in prepared
+        ], key="username")
+        bulk_insert(conn, Customer.__table__, [
+            {
+                "user_id": user_id,
+                "name": row.name,
+                "phone": row.phone,
+                "email": row.email,
+                "address": row.address,
+                "location_lat": row.location_lat,
+                "location_lng": row.location_lng,
+                "location_name": row.location_name,
+                "created_at": _utc(row.created_at) if row.created_at else now,
+            }
+            for user_id, (_, row, _) in zip(user_ids, prepared)
+        ])
+        # Core inserts skip the ORM events that keep the user counters current
+        days = collections.Counter(
+            (_utc(row.created_at) if row.created_at else now).astimezone(timezone.utc).date() for _, row, _ in prepared
+        )
+        for day, count in days.items():
+            count_users(conn, "customer", True, count, datetime.combine(day, dtime.min, timezone.utc), registered=True)
+
+
+class OrderImporter(_Importer):
+    kind = "orders"
+    row_model = OrderImportRow
+
+    def __init__(self, engine, actor: str) -> None:
+        super().__init__(engine, actor)
+        with engine.connect() as conn:
+            services = conn.execute(select(Service)).all()
+        self.services_by_id: Dict[int, object] = {service.id: service for service in services}
+        self.services_by_name: Dict[str, object] = {service.name.lower(): service for service in services}
+        self.order_numbers = set()
+
+    def _service(self, row: OrderImportRow):
+        if row.service_id is not None:
+            return self.services_by_id.get(row.service_id)
+        if row.service:
+            return self.services_by_name.get(row.service.strip().lower())
+        return None
+
+    def prepare(self, conn, rows, fail):
+        from app.api.v1.endpoints.orders import calculate_order_price
+
+        phones = {row.customer_phone for _, row in rows if row.customer_id is None and row.customer_phone}
+        by_phone: Dict[str, List[int]] = {}
+        if phones:
+            for id, phone in conn.execute(select(Customer.id, Customer.phone).where(Customer.phone.in_(phones))):
+                by_phone.setdefault(phone, []).append(id)
+        wanted_ids = {row.customer_id for _, row in rows if row.customer_id is not None}
+        known_ids = set(conn.execute(select(Customer.id).where(Customer.id.in_(wanted_ids))).scalars()) if wanted_ids else set()
+        numbers = {row.order_number for _, row in rows if row.order_number}
+        taken_numbers = set()
+        if numbers:
+            taken_numbers.update(conn.execute(select(Order.order_number).where(Order.order_number.in_(numbers))).scalars())
+            taken_numbers.update(conn.execute(
+                select(ArchivedOrder.order_number).where(ArchivedOrder.order_number.in_(numbers))
+            ).scalars())
+
+        now = utcnow()
+        prepared = []
+        for number, row in rows:
+            service = self._service(row)
+            if service is None:
+                fail(number, "unknown service" if row.service or row.service_id else "service or service_id is required")
+                continue
+            if row.customer_id is not None:
+                customer_id = row.customer_id if row.customer_id in known_ids else None
+            else:
+                matches = by_phone.get(row.customer_phone, [])
+                if len(matches) > 1:
+                    fail(number, f"{len(matches)} customers have phone {row.customer_phone}; use customer_id")
+                    continue
+                customer_id = matches[0] if matches else None
+            if customer_id is None:
+                fail(number, "unknown customer" if row.customer_id or row.customer_phone else "customer_phone or customer_id is required")
+                continue
+            order_number = row.order_number or f"IM{secrets.token_hex(6).upper()}"
+            if order_number in taken_numbers or order_number in self.order_numbers:
+                fail(number, f"order number {order_number} already exists")
+                continue
+            self.order_numbers.add(order_number)
+
+            started = _utc(row.created_at) if row.created_at else datetime.combine(row.pickup_date, dtime(8), timezone.utc)
+            finished = None
+            if row.status == "delivered" and row.delivery_date:
+                finished = datetime.combine(row.delivery_date, dtime(17), timezone.utc)
+            final_price = row.final_price
+            if final_price is None and row.actual_weight:
+                final_price = calculate_order_price(service, row.actual_weight)
+            order = {
+                "order_number": order_number,
+                "customer_id": customer_id,
+                "service_id": service.id,
+                "estimated_weight": row.estimated_weight,
+                "actual_weight": row.actual_weight,
+                "total_price": row.total_price if row.total_price is not None else calculate_order_price(service, row.estimated_weight),
+                "final_price": final_price,
+                "status": row.status,
+                "pickup_date": row.pickup_date,
+                "pickup_time": row.pickup_time,
+                "delivery_date": row.delivery_date,
+                "service_options": row.service_options,
+                "special_instructions": row.special_instructions,
+                "customer_notes": row.customer_notes,
+                "staff_notes": row.staff_notes,
+                "created_at": started,
+                "updated_at": now,  # new to sync clients
+            }
+            prepared.append((number, order, status_timeline(row.status, started, finished)))
+        return prepared
+
+    def write(self, conn, prepared):
+        order_ids = bulk_insert(conn, Order.__table__, [order for _, order, _ in prepared], key="order_number")
+        bulk_insert(conn, OrderStatusHistory.__table__, [
+            {
+                "order_id": order_id,
+                "status": status,
+                "timestamp": timestamp,
+                "notes": "Imported",
+                "updated_by": self.actor,
+            }
+            for order_id, (_, _, timeline) in zip(order_ids, prepared)
+            for status, timestamp in timeline
+        ])
+
+
+IMPORTERS = {importer.kind: importer for importer in (CustomerImporter, OrderImporter)}
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in exc.errors()
+    )
+
+
+def run_import(kind: str, stream: BinaryIO, fmt: str, actor: str = "import", engine=None) -> ImportReport:
+    """Import every record in ``stream``; never raises for bad rows, which are reported instead"""
+    if engine is None:
+        from app.core.database import background_engine as engine
+    if kind not in IMPORTERS:
+        raise ValueError(f"Unknown import kind {kind!r}; expected one of {', '.join(IMPORTERS)}")
+    started = time.perf_counter()
+    importer = IMPORTERS[kind](engine, actor)
+    total = imported = failed = 0
+    errors = []
+
+    def fail(number: int, message: str) -> None:
+        nonlocal failed
+        failed += 1
+        if len(errors) < settings.IMPORT_MAX_ERRORS:
+            errors.append({"row": number, "error": message})
+
+    records = read_records(stream, fmt)
+    while True:
+        chunk = list(itertools.islice(records, settings.IMPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        total += len(chunk)
+        rows = []
+        for number, record in chunk:
+            if isinstance(record, str):
+                fail(number, record)
+                continue
+            try:
+                rows.append((number, importer.row_model.model_validate(record)))
+            except ValidationError as exc:
+                fail(number, _validation_message(exc))
+        if not rows:
+            continue
+        prepared = []
+        try:
+            with engine.begin() as conn:
+                prepared = importer.prepare(conn, rows, fail)
+                importer.write(conn, prepared)
+            imported += len(prepared)
+        except IntegrityError:
+            # Something the checks did not catch; find the rows responsible one by one
+            logger.warning("Import chunk of %d %s rejected by the database; retrying row by row", len(rows), kind)
+            for item in prepared:
+                try:
+                    with engine.begin() as conn:
+                        importer.write(conn, [item])
+                    imported += 1
+                except IntegrityError as exc:
+                    fail(item[0], f"rejected by the database: {exc.orig}")
+
+    seconds = time.perf_counter() - started
+    errors.sort(key=lambda error: error["row"])
+    logger.info("Imported %d of %d %s rows in %.1fs", imported, total, kind, seconds)
+    return ImportReport(
+        kind=kind,
+        format=fmt,
+        rows=total,
+        imported=imported,
+        failed=failed,
+        errors=errors,
+        errors_truncated=failed > len(errors),
+        seconds=round(seconds, 3),
+        rows_per_second=round(total / seconds, 1) if seconds else 0.0,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import customers or historical orders from CSV or NDJSON")
+    parser.add_argument("kind", choices=sorted(IMPORTERS))
+    parser.add_argument("path", help="file to import, or - for standard input")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    from app.core.database import engine
+    from app.models import Base
+
+    Base.metadata.create_all(bind=engine)
+    if args.path == "-":
+        import sys
+
+        report = run_import(args.kind, sys.stdin.buffer, fmt, actor="cli-import")
+    else:
+        with open(args.path, "rb") as stream:
+            report = run_import(args.kind, stream, fmt, actor="cli-import")
+    for error in report.errors:
+        print(f"row {error.row}: {error.error}")
+    print(
+        f"Imported {report.imported} of {report.rows} {report.kind} rows "
+        f"({report.failed} failed) in {report.seconds}s, {report.rows_per_second:.0f} rows/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Outgoing email over a reused SMTP connection.
+
+``Mailer`` keeps one connection open between sends (reconnecting when the
+server has dropped it or it has been idle for ``SMTP_IDLE_SECONDS``) and
+spaces messages out to ``EMAIL_RATE_LIMIT_PER_MINUTE``. Templates live in
+``app/services/email_templates``: plain-text Jinja2 files whose first line
+is ``Subject: ...``, followed by a blank line and the body.
+"""
+import logging
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+from pathlib import Path
+from typing import Optional, Tuple
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+from app.core.config import settings
+from app.core.metrics import emails_sent_total, smtp_connections_total
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path(__file__).parent / "email_templates"
+
+_templates = Environment(
+    loader=FileSystemLoader(str(TEMPLATE_DIR)),
+    undefined=StrictUndefined,
+    keep_trailing_newline=True,
+    autoescape=False,  # plain text
+)
+
+# Replies meaning the server will never accept this message (bad address,
+# mailbox does not exist); anything else is worth retrying
+PERMANENT_FAILURES = range(500, 600)
+
+
+def template_exists(name: str) -> bool:
+    return (TEMPLATE_DIR / f"{name}.txt").is_file()
+
+
+def render_email(template: str, **context) -> Tuple[str, str]:
+    """Return the subject and body of ``template`` rendered with ``context``"""
+    text = _templates.get_template(f"{template}.txt").render(**context)
+    header, _, body = text.partition("\n\n")
+    if not header.startswith("Subject:"):
+        raise ValueError(f"Email template {template!r} must start with a Subject: line")
+    return header[len("Subject:"):].strip(), body
+
+
+class Mailer:
+    """Sends messages one at a time over a shared, rate-limited SMTP connection"""
+
+    def __init__(self) -> None:
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(settings.SMTP_HOST and settings.EMAILS_FROM_EMAIL)
+
+    def _connect(self) -> smtplib.SMTP:
+        port = settings.SMTP_PORT or (587 if settings.SMTP_TLS else 25)
+        smtp = smtplib.SMTP(settings.SMTP_HOST, port, timeout=settings.SMTP_TIMEOUT)
+        try:
+            if settings.SMTP_TLS:
+                smtp.starttls()
+            if settings.SMTP_USER:
+                smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD or "")
+        except BaseException:
+            smtp.close()
+            raise
+        smtp_connections_total.inc()
+        return smtp
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None and time.monotonic() - self._last_used > settings.SMTP_IDLE_SECONDS:
+            self.close()  # servers drop idle clients; start afresh rather than fail the next send
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def _throttle(self) -> None:
+        interval = 60.0 / settings.EMAIL_RATE_LIMIT_PER_MINUTE
+        now = time.monotonic()
+        if self._next_slot > now:
+            time.sleep(self._next_slot - now)
+            now = self._next_slot
+        self._next_slot = now + interval
+
+    def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+
+    def build(self, to: str, template: str, **context) -> EmailMessage:
+        subject, body = render_email(template, **context)
+        message = EmailMessage()
+        message["From"] = formataddr((settings.EMAILS_FROM_NAME or settings.PROJECT_NAME, settings.EMAILS_FROM_EMAIL))
+        message["To"] = to
+        message["Subject"] = subject
+        message["Message-ID"] = make_msgid(domain=settings.EMAILS_FROM_EMAIL.split("@")[-1])
+        message.set_content(body)
+        return message
+
+    def send(self, message: EmailMessage, template: str) -> bool:
+        """
+        Send ``message``; False if the server refused it for good.
+
+        Raises for failures worth retrying (server unreachable, temporary
+        errors), after reconnecting once if the connection had been dropped.
+        """
+        with self._lock:
+            self._throttle()
+            for attempt in (1, 2):
+                smtp = self._connection()
+                try:
+                    smtp.send_message(message)
+                except smtplib.SMTPServerDisconnected:
+                    self._smtp = None
+                    if attempt == 2:
+                        emails_sent_total.inc(template, "failed")
+                        raise
+                    continue
+                except smtplib.SMTPRecipientsRefused as exc:
+                    codes = [code for code, _ in exc.recipients.values()]
+                    if all(code in PERMANENT_FAILURES for code in codes):
+                        logger.warning("Email to %s refused: %s", message["To"], exc.recipients)
+                        emails_sent_total.inc(template, "rejected")
+                        return False
+                    emails_sent_total.inc(template, "failed")
+                    raise
+                except smtplib.SMTPSenderRefused:
+                    # Affects every message (misconfigured EMAILS_FROM_EMAIL): retry, do not drop
+                    self.close()
+                    emails_sent_total.inc(template, "failed")
+                    raise
+                except smtplib.SMTPResponseException as exc:
+                    if exc.smtp_code in PERMANENT_FAILURES:
+                        logger.warning("Email to %s refused: %s %s", message["To"], exc.smtp_code, exc.smtp_error)
+                        self._reset()
+                        emails_sent_total.inc(template, "rejected")
+                        return False
+                    self.close()
+                    emails_sent_total.inc(template, "failed")
+                    raise
+                except (smtplib.SMTPException, OSError):
+                    self.close()
+                    emails_sent_total.inc(template, "failed")
+                    raise
+                self._last_used = time.monotonic()
+                emails_sent_total.inc(template, "sent")
+                return True
+
+    def _reset(self) -> None:
+        """Clear the refused transaction so the connection can be reused"""
+        try:
+            self._smtp.rset()
+            self._last_used = time.monotonic()
+        except (smtplib.SMTPException, OSError):
+            self.close()
+
+
+mailer = Mailer()
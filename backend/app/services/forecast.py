@@ -0,0 +1,341 @@
+"""
+Order volume and workload forecasts per branch and service.
+
+Each series (orders per day, and kilograms per day, for one branch and
+service) gets an additive Holt-Winters model: an exponentially weighted
+level plus a weekly seasonal profile. The forecast for a day is the level
+plus that weekday's seasonal term; its 80% range widens with the model's
+one-day-ahead error and the distance into the future.
+
+Fitting reads the daily totals of the whole order history, archive
+included, with one GROUP BY. It then runs the smoothing recursion over the
+days for every series and every candidate pair of smoothing parameters
+at once, as NumPy arrays, and each series keeps the pair with the smallest
+one-day-ahead squared error. A day of history is one step of array
+arithmetic, however many series and candidates there are.
+
+The recursion only moves forward, so a fitted model is brought up to date
+by running the same steps over the days since it was fitted, with its
+parameters kept. Each worker keeps its models in memory. Forecast requests
+read them; the first request of a day adds yesterday (one small query).
+Every ``FORECAST_REFIT_DAYS`` days, or when a branch or service appears,
+the models are refitted from the full history and the parameters chosen
+again. That also picks up orders imported with past dates.
+
+Days are UTC calendar days of ``created_at``, like the other reports. Orders
+without a pickup slot count for the main branch. Needs NumPy. To fit and
+print the forecast::
+
+    python -m app.services.forecast [--days 14]
+"""
+import argparse
+import copy
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, literal
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.location import Location
+from app.models.pickup_slot import PickupSlot
+from app.models.service import Service
+from app.services.archive import orders_with_archive
+from app.services.pickup_slots import default_location_id
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Candidate smoothing parameters, every combination tried for every series
+LEVEL_SMOOTHING = (0.05, 0.1, 0.2, 0.3, 0.5)
+SEASON_SMOOTHING = (0.05, 0.1, 0.2, 0.3)
+SEASON_DAYS = 7
+# One-day-ahead errors of the first weeks, while the model settles, are not scored
+WARMUP_DAYS = 2 * SEASON_DAYS
+# z for an 80% range
+INTERVAL_Z = 1.2816
+METRICS = ("orders", "kg")
+
+SeriesKey = Tuple[int, int]  # (location id, service id)
+
+
+class ForecastUnavailable(RuntimeError):
+    """Forecasting needs the numpy package"""
+
+
+class DailyHistory(NamedTuple):
+    start: date
+    keys: List[SeriesKey]
+    values: "np.ndarray"  # (metric, series, day)
+
+
+def load_daily_history(
+    db: Session, since: Optional[date], until: date, keys: Optional[List[SeriesKey]] = None
+) -> Optional[DailyHistory]:
+    """
+    Orders and kilograms per series and day, for days from ``since`` (or the
+    first order) up to but excluding ``until``, as a dense array. With
+    ``keys`` the series keep that order; None if the history has other series.
+    """
+    orders = orders_with_archive()
+    day = func.date(orders.created_at)
+    location = func.coalesce(PickupSlot.location_id, literal(default_location_id(db) or 0))
+    query = (
+        db.query(
+            day.label("day"), location.label("location_id"), orders.service_id,
+            func.count(orders.id).label("orders"), func.coalesce(func.sum(orders.estimated_weight), 0).label("kg"),
+        )
+        .outerjoin(PickupSlot, PickupSlot.id == orders.pickup_slot_id)
+        .filter(orders.created_at < until)
+    )
+    if since is not None:
+        query = query.filter(orders.created_at >= since)
+    rows = query.group_by(day, location, orders.service_id).all()
+
+    # SQLite returns date() as a string, PostgreSQL as a date
+    days = [row.day if isinstance(row.day, date) else date.fromisoformat(row.day) for row in rows]
+    found = sorted({(row.location_id, row.service_id) for row in rows})
+    if keys is None:
+        keys = found
+    elif not set(found) <= set(keys):
+        return None
+    start = since or (min(days) if days else until)
+    values = np.zeros((len(METRICS), len(keys), (until - start).days))
+    if rows:
+        index = {key: i for i, key in enumerate(keys)}
+        series = np.fromiter((index[(row.location_id, row.service_id)] for row in rows), dtype=np.intp, count=len(rows))
+        offsets = np.fromiter(((d - start).days for d in days), dtype=np.intp, count=len(rows))
+        values[0, series, offsets] = [row.orders for row in rows]
+        values[1, series, offsets] = [float(row.kg) for row in rows]
+    return DailyHistory(start, keys, values)
+
+
+def smooth(
+    values: "np.ndarray", first_weekday: int, alpha: "np.ndarray", gamma: "np.ndarray",
+    level: "np.ndarray", season: "np.ndarray", sse: "np.ndarray", scored_from: int = 0,
+) -> None:
+    """
+    Run the additive Holt-Winters recursion over ``values`` (..., day),
+    updating ``level`` (...), ``season`` (..., weekday) and the squared
+    one-day-ahead errors ``sse`` (...) in place. ``alpha`` and ``gamma``
+    broadcast against ``level``, so one call fits every candidate at once.
+    """
+    for t in range(values.shape[-1]):
+        weekday = (first_weekday + t) % SEASON_DAYS
+        observed = values[..., t]
+        seasonal = season[..., weekday]
+        error = observed - (level + seasonal)
+        if t >= scored_from:
+            sse += error * error
+        level += alpha * error
+        season[..., weekday] = seasonal + gamma * (observed - level - seasonal)
+
+
+def _initial_state(values: "np.ndarray", first_weekday: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Level: mean of the first week; season: each weekday's difference from it"""
+    first_week = values[..., :SEASON_DAYS]
+    level = first_week.mean(axis=-1) if first_week.shape[-1] else np.zeros(values.shape[:-1])
+    season = np.zeros(values.shape[:-1] + (SEASON_DAYS,))
+    for t in range(first_week.shape[-1]):
+        season[..., (first_weekday + t) % SEASON_DAYS] = first_week[..., t] - level
+    return level, season
+
+
+class ForecastModel:
+    """
+    Fitted state of every series; ``advanced`` adds days, ``forecast``
+    projects them. A model is not changed once published: requests may be
+    reading it while another brings the worker's model up to date.
+    """
+
+    def __init__(self, history: DailyHistory, fitted_at: date) -> None:
+        values = history.values
+        first_weekday = history.start.weekday()
+        days = values.shape[-1]
+        self.keys = history.keys
+        self.fitted_at = fitted_at  # last full fit
+        self.fitted_through = history.start + timedelta(days=days - 1)
+        self.history_days = days
+
+        # Candidates on a leading axis: (candidate, metric, series)
+        alpha, gamma = np.meshgrid(LEVEL_SMOOTHING, SEASON_SMOOTHING, indexing="ij")
+        alpha = alpha.reshape(-1, 1, 1)
+        gamma = gamma.reshape(-1, 1, 1)
+        level, season = _initial_state(values, first_weekday)
+        candidates = alpha.shape[0]
+        level = np.repeat(level[np.newaxis], candidates, axis=0)
+        season = np.repeat(season[np.newaxis], candidates, axis=0)
+        sse = np.zeros(level.shape)
+        scored_from = min(WARMUP_DAYS, max(days - 1, 0))
+        smooth(values, first_weekday, alpha, gamma, level, season, sse, scored_from)
+
+        best = sse.argmin(axis=0)[np.newaxis]  # (1, metric, series)
+        pick = lambda array: np.take_along_axis(array, best, axis=0)[0]
+        self.alpha = pick(np.broadcast_to(alpha, sse.shape))
+        self.gamma = pick(np.broadcast_to(gamma, sse.shape))
+        self.level = pick(level)
+        self.season = np.take_along_axis(season, best[..., np.newaxis], axis=0)[0]
+        self.sse = pick(sse)
+        self.scored_days = max(days - scored_from, 0)
+
+    def advanced(self, history: DailyHistory) -> "ForecastModel":
+        """
+        A copy with the days of ``history`` added, which start the day after
+        ``fitted_through``; the parameters are kept
+        """
+        model = copy.copy(self)
+        model.level, model.season, model.sse = self.level.copy(), self.season.copy(), self.sse.copy()
+        smooth(history.values, history.start.weekday(), model.alpha, model.gamma, model.level, model.season, model.sse)
+        days = history.values.shape[-1]
+        model.fitted_through += timedelta(days=days)
+        model.history_days += days
+        model.scored_days += days
+        return model
+
+    def forecast(self, horizon: int) -> Tuple[List[date], "np.ndarray", "np.ndarray", "np.ndarray"]:
+        """Days after ``fitted_through``, and the forecast with its 80% range, each (metric, series, day)"""
+        dates = [self.fitted_through + timedelta(days=h) for h in range(1, horizon + 1)]
+        weekdays = np.array([d.weekday() for d in dates], dtype=np.intp)
+        mean = self.level[..., np.newaxis] + self.season[..., weekdays]
+        rmse = np.sqrt(self.sse / max(self.scored_days, 1))
+        # Error of an h-day-ahead level forecast grows with the level updates in between
+        steps = np.arange(horizon)
+        spread = INTERVAL_Z * rmse[..., np.newaxis] * np.sqrt(1 + steps * self.alpha[..., np.newaxis] ** 2)
+        return dates, np.maximum(mean, 0), np.maximum(mean - spread, 0), np.maximum(mean + spread, 0)
+
+
+class ForecastModels:
+    """The fitted model of this worker, brought up to date on use"""
+
+    def __init__(self) -> None:
+        self._model: Optional[ForecastModel] = None
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> ForecastModel:
+        if np is None:
+            raise ForecastUnavailable("Forecasting needs the numpy package")
+        today = datetime.now(timezone.utc).date()
+        model = self._model
+        if model is not None and model.fitted_through >= today - timedelta(days=1):
+            return model
+        # One refit at a time; meanwhile other requests keep using the current model
+        if not self._lock.acquire(blocking=model is None):
+            return model
+        try:
+            model = self._model
+            if model is None or model.fitted_through < today - timedelta(days=1):
+                self._model = model = self._refresh(db, model, today)
+            return model
+        finally:
+            self._lock.release()
+
+    def _refresh(self, db: Session, model: Optional[ForecastModel], today: date) -> ForecastModel:
+        started = time.perf_counter()
+        if model is not None and (today - model.fitted_at).days < settings.FORECAST_REFIT_DAYS:
+            history = load_daily_history(db, model.fitted_through + timedelta(days=1), today, model.keys)
+            if history is not None:
+                # Readers of the current model keep it; get() publishes the copy in one assignment
+                model = model.advanced(history)
+                logger.info(
+                    "Forecast models advanced to %s in %.3fs", model.fitted_through, time.perf_counter() - started
+                )
+                return model
+        model = ForecastModel(load_daily_history(db, None, today), fitted_at=today)
+        logger.info(
+            "Forecast models fitted: %d series over %d days in %.3fs",
+            len(model.keys), model.history_days, time.perf_counter() - started,
+        )
+        return model
+
+
+forecast_models = ForecastModels()
+
+
+def order_forecast(
+    db: Session, days: int, location_id: Optional[int] = None, service_id: Optional[int] = None
+) -> dict:
+    """Forecast per branch and service and per branch in total for the next ``days`` days"""
+    model = forecast_models.get(db)
+    dates, mean, low, high = model.forecast(days)
+    chosen = [
+        i for i, (location, service) in enumerate(model.keys)
+        if (location_id is None or location == location_id) and (service_id is None or service == service_id)
+    ]
+
+    def daily(series: List[int]) -> List[dict]:
+        # Sums of the series; the ranges are summed too, which overstates them a little
+        totals = [array[:, series].sum(axis=1) for array in (mean, low, high)]
+        return [
+            {
+                "date": d.isoformat(),
+                **{
+                    f"{metric}{suffix}": round(float(total[m, h]), 1)
+                    for m, metric in enumerate(METRICS)
+                    for suffix, total in zip(("", "_low", "_high"), totals)
+                },
+            }
+            for h, d in enumerate(dates)
+        ]
+
+    locations = sorted({model.keys[i][0] for i in chosen})
+    location_names = dict(db.query(Location.id, Location.name).all())
+    service_names = dict(db.query(Service.id, Service.name).all())
+    return {
+        "fitted_through": model.fitted_through.isoformat(),
+        "history_days": model.history_days,
+        "series": [
+            {
+                "location_id": model.keys[i][0],
+                "location_name": location_names.get(model.keys[i][0]),
+                "service_id": model.keys[i][1],
+                "service_name": service_names.get(model.keys[i][1]),
+                "days": daily([i]),
+            }
+            for i in chosen
+        ],
+        "locations": [
+            {
+                "location_id": location,
+                "location_name": location_names.get(location),
+                "days": daily([i for i in chosen if model.keys[i][0] == location]),
+            }
+            for location in locations
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fit the order forecast and print it per branch")
+    parser.add_argument("--days", type=int, default=settings.FORECAST_HORIZON_DAYS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        try:
+            forecast = order_forecast(db, args.days)
+        except ForecastUnavailable as exc:
+            raise SystemExit(str(exc))
+    finally:
+        db.close()
+    print(f"Fitted through {forecast['fitted_through']} ({forecast['history_days']} days of history)")
+    for location in forecast["locations"]:
+        print(f"\n{location['location_name'] or 'Branch'} ({location['location_id']})")
+        for day in location["days"]:
+            print(
+                f"{day['date']}  {day['orders']:>7.1f} orders ({day['orders_low']:.1f}-{day['orders_high']:.1f})"
+                f"  {day['kg']:>8.1f} kg ({day['kg_low']:.1f}-{day['kg_high']:.1f})"
+            )
+
+
+if __name__ == "__main__":
+    main()
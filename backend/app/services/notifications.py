@@ -0,0 +1,112 @@
+"""
+Order status emails to customers.
+
+Sent by an outbox consumer (see ``app.core.outbox``), so a status change
+costs the request one extra insert and no SMTP round trips. Events are held
+for ``EMAIL_DEBOUNCE_SECONDS`` and handled in batches: only the latest
+status of each order in a batch counts, and nothing is sent when it matches
+the status the customer was last emailed about. A quick
+ready -> washing -> ready correction therefore sends no second email, and a
+redelivered batch does not send duplicates.
+"""
+import logging
+import time
+from typing import Dict, List
+
+from sqlalchemy import func, insert, select
+
+from app.core.config import settings
+from app.core.outbox import OutboxMessage, consumers, outbox_handler
+from app.services.email import mailer, template_exists
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_NAME = "email-notifications"
+TOPICS = ("order.created", "order.status_changed")
+
+
+def send_order_notifications(messages: List[OutboxMessage]) -> None:
+    """Email customers about the latest status of each order in ``messages``"""
+    from app.core.database import background_engine
+    from app.models.customer import Customer
+    from app.models.notification import EmailNotification
+    from app.models.user import User
+
+    latest: Dict[int, OutboxMessage] = {}
+    for message in messages:  # in id order, so later changes win
+        latest[message.aggregate_id] = message
+    wanted = {
+        order_id: message for order_id, message in latest.items()
+        if message.payload["status"] in settings.EMAIL_NOTIFY_STATUSES
+    }
+    if not wanted:
+        return
+
+    with background_engine.connect() as conn:
+        last_sent = select(func.max(EmailNotification.id)).where(
+            EmailNotification.order_id.in_(list(wanted))
+        ).group_by(EmailNotification.order_id)
+        notified = dict(conn.execute(
+            select(EmailNotification.order_id, EmailNotification.status).where(EmailNotification.id.in_(last_sent))
+        ).all())
+        customer_ids = {message.payload["customer_id"] for message in wanted.values()}
+        recipients = {
+            row.id: row for row in conn.execute(
+                select(Customer.id, Customer.name, func.coalesce(Customer.email, User.email).label("email"))
+                .join(User, User.id == Customer.user_id)
+                .where(Customer.id.in_(customer_ids))
+            )
+        }
+
+    sent = []
+    try:
+        for order_id, message in wanted.items():
+            status = message.payload["status"]
+            if notified.get(order_id) == status:
+                continue  # already told, or the status changed and changed back
+            recipient = recipients.get(message.payload["customer_id"])
+            if recipient is None or not recipient.email:
+                continue
+            template = f"order_{status}"
+            if not template_exists(template):
+                logger.warning("No email template %s; not notifying order %s", template, order_id)
+                continue
+            email = mailer.build(
+                recipient.email, template,
+                customer_name=recipient.name,
+                project_name=settings.PROJECT_NAME,
+                **message.payload,
+            )
+            accepted = mailer.send(email, template)
+            sent.append({
+                "order_id": order_id,
+                "event_id": message.id,
+                "status": status,
+                "template": template,
+                "recipient": recipient.email,
+                "result": "sent" if accepted else "rejected",
+                "sent_at": time.time(),
+            })
+    finally:
+        # Recorded even when a later send fails, so the retry skips these
+        if sent:
+            with background_engine.begin() as conn:
+                conn.execute(insert(EmailNotification), sent)
+
+
+def install_email_notifications() -> bool:
+    """Register the notification consumer if emails are enabled; True if it was"""
+    if not settings.EMAILS_ENABLED:
+        return False
+    if not mailer.configured:
+        logger.warning("EMAILS_ENABLED is set without SMTP_HOST and EMAILS_FROM_EMAIL; order emails are disabled")
+        return False
+    if CONSUMER_NAME not in consumers:
+        outbox_handler(
+            CONSUMER_NAME,
+            topics=TOPICS,
+            batch=True,
+            batch_size=settings.EMAIL_BATCH_SIZE,
+            delay=settings.EMAIL_DEBOUNCE_SECONDS,
+        )(send_order_notifications)
+    return True
@@ -0,0 +1,221 @@
+"""
+Pickup slot capacity.
+
+Each branch (a ``locations`` row) takes a limited number of pickups per
+window per day. ``pickup_slots`` holds one row per branch, date and window
+with its capacity and how many orders booked it. A row is created with
+``PICKUP_SLOT_CAPACITY`` the first time the slot is booked, unless an admin
+set its capacity before (PUT /pickup-slots/capacity).
+
+Booking is one statement in the order's transaction, with no read first::
+
+    UPDATE pickup_slots SET booked = booked + 1
+    WHERE location_id = ? AND pickup_date = ? AND pickup_time = ? AND booked < capacity
+
+Concurrent UPDATEs of a row are serialised by the database, and the one
+that waited re-checks ``booked < capacity`` against the committed row. Of
+two requests racing for the last place one UPDATE matches no row, and that
+order is rejected with 409. Cancelling the order gives the place back.
+
+Availability for the next days is one read of a branch's slots over the
+unique index, kept per worker for ``PICKUP_AVAILABILITY_CACHE_SECONDS``.
+Bookings, cancellations and capacity changes made in this worker clear it
+as they commit; those of other workers show once the entry expires. The
+figures guide the client's choice; the UPDATE decides.
+
+To print availability::
+
+    python -m app.services.pickup_slots [--days 7] [--location-id 1]
+"""
+import argparse
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import dialect_insert
+from app.core.metrics import record_cache_lookup
+from app.models.location import Location
+from app.models.pickup_slot import PickupSlot
+
+
+class InvalidPickupSlot(ValueError):
+    """The requested slot cannot be booked at all: unknown window or branch, or a date outside the booking range"""
+
+
+class PickupSlotFull(Exception):
+    """Every place in the requested slot is taken"""
+
+
+_default_location_id: Optional[int] = None
+
+
+def default_location_id(db: Session) -> Optional[int]:
+    """The branch orders book when they name none: the first active location"""
+    global _default_location_id
+    if _default_location_id is None:
+        _default_location_id = db.query(func.min(Location.id)).filter(Location.is_active == True).scalar()
+    return _default_location_id
+
+
+def bookable_dates(today: Optional[date] = None) -> Tuple[date, date]:
+    today = today or date.today()
+    return today, today + timedelta(days=settings.PICKUP_SLOT_DAYS_AHEAD)
+
+
+def check_slot(pickup_date: date, window: str) -> None:
+    if window not in settings.PICKUP_SLOT_WINDOWS:
+        raise InvalidPickupSlot(f"Pickup time must be one of: {', '.join(settings.PICKUP_SLOT_WINDOWS)}")
+    first, last = bookable_dates()
+    if not first <= pickup_date <= last:
+        raise InvalidPickupSlot(f"Pickups can be booked from {first} to {last}")
+
+
+def reserve_pickup_slot(db: Session, location_id: Optional[int], pickup_date: date, window: str) -> int:
+    """
+    Take one place in the slot within ``db``'s transaction and return the
+    slot's id; raises PickupSlotFull or InvalidPickupSlot
+    """
+    check_slot(pickup_date, window)
+    if location_id is None:
+        raise InvalidPickupSlot("No branch takes pickups")
+    table = PickupSlot.__table__
+    reserve = (
+        update(table)
+        .where(
+            table.c.location_id == location_id, table.c.pickup_date == pickup_date, table.c.pickup_time == window,
+            table.c.booked < table.c.capacity,
+        )
+        .values(booked=table.c.booked + 1)
+        .returning(table.c.id)
+    )
+    slot_id = db.execute(reserve).scalar()
+    if slot_id is None:
+        # Either full, or nobody booked the slot yet: create it and try once more
+        if not db.query(Location.id).filter(Location.id == location_id, Location.is_active == True).first():
+            raise InvalidPickupSlot("Branch not found")
+        db.execute(
+            dialect_insert(table)
+            .values(location_id=location_id, pickup_date=pickup_date, pickup_time=window,
+                    capacity=settings.PICKUP_SLOT_CAPACITY, booked=0)
+            .on_conflict_do_nothing(index_elements=["location_id", "pickup_date", "pickup_time"])
+        )
+        slot_id = db.execute(reserve).scalar()
+    if slot_id is None:
+        raise PickupSlotFull(f"The {window} pickup slot on {pickup_date} is fully booked. Please choose another time.")
+    return slot_id
+
+
+def release_pickup_slot(db: Session, slot_id: int) -> Optional[int]:
+    """Give back a place taken by reserve_pickup_slot; returns the slot's branch"""
+    table = PickupSlot.__table__
+    return db.execute(
+        update(table)
+        .where(table.c.id == slot_id, table.c.booked > 0)
+        .values(booked=table.c.booked - 1)
+        .returning(table.c.location_id)
+    ).scalar()
+
+
+def set_slot_capacity(db: Session, location_id: int, slot_date: date, window: str, capacity: int) -> None:
+    """Create the slot with ``capacity``, or change its capacity; places already booked are kept"""
+    table = PickupSlot.__table__
+    db.execute(
+        dialect_insert(table)
+        .values(location_id=location_id, pickup_date=slot_date, pickup_time=window, capacity=capacity, booked=0)
+        .on_conflict_do_update(index_elements=["location_id", "pickup_date", "pickup_time"], set_={"capacity": capacity})
+    )
+
+
+def load_availability(db: Session, location_id: int, today: Optional[date] = None) -> Optional[List[dict]]:
+    """
+    Every bookable day of the branch with its windows, or None if there is
+    no such branch. Slots nobody booked yet have the default capacity.
+    """
+    if not db.query(Location.id).filter(Location.id == location_id).first():
+        return None
+    first, last = bookable_dates(today)
+    rows = db.execute(
+        select(PickupSlot.pickup_date, PickupSlot.pickup_time, PickupSlot.capacity, PickupSlot.booked).where(
+            PickupSlot.location_id == location_id, PickupSlot.pickup_date.between(first, last)
+        )
+    ).all()
+    slots = {(row.pickup_date, row.pickup_time): (row.capacity, row.booked) for row in rows}
+    days = []
+    for offset in range((last - first).days + 1):
+        day = first + timedelta(days=offset)
+        windows = []
+        for window in settings.PICKUP_SLOT_WINDOWS:
+            capacity, booked = slots.get((day, window), (settings.PICKUP_SLOT_CAPACITY, 0))
+            windows.append({
+                "pickup_time": window,
+                "capacity": capacity,
+                "booked": booked,
+                "remaining": max(capacity - booked, 0),
+            })
+        days.append({"pickup_date": day, "windows": windows})
+    return days
+
+
+class AvailabilityCache:
+    """Per-branch availability for all bookable days, computed once and sliced per request"""
+
+    def __init__(self) -> None:
+        # location id -> (monotonic expiry, the day it was computed on, days)
+        self._entries: Dict[int, Tuple[float, date, List[dict]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, location_id: int, days: int) -> Optional[List[dict]]:
+        today = date.today()
+        entry = self._entries.get(location_id)
+        hit = entry is not None and entry[0] > time.monotonic() and entry[1] == today
+        record_cache_lookup("pickup_availability", hit)
+        if hit:
+            return entry[2][:days]
+        loaded = load_availability(db, location_id, today)
+        if loaded is None:
+            return None
+        with self._lock:
+            self._entries[location_id] = (time.monotonic() + settings.PICKUP_AVAILABILITY_CACHE_SECONDS, today, loaded)
+        return loaded[:days]
+
+    def invalidate(self, location_id: Optional[int] = None) -> None:
+        """Call after committing a change to the branch's slots; None clears every branch"""
+        with self._lock:
+            if location_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(location_id, None)
+
+
+availability_cache = AvailabilityCache()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Print pickup slot availability")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--location-id", type=int, help="default: the first active branch")
+    args = parser.parse_args()
+
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        location_id = args.location_id or default_location_id(db)
+        days = load_availability(db, location_id, None) if location_id else None
+        if days is None:
+            raise SystemExit("Branch not found")
+        print(f"Branch {location_id}")
+        for day in days[:args.days]:
+            free = "  ".join(f"{slot['pickup_time']} {slot['remaining']}/{slot['capacity']}" for slot in day["windows"])
+            print(f"{day['pickup_date']}  {free}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
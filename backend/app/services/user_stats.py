@@ -0,0 +1,189 @@
+"""
+User statistics from maintained counters.
+
+``user_counts`` holds the number of users per role and active flag and
+``user_registration_days`` the number created per day. Both are updated in
+the same transaction as the user change (ORM events on ``User``, plus the
+bulk importer), so the admin overview reads a handful of rows however many
+users there are.
+
+Anything that changes ``users`` without going through the ORM (a manual SQL
+fix, a restore) makes the counters drift. ``reconcile_user_stats``
+recomputes them from ``users``; it runs at startup and every
+``USER_STATS_RECONCILE_HOURS`` in each worker, and by hand with::
+
+    python -m app.services.user_stats [--check]
+"""
+import argparse
+import logging
+import random
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+
+from app.core.config import settings
+from app.models.user import User, UserCount, UserRegistrationDay
+
+logger = logging.getLogger(__name__)
+
+RECENT_DAYS = 30
+# Registration days older than this are dropped; only the last RECENT_DAYS are read
+REGISTRATION_DAYS_KEPT = 60
+
+
+def user_stats(db) -> dict:
+    """The admin user overview, from the counter tables"""
+    counts = db.query(UserCount.role, UserCount.is_active, UserCount.count).all()
+    since = datetime.now(timezone.utc).date() - timedelta(days=RECENT_DAYS)
+    recent = db.query(func.coalesce(func.sum(UserRegistrationDay.count), 0)).filter(
+        UserRegistrationDay.day >= since
+    ).scalar()
+
+    def total(role: Optional[str] = None, is_active: Optional[bool] = None) -> int:
+        return sum(
+            row.count for row in counts
+            if (role is None or row.role == role) and (is_active is None or row.is_active == is_active)
+        )
+
+    return {
+        "total_users": total(),
+        "users_by_role": {
+            "customers": total(role="customer"),
+            "staff": total(role="staff"),
+            "admins": total(role="admin"),
+        },
+        "users_by_status": {
+            "active": total(is_active=True),
+            "inactive": total(is_active=False),
+        },
+        "recent_registrations": recent,
+    }
+
+
+def _stored(conn) -> Tuple[Dict[tuple, int], Dict[date, int]]:
+    counts = {(row.role, bool(row.is_active)): row.count for row in conn.execute(select(UserCount.__table__))}
+    days = {row.day: row.count for row in conn.execute(select(UserRegistrationDay.__table__))}
+    return counts, days
+
+
+def reconcile_user_stats(conn) -> int:
+    """
+    Recompute the counters from ``users``; return how many were wrong.
+
+    Each counter is set by one ``UPDATE ... SET count = (SELECT count(*) ...)``,
+    so a user change committing at the same time is either counted by the
+    subquery or applies its own increment afterwards, never lost.
+    """
+    from app.core.database import dialect_insert
+
+    users = User.__table__
+    counts = UserCount.__table__
+    days = UserRegistrationDay.__table__
+    before_counts, before_days = _stored(conn)
+
+    # Counters for combinations that have no row yet, then every row from users
+    conn.execute(
+        dialect_insert(counts).from_select(
+            ["role", "is_active", "count"],
+            select(users.c.role, users.c.is_active, func.count()).group_by(users.c.role, users.c.is_active),
+        ).on_conflict_do_nothing()
+    )
+    conn.execute(counts.update().values(count=(
+        select(func.count()).select_from(users)
+        .where(and_(users.c.role == counts.c.role, users.c.is_active == counts.c.is_active))
+        .scalar_subquery()
+    )))
+
+    first_day = datetime.now(timezone.utc).date() - timedelta(days=REGISTRATION_DAYS_KEPT)
+    created_day = func.date(users.c.created_at)
+    conn.execute(days.delete().where(days.c.day < first_day))
+    conn.execute(
+        dialect_insert(days).from_select(
+            ["day", "count"],
+            select(created_day, func.count()).where(users.c.created_at >= first_day).group_by(created_day),
+        ).on_conflict_do_nothing()
+    )
+    conn.execute(days.update().values(count=(
+        select(func.count()).select_from(users).where(created_day == days.c.day).scalar_subquery()
+    )))
+
+    after_counts, after_days = _stored(conn)
+    drift = sum(
+        1 for key in set(before_counts) | set(after_counts) if before_counts.get(key, 0) != after_counts.get(key, 0)
+    ) + sum(
+        1 for day in after_days if before_days.get(day, 0) != after_days[day]
+    )
+    if drift:
+        logger.warning("Corrected %d user counters that had drifted from the users table", drift)
+    return drift
+
+
+def run_reconciliation() -> int:
+    from app.core.database import background_engine
+
+    with background_engine.begin() as conn:
+        return reconcile_user_stats(conn)
+
+
+class UserStatsReconciler:
+    """Background thread running ``reconcile_user_stats`` every ``USER_STATS_RECONCILE_HOURS``"""
+
+    def __init__(self) -> None:
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="user-stats-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        interval = settings.USER_STATS_RECONCILE_HOURS * 3600
+        # Startup has just reconciled; jitter keeps the workers from running together
+        while not self._stopping.wait(interval * random.uniform(0.9, 1.1)):
+            try:
+                run_reconciliation()
+            except Exception:
+                logger.exception("User statistics reconciliation failed")
+
+
+user_stats_reconciler = UserStatsReconciler()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute the user counters behind /users/stats/overview")
+    parser.add_argument("--check", action="store_true", help="report drift without correcting it")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app.core.database import background_engine, engine
+    from app.models import Base
+
+    Base.metadata.create_all(bind=engine)
+    with background_engine.connect() as conn:
+        transaction = conn.begin()
+        drift = reconcile_user_stats(conn)
+        if args.check:
+            transaction.rollback()
+        else:
+            transaction.commit()
+    if args.check:
+        print(f"{drift} counters have drifted" if drift else "Counters match the users table")
+    else:
+        print(f"Corrected {drift} counters" if drift else "Counters already matched the users table")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Add orders.version for optimistic locking
+
+Revision ID: 3e8b5d0c7f12
+Revises: 7c1f3a9b2d45
+Create Date: 2026-10-19 18:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8b5d0c7f12'
+down_revision: Union[str, None] = '7c1f3a9b2d45'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('orders', 'orders_archive')
+
+
+def _missing_version(table: str) -> bool:
+    # orders_archive is created by the app at startup, with the column, if it does not exist yet
+    inspector = sa.inspect(op.get_bind())
+    return inspector.has_table(table) and 'version' not in {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        if _missing_version(table):
+            op.add_column(table, sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        if sa.inspect(op.get_bind()).has_table(table):
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_column('version')
@@ -0,0 +1,28 @@
+"""Index orders.updated_at for delta sync
+
+Revision ID: 7c1f3a9b2d45
+Revises: e0e62a3dac72
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1f3a9b2d45'
+down_revision: Union[str, None] = 'e0e62a3dac72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Orders never updated had no updated_at; sync orders by it, so fill it in
+    op.execute("UPDATE orders SET updated_at = created_at WHERE updated_at IS NULL")
+    op.create_index('ix_orders_updated_at_id', 'orders', ['updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_orders_updated_at_id', table_name='orders')
@@ -0,0 +1,65 @@
+"""Add pickup_slots and orders.pickup_slot_id
+
+Revision ID: 9d4a6c2e8b31
+Revises: 3e8b5d0c7f12
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4a6c2e8b31'
+down_revision: Union[str, None] = '3e8b5d0c7f12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('orders', 'orders_archive')
+
+
+def _has_column(inspector, table: str, column: str) -> bool:
+    return column in {existing['name'] for existing in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # Tables are also created by the app at startup, already complete
+    if not inspector.has_table('pickup_slots'):
+        op.create_table(
+            'pickup_slots',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('location_id', sa.Integer(), nullable=False),
+            sa.Column('pickup_date', sa.Date(), nullable=False),
+            sa.Column('pickup_time', sa.String(length=20), nullable=False),
+            sa.Column('capacity', sa.Integer(), nullable=False),
+            sa.Column('booked', sa.Integer(), nullable=False),
+            sa.CheckConstraint('booked >= 0', name='ck_pickup_slots_booked'),
+            sa.ForeignKeyConstraint(['location_id'], ['locations.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('location_id', 'pickup_date', 'pickup_time', name='uq_pickup_slots_location_date_time'),
+        )
+    for table in TABLES:
+        if not inspector.has_table(table) or _has_column(inspector, table, 'pickup_slot_id'):
+            continue
+        op.add_column(table, sa.Column('pickup_slot_id', sa.Integer(), nullable=True))
+        # Named as PostgreSQL names it for tables the app created; SQLite cannot add
+        # a constraint to an existing table without copying it
+        if bind.dialect.name != 'sqlite':
+            op.create_foreign_key(f'{table}_pickup_slot_id_fkey', table, 'pickup_slots', ['pickup_slot_id'], ['id'])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table in TABLES:
+        if not inspector.has_table(table) or not _has_column(inspector, table, 'pickup_slot_id'):
+            continue
+        if bind.dialect.name != 'sqlite':
+            op.drop_constraint(f'{table}_pickup_slot_id_fkey', table, type_='foreignkey')
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('pickup_slot_id')
+    op.drop_table('pickup_slots')
@@ -1,13 +1,28 @@
+import secrets
+
+import anyio.to_thread
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, PlainTextResponse
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.core.database import engine, get_db
+from app.core.compression import CompressionMiddleware
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.metrics import MetricsMiddleware, REGISTRY
+from app.core.outbox import outbox_dispatcher
+from app.core.query_budget import QueryBudgetMiddleware
+from app.core.replicas import ReadYourWritesMiddleware
+from app.core.revocation import token_revocations
+from app.core.tracing import TracingMiddleware
+from app.core.database import engine, get_db, replica_router
 from app.api.v1.api import api_router
 from app.models import Base
 from app.db import init_db
+from app.services.archive import order_archiver
+from app.services.backup import backup_scheduler
+from app.services.user_stats import run_reconciliation, user_stats_reconciler
+from app.services.notifications import install_email_notifications
 # Create tables
 Base.metadata.create_all(bind=engine)
 
@@ -23,6 +38,16 @@ import logging
 
 logger = logging.getLogger("uvicorn.error")
 
+# Replay responses for repeated Idempotency-Key requests. Added first so it runs
+# innermost: stored responses are uncompressed and carry no per-request headers.
+if settings.IDEMPOTENCY_ENABLED:
+    app.add_middleware(IdempotencyMiddleware)
+
+# Keep users' reads on the primary right after they write (outside idempotency,
+# so the read_primary_until cookie is not stored with replayed responses)
+if settings.DATABASE_REPLICA_URLS:
+    app.add_middleware(ReadYourWritesMiddleware, router=replica_router)
+
 # Set up CORS
 app.add_middleware(
     CORSMiddleware,
@@ -30,8 +55,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "Idempotent-Replayed", "ETag"],
 )
 
+# Compress large JSON payloads (order lists, reports)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        content_types=settings.COMPRESSION_CONTENT_TYPES,
+        encodings=settings.COMPRESSION_ENCODINGS,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+        zstd_level=settings.COMPRESSION_ZSTD_LEVEL,
+        threadpool_min_size=settings.COMPRESSION_THREADPOOL_MIN_SIZE,
+    )
+
+# Per-route request counts, latency and SQL usage
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Log requests that exceed their SQL statement/latency budget
+if settings.SQL_BUDGET_ENABLED:
+    app.add_middleware(QueryBudgetMiddleware)
+
+# Trace id on every response; spans for sampled and slow requests
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
 logger.info(f"CORS allowed origins: {[str(origin) for origin in settings.BACKEND_CORS_ORIGINS if origin]}")
 
 # Add exception handler for auth login endpoint to log errors
@@ -61,15 +112,49 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "message": "LaundryConnect Kenya API is running"}
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics(request: Request):
+        """Prometheus metrics for this worker process"""
+        if settings.METRICS_TOKEN and not secrets.compare_digest(
+            request.headers.get("authorization", ""), f"Bearer {settings.METRICS_TOKEN}"
+        ):
+            return PlainTextResponse("Unauthorized", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
     """Initialize database with default data"""
+    if settings.THREADPOOL_SIZE:
+        # Threads running sync endpoints; see the pool sizing notes in README
+        anyio.to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
     db = next(get_db())
     try:
         init_db(db)
     finally:
         db.close()
+    # Counters for users written outside the app, or before the counters existed
+    run_reconciliation()
+    if settings.USER_STATS_RECONCILE_HOURS > 0:
+        user_stats_reconciler.start()
+    if settings.STATELESS_AUTH:
+        token_revocations.start()
+    if settings.OUTBOX_ENABLED:
+        install_email_notifications()
+        outbox_dispatcher.start()
+    if settings.ARCHIVE_ENABLED:
+        order_archiver.start()
+    if settings.BACKUP_ENABLED:
+        backup_scheduler.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    backup_scheduler.stop()
+    user_stats_reconciler.stop()
+    order_archiver.stop()
+    outbox_dispatcher.stop()
+    token_revocations.stop()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,6 @@
+"""
+Performance tooling: data seeding and measurement scripts.
+
+Run the scripts from the backend directory, e.g. ``python -m perf.compression``.
+They point DATABASE_URL at a scratch SQLite file unless one is already set.
+"""
@@ -0,0 +1,328 @@
+"""
+Micro-benchmarks for hot functions and queries, run in-process.
+
+    python -m perf.bench [--filter orders] [--repeat 15] [--min-time 0.1]
+                         [--save-baseline perf/bench-baseline.json] [--compare perf/bench-baseline.json]
+
+Each benchmark is warmed up, then timed ``--repeat`` times. Every
+repetition runs the function in a loop long enough to last at least
+``--min-time`` seconds, with garbage collection paused, like ``timeit``.
+The report gives the median time per call and the spread: min, and the
+median absolute deviation as a percentage of the median. Query benchmarks
+run against an in-memory SQLite database seeded with ``--customers`` and
+``--orders`` (fixed random seed), so results depend on the code alone.
+
+``--save-baseline`` stores the results as JSON. ``--compare`` reports each
+benchmark's change against a baseline and exits with status 1 when one got
+slower by more than ``--threshold`` (default 10%) and more than three times
+its measured spread. Compare results from the same machine and Python.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+# In-memory database, shared by the app's single SQLite connection
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+# create_order books a pickup slot on every call; never let the slot fill up
+os.environ.setdefault("PICKUP_SLOT_CAPACITY", "1000000000")
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(name: str):
+    """Register ``setup(context)``, which returns the zero-argument function to time"""
+    def register(setup: Callable) -> Callable:
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class Context:
+    """Seeded database and objects shared by the benchmarks, created once"""
+
+    def __init__(self, customers: int, orders: int) -> None:
+        from app.core.database import SessionLocal
+        from app.models.service import Service
+        from app.models.user import User
+        from perf.seed import seed_database
+
+        seed_database(customers=customers, orders=orders)
+        self.session_factory = SessionLocal
+        db = SessionLocal()
+        try:
+            self.admin = db.query(User).filter(User.role == "admin").first()
+            self.customer = db.query(User).filter(User.role == "customer").first()
+            self.service = db.query(Service).first()
+            db.expunge_all()
+        finally:
+            db.close()
+
+    def session(self):
+        return self.session_factory()
+
+
+@benchmark("calculate_order_price")
+def _calculate_order_price(context: Context):
+    from app.api.v1.endpoints.orders import calculate_order_price
+
+    service = context.service
+    return lambda: calculate_order_price(service, 7.5)
+
+
+@benchmark("generate_order_number")
+def _generate_order_number(context: Context):
+    from app.api.v1.endpoints.orders import generate_order_number
+
+    return generate_order_number
+
+
+@benchmark("create_access_token")
+def _create_access_token(context: Context):
+    from app.core.security import create_access_token
+
+    return lambda: create_access_token("admin")
+
+
+@benchmark("verify_token")
+def _verify_token(context: Context):
+    from app.core.security import create_access_token, verify_token
+
+    token = create_access_token("admin")
+    return lambda: verify_token(token)
+
+
+@benchmark("serialize_orders[100]")
+def _serialize_orders(context: Context):
+    from typing import List as ListOf
+
+    from pydantic import TypeAdapter
+    from sqlalchemy.orm import joinedload
+
+    from app.models.order import Order
+    from app.schemas.order import Order as OrderSchema
+
+    db = context.session()
+    orders = db.query(Order).options(
+        joinedload(Order.customer), joinedload(Order.service),
+        joinedload(Order.status_history), joinedload(Order.reviews),
+    ).order_by(Order.id).limit(100).all()
+    adapter = TypeAdapter(ListOf[OrderSchema])
+
+    # What FastAPI does with a response_model: validate from attributes, then dump JSON
+    def serialize():
+        return adapter.dump_json(adapter.validate_python(orders, from_attributes=True))
+
+    serialize.close = db.close
+    return serialize
+
+
+def _timed_endpoint(context: Context, endpoint: Callable, **params):
+    """Call an endpoint function with a fresh session each time, as a request would"""
+    def call():
+        db = context.session()
+        try:
+            return endpoint(db=db, current_user=context.admin, **params)
+        finally:
+            db.close()
+    return call
+
+
+@benchmark("read_orders[100]")
+def _read_orders(context: Context):
+    from app.api.v1.endpoints.orders import read_orders
+
+    return _timed_endpoint(
+        context, read_orders, skip=0, limit=100, status=None, date_from=None, date_to=None,
+        search=None, updated_since=None,
+    )
+
+
+@benchmark("read_orders[search]")
+def _read_orders_search(context: Context):
+    from app.api.v1.endpoints.orders import read_orders
+
+    return _timed_endpoint(
+        context, read_orders, skip=0, limit=20, status=None, date_from=None, date_to=None,
+        search="Customer 1", updated_since=None,
+    )
+
+
+@benchmark("read_customers[100]")
+def _read_customers(context: Context):
+    from app.api.v1.endpoints.customers import read_customers
+
+    return _timed_endpoint(context, read_customers, skip=0, limit=100, search=None, location=None)
+
+
+@benchmark("create_order")
+def _create_order(context: Context):
+    from datetime import date, timedelta
+
+    from app.api.v1.endpoints.orders import create_order
+    from app.schemas.order import OrderCreate
+
+    order_in = OrderCreate(
+        service_id=context.service.id, estimated_weight=5, pickup_date=date.today() + timedelta(days=1), pickup_time="morning",
+    )
+
+    # Every call books the pickup slot and writes an order, its first history row and an outbox row
+    def call():
+        db = context.session()
+        try:
+            return create_order(db=db, order_in=order_in, current_user=context.customer)
+        finally:
+            db.close()
+    return call
+
+
+def _loops_for(function: Callable, min_time: float) -> int:
+    """Loop count that makes one repetition last at least ``min_time``"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return loops
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.1))
+
+
+def measure(function: Callable, repeat: int, min_time: float, warmup: float) -> dict:
+    deadline = time.perf_counter() + warmup
+    while time.perf_counter() < deadline:
+        function()
+    loops = _loops_for(function, min_time)
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    try:
+        for _ in range(repeat):
+            gc.collect()
+            gc.disable()
+            started = time.perf_counter()
+            for _ in range(loops):
+                function()
+            timings.append((time.perf_counter() - started) / loops)
+            if gc_was_enabled:
+                gc.enable()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    median = statistics.median(timings)
+    mad = statistics.median(abs(timing - median) for timing in timings)
+    return {
+        "median_us": round(median * 1e6, 3),
+        "min_us": round(min(timings) * 1e6, 3),
+        "mean_us": round(statistics.fmean(timings) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(timings) * 1e6, 3) if len(timings) > 1 else 0.0,
+        "mad_us": round(mad * 1e6, 3),
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+def _format_time(microseconds: float) -> str:
+    if microseconds >= 1000:
+        return f"{microseconds / 1000:.2f} ms"
+    return f"{microseconds:.2f} us"
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Benchmarks slower than the baseline by more than ``threshold`` and the noise"""
+    regressions = []
+    for name, now in results.items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        slower = now["median_us"] - before["median_us"]
+        noise = 3 * max(now["mad_us"], before["mad_us"])
+        if now["median_us"] > before["median_us"] * (1 + threshold) and slower > noise:
+            regressions.append(
+                f"{name}: {_format_time(before['median_us'])} -> {_format_time(now['median_us'])} "
+                f"({now['median_us'] / before['median_us'] - 1:+.0%})"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--min-time", type=float, default=0.1, help="seconds per repetition")
+    parser.add_argument("--warmup", type=float, default=0.2, help="seconds of warmup per benchmark")
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="exit 1 if a benchmark regressed against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.filter or args.filter in name]
+    if args.list:
+        print("\n".join(names))
+        return
+
+    import logging
+
+    logging.disable(logging.WARNING)  # startup and SQL budget logs would interleave with the table
+    baseline: Optional[dict] = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    context = Context(args.customers, args.orders)
+    print(f"Python {platform.python_version()} on {platform.machine()}, {args.repeat} repetitions of >= {args.min_time:g}s")
+    header = f"{'benchmark':<26} {'median':>11} {'min':>11} {'+/- MAD':>8} {'loops':>7}"
+    if baseline:
+        header += f" {'baseline':>11} {'change':>7}"
+    print(header)
+    results = {}
+    for name in names:
+        function = BENCHMARKS[name](context)
+        try:
+            result = measure(function, args.repeat, args.min_time, args.warmup)
+        finally:
+            getattr(function, "close", lambda: None)()
+        results[name] = result
+        line = (
+            f"{name:<26} {_format_time(result['median_us']):>11} {_format_time(result['min_us']):>11} "
+            f"{result['mad_us'] / result['median_us']:>7.1%} {result['loops']:>7}"
+        )
+        before = baseline and baseline["benchmarks"].get(name)
+        if before:
+            line += f" {_format_time(before['median_us']):>11} {result['median_us'] / before['median_us'] - 1:>+7.0%}"
+        print(line, flush=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump({
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "customers": args.customers,
+                "orders": args.orders,
+                "benchmarks": results,
+            }, file, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    if baseline:
+        if (baseline.get("customers"), baseline.get("orders")) != (args.customers, args.orders):
+            print("Note: the baseline was measured on a different amount of seeded data")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measure response size and latency with and without compression.
+
+    python -m perf.compression [--orders 2000] [--repeat 20] [--bandwidth-kbps 1000]
+
+Requests go through the full ASGI stack in-process, so "server ms" is the
+time to build, serialize and compress the response. "Transfer ms" estimates
+the time to download the body on a link of the given bandwidth.
+"""
+import argparse
+import statistics
+import time
+
+from perf.seed import use_scratch_database
+
+use_scratch_database("compression")
+
+ENDPOINTS = [
+    "/orders/?limit=100",
+    "/orders/?limit=1000",
+    "/reports/overview?date_from=2000-01-01",
+    "/reports/revenue?date_from=2000-01-01",
+    "/reports/customers",
+    "/reports/orders?date_from=2000-01-01",
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--bandwidth-kbps", type=float, default=1000.0, help="simulated client bandwidth")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    from app.core.compression import available_encodings
+    from app.core.config import settings
+    from perf.seed import login, seed_database
+
+    seed_database(customers=args.customers, orders=args.orders)
+
+    import main as app_main
+
+    encodings = ["identity"] + [enc for enc in settings.COMPRESSION_ENCODINGS if enc in available_encodings()]
+    bytes_per_ms = args.bandwidth_kbps * 1000 / 8 / 1000
+
+    with TestClient(app_main.app) as client:
+        headers = login(client, "admin", settings.FIRST_SUPERUSER_PASSWORD)
+        print(f"{'endpoint':42} {'encoding':9} {'bytes':>10} {'ratio':>6} {'server ms':>10} {'transfer ms':>12} {'total ms':>9}")
+        for endpoint in ENDPOINTS:
+            url = f"{settings.API_V1_STR}{endpoint}"
+            identity_size = None
+            for encoding in encodings:
+                request_headers = dict(headers, **{"Accept-Encoding": encoding})
+                timings = []
+                size = 0
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    # stream=True keeps httpx from decoding, so we see bytes on the wire
+                    with client.stream("GET", url, headers=request_headers) as response:
+                        raw = b"".join(response.iter_raw())
+                    timings.append((time.perf_counter() - start) * 1000)
+                    size = len(raw)
+                if identity_size is None:
+                    identity_size = size
+                server_ms = statistics.median(timings)
+                transfer_ms = size / bytes_per_ms
+                print(
+                    f"{endpoint:42} {encoding:9} {size:>10} {size / identity_size:>6.2f} "
+                    f"{server_ms:>10.1f} {transfer_ms:>12.1f} {server_ms + transfer_ms:>9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
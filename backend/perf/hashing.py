@@ -0,0 +1,129 @@
+"""
+Calibrate the password hashing cost against a login latency budget.
+
+    python -m perf.hashing [--target-ms 250] [--scheme bcrypt|argon2] [--memory-mib 64]
+
+Each candidate cost is timed on this machine: bcrypt rounds from
+``--min-rounds`` up, or argon2 time cost at ``--memory-mib`` of memory.
+Each one is hashed ``--repeat`` times through the same code path as
+logins (salted password, ``CryptContext``). The report gives the median
+and slowest time per hash, and how many logins per second one CPU core
+sustains at that cost. The recommendation is the most expensive
+setting whose median fits in ``--target-ms``, printed as the settings
+to put in the environment.
+
+A login spends one hash. Registration, password changes and the rehash
+of an outdated hash after login spend another. Calibrate on the hardware
+that serves logins, while it is otherwise idle.
+"""
+import argparse
+import os
+import statistics
+import time
+from typing import Callable, List, Optional
+
+# Only settings are read; keep the app's default database untouched
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+PASSWORD = "correct horse battery staple"
+# Stop trying costs once a hash takes this many times the target
+OVERSHOOT = 2.5
+
+
+def time_hash(hash_password: Callable[[str], str], repeat: int) -> List[float]:
+    hash_password(PASSWORD)  # warm up: loads the backend
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hash_password(PASSWORD)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def calibrate(
+    scheme: str, costs: List[int], target: float, repeat: int, make_context: Callable[[int], object]
+) -> Optional[int]:
+    """Time each cost until one overshoots; return the most expensive one within ``target``"""
+    from app.core.security import generate_salt
+
+    salt = generate_salt()
+    best = None
+    for cost in costs:
+        context = make_context(cost)
+        timings = time_hash(lambda password: context.hash(password + salt), repeat)
+        median = statistics.median(timings)
+        print(
+            f"{scheme} {cost:>3}  {median * 1000:>9.1f} ms  {max(timings) * 1000:>9.1f} ms  {1 / median:>9.1f}/s",
+            flush=True,
+        )
+        if median <= target:
+            best = cost
+        if median > target * OVERSHOOT:
+            break
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250, help="latency budget for one hash")
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], help="default: PASSWORD_SCHEME")
+    parser.add_argument("--repeat", type=int, default=5, help="hashes timed per cost")
+    parser.add_argument("--min-rounds", type=int, default=10, help="first bcrypt rounds tried")
+    parser.add_argument("--memory-mib", type=int, default=64, help="argon2 memory per hash")
+    parser.add_argument("--parallelism", type=int, default=1, help="argon2 lanes")
+    args = parser.parse_args()
+
+    from app.core.config import settings
+    from app.core.security import create_password_context
+
+    scheme = args.scheme or settings.PASSWORD_SCHEME
+    target = args.target_ms / 1000
+    print(f"Target {args.target_ms:g} ms per hash; current policy: {_current_policy(settings)}")
+    print(f"{'cost':<10} {'median':>12} {'slowest':>12} {'per core':>11}")
+
+    if scheme == "bcrypt":
+        best = calibrate(
+            "rounds", list(range(args.min_rounds, 32)), target, args.repeat,
+            lambda rounds: create_password_context("bcrypt", bcrypt_rounds=rounds),
+        )
+        recommendation = best and ["PASSWORD_SCHEME=bcrypt", f"BCRYPT_ROUNDS={best}"]
+    else:
+        try:
+            create_password_context("argon2")
+        except RuntimeError as exc:
+            raise SystemExit(str(exc))
+        memory_cost = args.memory_mib * 1024
+        best = calibrate(
+            "time", list(range(1, 65)), target, args.repeat,
+            lambda time_cost: create_password_context(
+                "argon2", argon2_time_cost=time_cost, argon2_memory_cost=memory_cost,
+                argon2_parallelism=args.parallelism,
+            ),
+        )
+        recommendation = best and [
+            "PASSWORD_SCHEME=argon2", f"ARGON2_TIME_COST={best}",
+            f"ARGON2_MEMORY_COST={memory_cost}", f"ARGON2_PARALLELISM={args.parallelism}",
+        ]
+
+    if not recommendation:
+        raise SystemExit(
+            f"Even the cheapest setting tried takes longer than {args.target_ms:g} ms; "
+            "raise --target-ms, or lower --min-rounds / --memory-mib"
+        )
+    print("\nRecommended settings:")
+    for line in recommendation:
+        print(f"  {line}")
+    print("Existing hashes are upgraded as their users next log in.")
+
+
+def _current_policy(settings) -> str:
+    if settings.PASSWORD_SCHEME == "argon2":
+        return (
+            f"argon2 time_cost={settings.ARGON2_TIME_COST} memory_cost={settings.ARGON2_MEMORY_COST} KiB "
+            f"parallelism={settings.ARGON2_PARALLELISM}"
+        )
+    return f"bcrypt rounds={settings.BCRYPT_ROUNDS}"
+
+
+if __name__ == "__main__":
+    main()
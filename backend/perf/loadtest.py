@@ -0,0 +1,434 @@
+"""
+Load test: replay a weighted mix of real user flows and report latency per endpoint.
+
+    python -m perf.loadtest [--concurrency 16 | --rate 20] [--duration 30] [--workers 1]
+                            [--save-baseline perf/baseline.json] [--compare perf/baseline.json]
+
+Flows (weight): customers browsing services (30), checking their orders
+(20) and placing orders (10); staff working the dashboard and moving orders
+to their next status (25); admins viewing reports (15). Every flow logs in
+as a seeded user (admin, staff1, customer0..N).
+
+``--concurrency N`` runs N virtual users back to back (closed loop);
+``--rate R`` starts R flows per second, Poisson distributed, however long
+the server takes (open loop, which shows queueing that a closed loop hides).
+Requests in the first ``--warmup`` seconds are not counted.
+
+Without ``--url`` a scratch SQLite database is seeded and ``serve.py`` is
+started with rate limiting off. With ``--url`` an already running and
+seeded server is tested; its login rate limits apply to the initial logins.
+
+The report gives requests, throughput, error rate and p50/p95/p99 latency
+per endpoint. ``--save-baseline`` writes them to a JSON file;
+``--compare`` checks a run against one and exits with status 1 if an
+endpoint's p95 grew by more than ``--tolerance`` (and ``--min-delta-ms``),
+its error rate rose, or total throughput fell by more than the tolerance.
+The load generator shares the machine with the server unless ``--url``
+points elsewhere, so compare runs made on the same machine.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from perf.seed import SEED_PASSWORD, use_scratch_database
+
+use_scratch_database("loadtest")
+
+STAFF_PASSWORD = "staff123"
+NEXT_STATUS = {
+    "placed": "confirmed",
+    "confirmed": "collected",
+    "collected": "washing",
+    "washing": "ironing",
+    "ironing": "ready",
+    "ready": "out_for_delivery",
+    "out_for_delivery": "delivered",
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted ``values``"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Recorder:
+    """Latencies and outcomes per endpoint ("METHOD /route/{param}")"""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.recording = False
+        self.started = 0.0
+        self.stopped = 0.0
+
+    def start(self) -> None:
+        self.recording = True
+        self.started = time.perf_counter()
+
+    def stop(self) -> None:
+        self.recording = False
+        self.stopped = time.perf_counter()
+
+    def record(self, endpoint: str, status: str, seconds: float) -> None:
+        if self.recording:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def summary(self) -> dict:
+        elapsed = (self.stopped or time.perf_counter()) - self.started
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            latencies = sorted(self.latencies[endpoint])
+            statuses = self.statuses[endpoint]
+            errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "rps": round(len(latencies) / elapsed, 2),
+                "error_rate": round(errors / len(latencies), 4),
+                "errors": {status: count for status, count in statuses.items() if not status.startswith(("2", "3"))},
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            }
+        every = sorted(value for values in self.latencies.values() for value in values)
+        total_errors = sum(round(data["error_rate"] * data["requests"]) for data in endpoints.values())
+        total = {
+            "requests": len(every),
+            "rps": round(len(every) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(total_errors / len(every), 4) if every else 0.0,
+            "p50_ms": round(percentile(every, 50) * 1000, 2),
+            "p95_ms": round(percentile(every, 95) * 1000, 2),
+            "p99_ms": round(percentile(every, 99) * 1000, 2),
+        }
+        return {"seconds": round(elapsed, 2), "total": total, "endpoints": endpoints}
+
+
+class Session:
+    """One logged-in user; every request is timed under its endpoint name"""
+
+    def __init__(self, client, recorder: Recorder, headers: dict, username: str) -> None:
+        self.client = client
+        self.recorder = recorder
+        self.headers = headers
+        self.username = username
+
+    async def request(self, method: str, url: str, endpoint: str, **kwargs):
+        import httpx
+
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers={**self.headers, **kwargs.pop("headers", {})}, **kwargs)
+        except httpx.HTTPError as exc:
+            self.recorder.record(endpoint, type(exc).__name__, time.perf_counter() - started)
+            return None
+        self.recorder.record(endpoint, str(response.status_code), time.perf_counter() - started)
+        return response if response.status_code < 400 else None
+
+
+class Flows:
+    """The user flows and their shared state (services, orders waiting for staff)"""
+
+    def __init__(self, rng: random.Random) -> None:
+        self.rng = rng
+        self.service_ids: List[int] = []
+        self.placed = deque(maxlen=1000)  # orders placed during the run, for staff to move along
+
+    async def browse_services(self, session: Session) -> None:
+        response = await session.request("GET", "/services/", "GET /services/")
+        if response is not None:
+            self.service_ids = [service["id"] for service in response.json() if service.get("is_active", True)] or self.service_ids
+        if self.service_ids:
+            service_id = self.rng.choice(self.service_ids)
+            await session.request("GET", f"/services/{service_id}", "GET /services/{id}")
+
+    async def my_orders(self, session: Session) -> None:
+        await session.request("GET", "/customers/me", "GET /customers/me")
+        response = await session.request("GET", "/orders/", "GET /orders/", params={"limit": 20})
+        orders = response.json() if response is not None else []
+        if orders:
+            order = self.rng.choice(orders)
+            await session.request("GET", f"/orders/{order['id']}", "GET /orders/{id}")
+
+    async def place_order(self, session: Session) -> None:
+        if not self.service_ids:
+            await self.browse_services(session)
+            if not self.service_ids:
+                return
+        body = {
+            "service_id": self.rng.choice(self.service_ids),
+            "estimated_weight": round(self.rng.uniform(1, 12), 1),
+            "pickup_date": (date.today() + timedelta(days=self.rng.randint(1, 5))).isoformat(),
+            "pickup_time": self.rng.choice(["morning", "afternoon", "evening"]),
+            "service_options": "both",
+        }
+        response = await session.request(
+            "POST", "/orders/", "POST /orders/", json=body, headers={"Idempotency-Key": str(uuid.uuid4())}
+        )
+        if response is not None:
+            self.placed.append((response.json()["id"], "placed"))
+
+    async def staff_queue(self, session: Session) -> None:
+        await session.request("GET", "/reports/dashboard", "GET /reports/dashboard")
+        candidates = []
+        if self.placed:
+            candidates.append(self.placed.popleft())
+        else:
+            status = self.rng.choice(list(NEXT_STATUS))
+            response = await session.request(
+                "GET", "/orders/", "GET /orders/?status", params={"status": status, "limit": 20}
+            )
+            if response is not None:
+                candidates = [(order["id"], order["status"]) for order in response.json()]
+        if not candidates:
+            return
+        order_id, status = self.rng.choice(candidates)
+        if status not in NEXT_STATUS:
+            return
+        response = await session.request(
+            "PUT", f"/orders/{order_id}/status", "PUT /orders/{id}/status",
+            json={"status": NEXT_STATUS[status], "notes": "Load test"},
+            headers={"Idempotency-Key": str(uuid.uuid4())},
+        )
+        if response is not None and NEXT_STATUS[status] in NEXT_STATUS and self.rng.random() < 0.5:
+            self.placed.append((order_id, NEXT_STATUS[status]))
+
+    async def reports(self, session: Session) -> None:
+        date_from = (date.today() - timedelta(days=90)).isoformat()
+        await session.request("GET", "/reports/overview", "GET /reports/overview", params={"date_from": date_from})
+        await session.request("GET", "/reports/revenue", "GET /reports/revenue", params={"date_from": date_from})
+        await session.request("GET", "/reports/orders", "GET /reports/orders", params={"date_from": date_from})
+
+
+# (flow, role, weight)
+MIX = [
+    ("browse_services", "customer", 30),
+    ("my_orders", "customer", 20),
+    ("place_order", "customer", 10),
+    ("staff_queue", "staff", 25),
+    ("reports", "admin", 15),
+]
+
+
+async def _login(client, username: str, password: str) -> dict:
+    response = await client.post("/auth/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_load(args, base_url: str) -> dict:
+    import httpx
+
+    from app.core.config import settings
+
+    rng = random.Random(args.seed)
+    flows = Flows(rng)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        # Log every user in once up front; logins are deliberately slow (bcrypt) and not part of the mix
+        users = {
+            "admin": [(settings.FIRST_SUPERUSER_USERNAME, settings.FIRST_SUPERUSER_PASSWORD)],
+            "staff": [("staff1", STAFF_PASSWORD)],
+            "customer": [(f"customer{i}", SEED_PASSWORD) for i in range(args.users)],
+        }
+        sessions: Dict[str, List[Session]] = {}
+        for role, credentials in users.items():
+            sessions[role] = [
+                Session(client, recorder, await _login(client, username, password), username)
+                for username, password in credentials
+            ]
+
+        names = [name for name, _, _ in MIX]
+        weights = [weight for _, _, weight in MIX]
+        roles = {name: role for name, role, _ in MIX}
+
+        async def run_flow() -> None:
+            name = rng.choices(names, weights)[0]
+            await getattr(flows, name)(rng.choice(sessions[roles[name]]))
+
+        loop = asyncio.get_running_loop()
+        end = loop.time() + args.warmup + args.duration
+        loop.call_later(args.warmup, recorder.start)
+
+        if args.rate:
+            in_flight = set()
+            limit = asyncio.Semaphore(args.max_in_flight)
+
+            async def arrival() -> None:
+                async with limit:
+                    await run_flow()
+
+            while loop.time() < end:
+                task = asyncio.ensure_future(arrival())
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                await asyncio.sleep(rng.expovariate(args.rate))
+            recorder.stop()
+            if in_flight:
+                await asyncio.wait(in_flight, timeout=args.timeout)
+        else:
+            async def virtual_user() -> None:
+                while loop.time() < end:
+                    await run_flow()
+
+            await asyncio.gather(*(virtual_user() for _ in range(args.concurrency)))
+            recorder.stop()
+    return recorder.summary()
+
+
+def compare(result: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """Regressions of ``result`` against ``baseline``, as printable lines"""
+    regressions = []
+    for endpoint, now in result["endpoints"].items():
+        before = baseline["endpoints"].get(endpoint)
+        if before is None:
+            continue
+        if now["p95_ms"] > before["p95_ms"] * (1 + tolerance) and now["p95_ms"] - before["p95_ms"] > min_delta_ms:
+            regressions.append(f"{endpoint}: p95 {before['p95_ms']:.1f} -> {now['p95_ms']:.1f} ms")
+        if now["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(f"{endpoint}: error rate {before['error_rate']:.1%} -> {now['error_rate']:.1%}")
+    # Open loop throughput is just the offered rate; only closed loop runs say what the server can do
+    closed = all(run.get("settings", {}).get("mode") == "closed" for run in (result, baseline))
+    before, now = baseline["total"]["rps"], result["total"]["rps"]
+    if closed and now < before * (1 - tolerance):
+        regressions.append(f"throughput {before:.1f} -> {now:.1f} req/s")
+    return regressions
+
+
+def print_report(result: dict, baseline: Optional[dict] = None) -> None:
+    header = f"{'endpoint':<28} {'requests':>8} {'req/s':>7} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    if baseline:
+        header += f" {'p95 before':>10} {'change':>7}"
+    print(header)
+    rows = list(result["endpoints"].items()) + [("TOTAL", result["total"])]
+    for endpoint, data in rows:
+        line = (
+            f"{endpoint:<28} {data['requests']:>8} {data['rps']:>7.1f} {data['error_rate']:>7.1%} "
+            f"{data['p50_ms']:>8.1f} {data['p95_ms']:>8.1f} {data['p99_ms']:>8.1f}"
+        )
+        before = baseline and (baseline["total"] if endpoint == "TOTAL" else baseline["endpoints"].get(endpoint))
+        if before:
+            change = (data["p95_ms"] / before["p95_ms"] - 1) if before["p95_ms"] else 0.0
+            line += f" {before['p95_ms']:>10.1f} {change:>+7.0%}"
+        print(line)
+    for endpoint, data in result["endpoints"].items():
+        if data["errors"]:
+            print(f"  {endpoint}: " + ", ".join(f"{status} x{count}" for status, count in sorted(data["errors"].items())))
+
+
+def _wait_until_up(base_url: str, timeout: float = 60) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError("server did not start")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=16, help="virtual users running flows back to back")
+    load.add_argument("--rate", type=float, help="flows started per second (open loop)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds run before measuring")
+    parser.add_argument("--users", type=int, default=10, help="seeded customers to log in as")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="open loop: cap on concurrent flows")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="test a running server (e.g. http://127.0.0.1:8000) instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="serve.py workers when starting the server")
+    parser.add_argument("--port", type=int, default=8798)
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare with a baseline; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95/throughput change")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore p95 changes smaller than this")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # a line per request otherwise
+
+    from app.core.config import settings
+    from serve import cpu_count
+
+    server = None
+    root = args.url
+    if root is None:
+        from perf.seed import seed_database
+
+        seed_database(customers=max(args.customers, args.users), orders=args.orders)
+        root = f"http://127.0.0.1:{args.port}"
+        env = dict(
+            os.environ,
+            RATE_LIMIT_ENABLED="false",
+            # Over-budget requests log a warning each; that would skew the numbers
+            SQL_BUDGET_ENABLED="false",
+            # Orders still book their pickup slot, but a run must not fill the slots up
+            PICKUP_SLOT_CAPACITY="1000000",
+        )
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(args.workers), "--port", str(args.port),
+             "--no-access-log", "--log-level", "warning", "--max-requests", "0"],
+            env=env,
+        )
+    try:
+        _wait_until_up(root.rstrip("/"))
+        load = f"{args.rate:g} flows/s" if args.rate else f"{args.concurrency} virtual users"
+        print(f"{load} for {args.duration:g}s against {root} ({cpu_count()} CPUs here)")
+        result = asyncio.run(run_load(args, root.rstrip("/") + settings.API_V1_STR))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=60)
+
+    result["settings"] = {
+        "mode": "open" if args.rate else "closed",
+        "rate": args.rate,
+        "concurrency": None if args.rate else args.concurrency,
+        "duration": args.duration,
+        "workers": None if args.url else args.workers,
+        "url": args.url,
+    }
+    result["created_at"] = datetime.now(timezone.utc).isoformat()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_report(result, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(result, file, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    if baseline:
+        regressions = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        if baseline.get("settings", {}).get("mode") != result["settings"]["mode"]:
+            print("Note: the baseline was recorded in a different load mode")
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            raise SystemExit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+SEED_PASSWORD = "password123"
+STATUS_FLOW = ["placed", "confirmed", "collected", "washing", "ironing", "ready", "out_for_delivery", "delivered"]
+
+
+def use_scratch_database(name: str = "perf") -> str:
+    """Point the app at a throwaway SQLite file; must run before importing app modules"""
+    if "DATABASE_URL" not in os.environ:
+        path = os.path.join(tempfile.gettempdir(), f"laundryconnect-{name}.db")
+        if os.path.exists(path):
+            os.remove(path)
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return os.environ["DATABASE_URL"]
+
+
+def seed(db, customers: int = 200, orders: int = 2000, seed_value: int = 42) -> None:
+    """
+    Create customers and orders with realistic status histories and reviews.
+
+    All seeded customers share one salt and password (``SEED_PASSWORD``) so
+    seeding does not pay for one bcrypt hash per user.
+    """
+    from app.core.security import generate_salt, hash_password_with_salt
+    from app.db import init_db
+    from app.models.customer import Customer
+    from app.models.order import Order, OrderReview, OrderStatusHistory
+    from app.models.service import Service
+    from app.models.user import User
+
+    rng = random.Random(seed_value)
+    init_db(db)
+
+    salt = generate_salt()
+    password_hash = hash_password_with_salt(SEED_PASSWORD, salt)
+    services = db.query(Service).all()
+
+    customer_rows = []
+    for i in range(customers):
+        user = User(
+            username=f"customer{i}",
+            email=f"customer{i}@example.com",
+            password_hash=password_hash,
+            salt=salt,
+            role="customer",
+            is_active=True,
+        )
+        customer = Customer(
+            user=user,
+            name=f"Customer {i}",
+            phone=f"+2547{i:08d}",
+            email=f"customer{i}@example.com",
+            address=f"{i} Seed Street, Nairobi",
+            location_name=rng.choice(["Westlands", "Kilimani", "Karen", "CBD", "Kasarani"]),
+        )
+        db.add(customer)
+        customer_rows.append(customer)
+    db.flush()
+
+    now = datetime.now()
+    for i in range(orders):
+        customer = rng.choice(customer_rows)
+        service = rng.choice(services)
+        created = now - timedelta(days=rng.randint(0, 400), minutes=rng.randint(0, 1440))
+        steps = rng.randint(1, len(STATUS_FLOW))
+        status = "cancelled" if rng.random() < 0.05 else STATUS_FLOW[steps - 1]
+        weight = round(rng.uniform(1, 15), 1)
+        total = service.price_per_unit * weight
+        order = Order(
+            order_number=f"LS{i:08d}",
+            customer_id=customer.id,
+            service_id=service.id,
+            estimated_weight=weight,
+            actual_weight=weight if steps > 2 else None,
+            total_price=total,
+            final_price=total if steps > 2 else None,
+            status=status,
+            pickup_date=created.date() + timedelta(days=1),
+            pickup_time=rng.choice(["morning", "afternoon", "evening"]),
+            delivery_date=(created.date() + timedelta(days=3)) if status == "delivered" else None,
+            service_options="both",
+            special_instructions="Seeded order",
+            created_at=created,
+        )
+        for step, step_status in enumerate(STATUS_FLOW[:steps]):
+            order.status_history.append(OrderStatusHistory(
+                status=step_status,
+                timestamp=created + timedelta(hours=6 * step),
+                notes=f"Status changed to {step_status}",
+                updated_by="staff1",
+            ))
+        if status == "delivered" and rng.random() < 0.3:
+            order.reviews.append(OrderReview(rating=rng.randint(3, 5), comment="Great service"))
+        db.add(order)
+    db.commit()
+
+
+def seed_database(customers: int = 200, orders: int = 2000) -> None:
+    """Create the schema and seed it using the app's own engine"""
+    from app.core.database import SessionLocal, engine
+    from app.models import Base
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed(db, customers=customers, orders=orders)
+    finally:
+        db.close()
+
+
+def login(client, username: str, password: str) -> dict:
+    """Return an Authorization header for a TestClient/httpx client"""
+    from app.core.config import settings
+
+    response = client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        data={"username": username, "password": password},
+    )
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
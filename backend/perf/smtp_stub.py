@@ -0,0 +1,137 @@
+"""
+Local SMTP server for trying out order notification emails.
+
+    python -m perf.smtp_stub [--port 8025] [--mbox mail.mbox] [--fail-rate 0.1] [--reject-domain invalid.test]
+
+Accepts every message (nothing is relayed), prints a line per message and,
+on exit, how many messages arrived over how many connections, which shows
+whether the sender reuses its connection. ``--fail-rate`` answers that
+fraction of messages with a temporary 451 error and ``--reject-domain``
+refuses recipients in a domain with 550, to exercise retries and
+permanent failures. Point the API at it with::
+
+    EMAILS_ENABLED=true SMTP_HOST=127.0.0.1 SMTP_PORT=8025 SMTP_TLS=false SMTP_USER= \
+        EMAILS_FROM_EMAIL=orders@example.com EMAIL_DEBOUNCE_SECONDS=2 python serve.py
+"""
+import argparse
+import asyncio
+import email
+import email.policy
+import random
+import time
+from typing import Optional
+
+STATS = {"connections": 0, "messages": 0, "temporary_failures": 0, "rejected": 0}
+
+
+class Session:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, args) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.args = args
+        self.sender: Optional[str] = None
+        self.recipients = []
+
+    async def reply(self, line: str) -> None:
+        self.writer.write(line.encode() + b"\r\n")
+        await self.writer.drain()
+
+    async def run(self) -> None:
+        await self.reply("220 smtp-stub ready")
+        while True:
+            raw = await self.reader.readline()
+            if not raw:
+                return
+            command, _, argument = raw.decode(errors="replace").rstrip("\r\n").partition(" ")
+            command = command.upper()
+            if command == "EHLO":
+                await self.reply("250-smtp-stub\r\n250-8BITMIME\r\n250 SMTPUTF8")
+            elif command == "HELO":
+                await self.reply("250 smtp-stub")
+            elif command == "MAIL":
+                self.sender, self.recipients = argument, []
+                await self.reply("250 OK")
+            elif command == "RCPT":
+                address = argument.partition(":")[2].strip().strip("<>")
+                if self.args.reject_domain and address.endswith("@" + self.args.reject_domain):
+                    STATS["rejected"] += 1
+                    await self.reply("550 No such mailbox")
+                else:
+                    self.recipients.append(address)
+                    await self.reply("250 OK")
+            elif command == "DATA":
+                await self.data()
+            elif command == "RSET":
+                self.sender, self.recipients = None, []
+                await self.reply("250 OK")
+            elif command == "NOOP":
+                await self.reply("250 OK")
+            elif command == "QUIT":
+                await self.reply("221 Bye")
+                return
+            else:
+                await self.reply("502 Command not implemented")
+
+    async def data(self) -> None:
+        if not self.recipients:
+            await self.reply("503 No valid recipients")
+            return
+        await self.reply("354 End data with <CR><LF>.<CR><LF>")
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line or line == b".\r\n":
+                break
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        if random.random() < self.args.fail_rate:
+            STATS["temporary_failures"] += 1
+            await self.reply("451 Temporary failure, try again later")
+            return
+        STATS["messages"] += 1
+        message = email.message_from_bytes(b"".join(lines), policy=email.policy.default)
+        print(f"{time.strftime('%H:%M:%S')} {', '.join(self.recipients)}: {message['Subject']}")
+        if self.args.mbox:
+            with open(self.args.mbox, "ab") as mbox:
+                mbox.write(f"From {self.sender or 'MAILER-DAEMON'} {time.asctime()}\n".encode())
+                mbox.write(b"".join(lines).replace(b"\r\n", b"\n") + b"\n")
+        self.recipients = []
+        await self.reply("250 OK: queued")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--mbox", help="append received messages to this mbox file")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of messages answered with 451")
+    parser.add_argument("--reject-domain", help="refuse recipients in this domain with 550")
+    args = parser.parse_args()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        STATS["connections"] += 1
+        try:
+            await Session(reader, writer, args).run()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, args.host, args.port)
+    print(f"SMTP stub listening on {args.host}:{args.port} (Ctrl+C to stop)")
+    started = time.monotonic()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        elapsed = time.monotonic() - started
+        print(
+            f"\n{STATS['messages']} messages over {STATS['connections']} connections in {elapsed:.0f}s; "
+            f"{STATS['temporary_failures']} temporary failures, {STATS['rejected']} rejected recipients"
+        )
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,150 @@
+"""
+Benchmark throughput and latency for worker count x DB pool size x threadpool size.
+
+    python -m perf.workers [--workers 1,2,4] [--pool-sizes 2,5,10] [--threads 40] [--concurrency 32]
+
+Each combination starts ``serve.py`` and drives a mix of authenticated read
+endpoints over HTTP with a fixed number of concurrent clients. The scratch
+SQLite database is seeded automatically. Point ``DATABASE_URL`` at an
+already-seeded PostgreSQL database to measure pool effects; on SQLite every
+worker shares a single connection, so only the worker and threadpool
+dimensions change anything. The load generator runs on the same machine and
+competes with the server for CPU.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from perf.seed import use_scratch_database
+
+use_scratch_database("workers")
+
+ENDPOINTS = [
+    "/orders/?limit=20",
+    "/customers/?limit=20",
+    "/services/",
+    "/reports/overview",
+]
+
+
+def _csv_ints(value: str):
+    return [int(item) for item in value.split(",") if item]
+
+
+async def _drive(base_url: str, headers: dict, concurrency: int, duration: float):
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(index: int) -> None:
+        nonlocal errors
+        async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=30) as client:
+            i = index
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(ENDPOINTS[i % len(ENDPOINTS)])
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+                i += 1
+
+    await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+    return latencies, errors
+
+
+def _wait_until_up(base_url: str, timeout: float = 60) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError("server did not start")
+
+
+def _run_one(args, workers: int, pool_size: int, threads: int) -> dict:
+    import httpx
+
+    from app.core.config import settings
+    from perf.seed import login
+
+    env = dict(
+        os.environ,
+        DB_POOL_SIZE=str(pool_size),
+        DB_MAX_OVERFLOW="0",
+        THREADPOOL_SIZE=str(threads),
+        # /customers/ is over its statement budget; logging every request would skew the numbers
+        SQL_BUDGET_ENABLED="false",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port),
+         "--no-access-log", "--log-level", "warning", "--max-requests", "0"],
+        env=env,
+    )
+    try:
+        root = f"http://127.0.0.1:{args.port}"
+        _wait_until_up(root)
+        with httpx.Client(base_url=root) as client:
+            headers = login(client, "admin", settings.FIRST_SUPERUSER_PASSWORD)
+        base_url = f"{root}{settings.API_V1_STR}"
+        # Warm up every worker's caches and connections
+        asyncio.run(_drive(base_url, headers, args.concurrency, 2))
+        latencies, errors = asyncio.run(_drive(base_url, headers, args.concurrency, args.duration))
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / args.duration,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=_csv_ints, default=[1, 2, 4])
+    parser.add_argument("--pool-sizes", type=_csv_ints, default=[5])
+    parser.add_argument("--threads", type=_csv_ints, default=[40], help="THREADPOOL_SIZE per worker")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per combination")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=2000)
+    args = parser.parse_args()
+
+    from perf.seed import seed_database
+    from serve import cpu_count
+
+    if os.environ["DATABASE_URL"].startswith("sqlite"):
+        seed_database(customers=args.customers, orders=args.orders)
+
+    print(f"{cpu_count()} CPUs, {args.concurrency} concurrent clients, {os.environ['DATABASE_URL'].split(':')[0]}")
+    print(f"{'workers':>7} {'pool':>5} {'threads':>7} {'db conns':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for workers in args.workers:
+        for pool_size in args.pool_sizes:
+            for threads in args.threads:
+                result = _run_one(args, workers, pool_size, threads)
+                print(
+                    f"{workers:>7} {pool_size:>5} {threads:>7} {workers * pool_size:>8} {result['rps']:>8.0f} "
+                    f"{result['p50']:>8.1f} {result['p99']:>8.1f} {result['errors']:>6}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""
+Production server: a pre-forking supervisor around uvicorn workers.
+
+    python serve.py [--workers N] [--no-preload] [--max-requests N] [--max-memory-mb N]
+
+Defaults come from the SERVER_* settings in app/core/config.py.
+
+* Workers default to one per available CPU (affinity and cgroup quota aware).
+* With preload, the app is imported once in the supervisor and workers are
+  forked from it, so they share its memory copy-on-write.
+* A worker is recycled after ``SERVER_MAX_REQUESTS`` (+ random jitter)
+  requests or once its private memory exceeds ``SERVER_MAX_MEMORY_MB``. It
+  stops accepting connections, drains in-flight requests for up to
+  ``SERVER_GRACEFUL_TIMEOUT`` seconds and a replacement is forked.
+* uvloop and httptools are used when installed.
+
+Signals: TERM/INT shut down gracefully, HUP replaces every worker one at a
+time, TTIN/TTOU add or remove a worker. For development use
+``uvicorn main:app --reload`` instead.
+"""
+import argparse
+import importlib.util
+import logging
+import math
+import os
+import random
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+from uvicorn.server import Server
+
+from app.core.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# uvicorn's exit code when lifespan startup fails
+STARTUP_FAILURE = 3
+# A worker that dies this soon after being forked counts as a failed boot
+BOOT_GRACE_SECONDS = 5
+MAX_BOOT_FAILURES = 5
+
+
+def cpu_count() -> int:
+    """CPUs this process may run on, honouring CPU affinity and a cgroup v2 quota"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS, Windows
+        count = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+def default_workers() -> int:
+    # Endpoints are mostly short DB reads plus CPU-bound bcrypt and JSON work, so
+    # more processes than CPUs only adds memory and pool connections (see README)
+    return settings.WEB_CONCURRENCY or cpu_count()
+
+
+def private_memory_mb() -> Optional[float]:
+    """
+    Memory owned by this process alone, in MB.
+
+    Pages still shared copy-on-write with the preloaded supervisor are not
+    counted, so recycling is driven by what the worker itself has grown.
+    Falls back to RSS where smaps_rollup is unavailable.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            kb = sum(
+                int(line.split()[1])
+                for line in f
+                if line.startswith(("Private_Clean:", "Private_Dirty:"))
+            )
+        return kb / 1024
+    except OSError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+def resolve_implementation(option: str, module: str, fallback: str) -> str:
+    """Resolve "auto" to ``module`` when it is installed, as uvicorn would, so we can log the choice"""
+    if option != "auto":
+        return option
+    return module if importlib.util.find_spec(module) is not None else fallback
+
+
+class WorkerServer(Server):
+    """uvicorn server that also shuts down once it outgrows its memory ceiling"""
+
+    def __init__(self, config: uvicorn.Config, max_memory_mb: Optional[int]) -> None:
+        super().__init__(config)
+        self.max_memory_mb = max_memory_mb
+
+    async def on_tick(self, counter: int) -> bool:
+        if await super().on_tick(counter):
+            return True
+        # Ticks are 0.1s apart; check memory every 5 seconds
+        if self.max_memory_mb and counter % 50 == 0:
+            used = private_memory_mb()
+            if used is not None and used > self.max_memory_mb:
+                logger.warning(
+                    "Worker %d is using %.0f MB (limit %d MB). Recycling.",
+                    os.getpid(), used, self.max_memory_mb,
+                )
+                return True
+        return False
+
+
+class Supervisor:
+    """Forks, watches and replaces uvicorn worker processes sharing one listening socket"""
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        workers: int,
+        preload: bool,
+        max_requests: Optional[int],
+        max_requests_jitter: int,
+        max_memory_mb: Optional[int],
+        graceful_timeout: int,
+    ) -> None:
+        self.config = config
+        self.workers = workers
+        self.preload = preload
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_memory_mb = max_memory_mb
+        self.graceful_timeout = graceful_timeout
+        self.children: Dict[int, float] = {}  # pid -> fork time
+        self.retiring: Dict[int, float] = {}  # pid -> time SIGTERM was sent
+        self.signals: List[int] = []
+        self.boot_failures = 0
+        self.socket = None
+
+    # Worker side
+
+    def _run_worker(self) -> None:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, signal.SIG_DFL)
+        # Never reuse pooled connections inherited from the supervisor
+        database = sys.modules.get("app.core.database")
+        if database is not None:
+            database.engine.dispose(close=False)
+            database.background_engine.dispose(close=False)
+
+        if self.max_requests:
+            self.config.limit_max_requests = self.max_requests + random.randint(0, self.max_requests_jitter)
+        server = WorkerServer(self.config, self.max_memory_mb)
+        server.run(sockets=[self.socket])
+        if not server.started:
+            sys.exit(STARTUP_FAILURE)
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        exit_code = 0
+        try:
+            self._run_worker()
+        except SystemExit as exc:
+            exit_code = exc.code if isinstance(exc.code, int) else 1
+        except BaseException:
+            logger.exception("Worker %d crashed", os.getpid())
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    # Supervisor side
+
+    def _on_signal(self, signum, frame) -> None:
+        self.signals.append(signum)
+
+    def _reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            retired = self.retiring.pop(pid, None) is not None
+            exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            if retired or started is None:
+                continue
+            if exit_code == 0:
+                logger.info("Worker %d exited for recycling", pid)
+                self.boot_failures = 0
+                continue
+            logger.error("Worker %d exited with code %d", pid, exit_code)
+            if exit_code == STARTUP_FAILURE or time.monotonic() - started < BOOT_GRACE_SECONDS:
+                self.boot_failures += 1
+            else:
+                self.boot_failures = 0
+
+    def _retire(self, pid: int) -> None:
+        if pid in self.retiring:
+            return
+        self.retiring[pid] = time.monotonic()
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _rolling_restart(self) -> None:
+        logger.info("Replacing %d workers", len(self.children))
+        for pid in [pid for pid in self.children if pid not in self.retiring]:
+            self.spawn()
+            self._retire(pid)
+
+    def _active(self) -> List[int]:
+        return [pid for pid in self.children if pid not in self.retiring]
+
+    def _handle_signals(self) -> bool:
+        """Act on queued signals; return True when the supervisor should stop"""
+        while self.signals:
+            signum = self.signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                return True
+            if signum == signal.SIGHUP:
+                self._rolling_restart()
+            elif signum == signal.SIGTTIN:
+                self.workers += 1
+                logger.info("Increasing workers to %d", self.workers)
+            elif signum == signal.SIGTTOU and self.workers > 1:
+                self.workers -= 1
+                logger.info("Decreasing workers to %d", self.workers)
+        return False
+
+    def _shutdown(self) -> None:
+        logger.info("Shutting down %d workers (graceful timeout %ds)", len(self.children), self.graceful_timeout)
+        for pid in list(self.children):
+            self._retire(pid)
+        # uvicorn cancels requests still running after timeout_graceful_shutdown;
+        # allow a little longer for lifespan shutdown before killing outright
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            if signal.SIGINT in self.signals:
+                break  # a second Ctrl+C skips the drain
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            logger.warning("Killing worker %d", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.children.clear()
+
+    def _seed_database(self) -> None:
+        """
+        Run the default-data setup once before forking.
+
+        Otherwise every worker's startup hook races to create the default users
+        on an empty database, and all but one fail their first boot.
+        """
+        from app.core.database import SessionLocal, engine
+        from app.db import init_db
+
+        db = SessionLocal()
+        try:
+            init_db(db)
+        finally:
+            db.close()
+        # Never hand the supervisor's connection to the workers
+        engine.dispose()
+
+    def run(self) -> int:
+        self.socket = self.config.bind_socket()
+        if self.preload:
+            self.config.load()
+            self._seed_database()
+
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, self._on_signal)
+
+        logger.info(
+            "Supervisor %d starting %d workers (preload=%s, max_requests=%s, max_memory_mb=%s)",
+            os.getpid(), self.workers, self.preload, self.max_requests, self.max_memory_mb,
+        )
+        exit_code = 0
+        while True:
+            self._reap()
+            if self._handle_signals():
+                break
+            if self.boot_failures >= MAX_BOOT_FAILURES:
+                logger.error("Workers failed to boot %d times in a row, giving up", self.boot_failures)
+                exit_code = 1
+                break
+            active = self._active()
+            for _ in range(self.workers - len(active)):
+                self.spawn()
+            for pid in active[self.workers:]:
+                self._retire(pid)
+            # Backoff while workers keep failing to start
+            time.sleep(0.2 if not self.boot_failures else min(2 ** self.boot_failures * 0.1, 5))
+
+        self._shutdown()
+        self.socket.close()
+        return exit_code
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--preload", dest="preload", action="store_true", default=settings.SERVER_PRELOAD)
+    parser.add_argument("--no-preload", dest="preload", action="store_false")
+    parser.add_argument("--max-requests", type=int, default=settings.SERVER_MAX_REQUESTS, help="0 disables")
+    parser.add_argument("--max-requests-jitter", type=int, default=settings.SERVER_MAX_REQUESTS_JITTER)
+    parser.add_argument("--max-memory-mb", type=int, default=settings.SERVER_MAX_MEMORY_MB)
+    parser.add_argument("--graceful-timeout", type=int, default=settings.SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--keepalive", type=int, default=settings.SERVER_KEEPALIVE)
+    parser.add_argument("--backlog", type=int, default=settings.SERVER_BACKLOG)
+    parser.add_argument("--loop", default=settings.SERVER_LOOP, help="auto, uvloop or asyncio")
+    parser.add_argument("--http", default=settings.SERVER_HTTP, help="auto, httptools or h11")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    args = parser.parse_args()
+
+    loop = resolve_implementation(args.loop, "uvloop", "asyncio")
+    http = resolve_implementation(args.http, "httptools", "h11")
+    config = uvicorn.Config(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        loop=loop,
+        http=http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keepalive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+        access_log=args.access_log,
+    )
+    logger.info("Using %s event loop and %s HTTP parser", loop, http)
+
+    if not hasattr(os, "fork"):
+        # No fork on Windows: fall back to uvicorn's spawn-based workers
+        logger.warning("os.fork unavailable; preload and memory-based recycling are disabled")
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            limit_max_requests=args.max_requests or None,
+            timeout_graceful_shutdown=args.graceful_timeout,
+            log_level=args.log_level,
+        )
+        return
+
+    supervisor = Supervisor(
+        config,
+        workers=max(1, args.workers),
+        preload=args.preload,
+        max_requests=args.max_requests or None,
+        max_requests_jitter=args.max_requests_jitter,
+        max_memory_mb=args.max_memory_mb,
+        graceful_timeout=args.graceful_timeout,
+    )
+    sys.exit(supervisor.run())
+
+
+if __name__ == "__main__":
+    main()
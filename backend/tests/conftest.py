@@ -0,0 +1,99 @@
+import itertools
+import os
+import tempfile
+from datetime import date, timedelta
+
+# Settings are read when the app is imported: point it at a throwaway database
+# and keep the background threads and per-IP limits out of the tests
+_tmpdir = tempfile.mkdtemp(prefix="laundryconnect-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/test.db"
+os.environ.setdefault("OUTBOX_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("USER_STATS_RECONCILE_HOURS", "0")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.security import create_access_token
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db(client):
+    from app.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def auth_headers(username: str) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(username)}"}
+
+
+@pytest.fixture
+def admin_headers():
+    return auth_headers("admin")
+
+
+@pytest.fixture
+def staff_headers():
+    return auth_headers("staff1")
+
+
+@pytest.fixture
+def customer_headers():
+    return auth_headers("john_doe")
+
+
+@pytest.fixture
+def customer(db):
+    """A customer of their own, so tests do not see each other's orders"""
+    from app.models.customer import Customer
+    from app.models.user import User
+
+    n = next(_ids)
+    user = User(username=f"test_customer{n}", email=f"test{n}@example.com",
+                password_hash="-", salt="-", role="customer", is_active=True)
+    customer = Customer(user=user, name=f"Test Customer {n}", phone=f"+2547{n:08d}")
+    db.add(customer)
+    db.commit()
+    customer.headers = auth_headers(user.username)
+    return customer
+
+
+@pytest.fixture
+def make_order(db):
+    from app.models.order import Order
+    from app.models.service import Service
+
+    service = db.query(Service).first()
+
+    def make_order(customer, **values) -> Order:
+        n = next(_ids)
+        order = Order(
+            order_number=f"TEST{n:08d}",
+            customer_id=customer.id,
+            service_id=service.id,
+            estimated_weight=5,
+            total_price=500,
+            pickup_date=date.today() + timedelta(days=1),
+            pickup_time="morning",
+            **values,
+        )
+        db.add(order)
+        db.commit()
+        return order
+
+    return make_order
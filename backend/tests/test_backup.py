@@ -0,0 +1,67 @@
+import pytest
+
+from app.core.config import settings
+from app.services import backup
+
+
+@pytest.fixture
+def backup_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "BACKUP_DIR", str(tmp_path))
+    return tmp_path
+
+
+def add_snapshot(backup_dir, day: int, verified: bool, error=None) -> str:
+    name = f"laundryconnect-202601{day:02d}T020000Z.db.gz"
+    (backup_dir / name).write_bytes(b"snapshot")
+    backup._write_manifest(backup_dir / name, {"name": name, "verified": verified, "error": error})
+    return name
+
+
+def names():
+    return [manifest["name"] for manifest in backup.list_snapshots()]
+
+
+def test_prune_counts_only_verified_snapshots(backup_dir):
+    good = [add_snapshot(backup_dir, day, verified=True) for day in (1, 2, 3)]
+    failed = add_snapshot(backup_dir, 4, verified=False, error="checksum does not match the manifest")
+    unverified = add_snapshot(backup_dir, 5, verified=False)
+
+    backup._prune(2, verified_only=True)
+    assert names() == [good[2], good[1]]
+    assert not (backup_dir / f"{failed}.json").exists()
+    assert not (backup_dir / unverified).exists()
+
+
+def test_prune_without_verification_keeps_unchecked_snapshots(backup_dir):
+    add_snapshot(backup_dir, 1, verified=True)
+    failed = add_snapshot(backup_dir, 2, verified=False, error="integrity check failed")
+    unverified = [add_snapshot(backup_dir, day, verified=False) for day in (3, 4)]
+
+    backup._prune(2, verified_only=False)
+    assert names() == [unverified[1], unverified[0]]
+    assert failed not in names()
+
+
+def test_schedule_without_verification_follows_newest_good_snapshot(client, backup_dir, monkeypatch):
+    monkeypatch.setattr(settings, "BACKUP_VERIFY", False)
+    monkeypatch.setattr(settings, "BACKUP_INTERVAL_HOURS", 24)
+    assert backup.BackupScheduler._seconds_until_due() == 0
+
+    manifest = backup.create_snapshot()
+    assert not manifest["verified"]
+    assert backup.BackupScheduler._seconds_until_due() > 23 * 3600
+
+    # A failed snapshot does not count as a backup taken
+    backup_dir.joinpath(manifest["name"]).unlink()
+    add_snapshot(backup_dir, 1, verified=False, error="integrity check failed")
+    assert backup.BackupScheduler._seconds_until_due() == 0
+
+
+def test_create_snapshot_verifies_and_rotates(client, backup_dir, monkeypatch):
+    monkeypatch.setattr(settings, "BACKUP_KEEP", 1)
+    add_snapshot(backup_dir, 1, verified=True)
+    add_snapshot(backup_dir, 2, verified=False, error="integrity check failed")
+
+    manifest = backup.create_snapshot(verify=True)
+    assert manifest["verified"]
+    assert names() == [manifest["name"]]
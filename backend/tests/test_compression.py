@@ -0,0 +1,42 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.core.compression import CompressionMiddleware
+
+BODY = {"orders": [{"id": i, "status": "placed"} for i in range(200)]}
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/orders")
+    def orders():
+        return JSONResponse(BODY, headers={"ETag": '"7"'})
+
+    @app.get("/weak")
+    def weak():
+        return JSONResponse(BODY, headers={"ETag": 'W/"7"'})
+
+    app.add_middleware(CompressionMiddleware, encodings=("gzip",))
+    return app
+
+
+def test_encoded_response_gets_weak_etag():
+    client = TestClient(make_app())
+    response = client.get("/orders", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"7"'
+    assert json.loads(response.content) == BODY
+
+    weak = client.get("/weak", headers={"Accept-Encoding": "gzip"})
+    assert weak.headers["etag"] == 'W/"7"'
+
+
+def test_identity_response_keeps_strong_etag():
+    response = TestClient(make_app()).get("/orders", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"7"'
+    assert json.loads(response.content) == BODY
@@ -0,0 +1,20 @@
+from sqlalchemy import func
+
+from app.models.user import User
+
+
+def dashboard_users(client, headers):
+    response = client.get("/api/v1/reports/dashboard", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json().get("users")
+
+
+def test_admin_user_counts_match_users_table(client, db, admin_headers, staff_headers, customer):
+    users = dashboard_users(client, admin_headers)
+    rows = db.query(User.role, User.is_active, func.count(User.id)).group_by(User.role, User.is_active).all()
+    assert users["total"] == sum(count for _, _, count in rows) == db.query(User).count()
+    assert users["by_role"]["customer"] == sum(count for role, _, count in rows if role == "customer")
+    assert users["active"] == sum(count for _, is_active, count in rows if is_active)
+    assert users["inactive"] == sum(count for _, is_active, count in rows if not is_active)
+
+    assert dashboard_users(client, staff_headers) is None
@@ -0,0 +1,50 @@
+from datetime import date, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.forecast import DailyHistory, ForecastModel
+
+
+def history(start: date, days: int, offset: int = 0) -> DailyHistory:
+    # Two series, orders and kilograms, with a weekly pattern and some noise
+    rng = np.random.default_rng(offset)
+    t = np.arange(offset, offset + days)
+    weekly = 10 + 4 * np.sin(2 * np.pi * t / 7)
+    orders = weekly + rng.normal(0, 1, days)
+    values = np.stack([orders, orders * 6])[:, np.newaxis, :]  # (metric, series, day)
+    return DailyHistory(start, [(1, 1)], values)
+
+
+def test_advanced_leaves_published_model_unchanged():
+    start = date(2026, 1, 5)
+    model = ForecastModel(history(start, 60), fitted_at=start + timedelta(days=60))
+    before = (model.level.copy(), model.season.copy(), model.sse.copy(), model.fitted_through, model.scored_days)
+
+    newer = model.advanced(history(start + timedelta(days=60), 3, offset=60))
+    assert newer is not model
+    assert newer.fitted_through == model.fitted_through + timedelta(days=3)
+    assert newer.scored_days == model.scored_days + 3
+    assert not np.array_equal(newer.level, model.level)
+
+    level, season, sse, fitted_through, scored_days = before
+    assert np.array_equal(model.level, level)
+    assert np.array_equal(model.season, season)
+    assert np.array_equal(model.sse, sse)
+    assert (model.fitted_through, model.scored_days) == (fitted_through, scored_days)
+
+
+def test_advancing_day_by_day_matches_advancing_at_once():
+    start = date(2026, 1, 5)
+    model = ForecastModel(history(start, 60), fitted_at=start + timedelta(days=60))
+    at_once = model.advanced(history(start + timedelta(days=60), 4, offset=60))
+
+    stepped = model
+    for day in range(4):
+        whole = history(start + timedelta(days=60), 4, offset=60)
+        stepped = stepped.advanced(DailyHistory(whole.start + timedelta(days=day), whole.keys, whole.values[..., day:day + 1]))
+    assert stepped.fitted_through == at_once.fitted_through
+    assert np.allclose(stepped.level, at_once.level)
+    assert np.allclose(stepped.season, at_once.season)
+    assert np.allclose(stepped.sse, at_once.sse)
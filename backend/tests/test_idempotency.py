@@ -0,0 +1,129 @@
+import asyncio
+import itertools
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from sqlalchemy import create_engine
+
+from app.core.idempotency import IdempotencyMiddleware, IdempotencyStore, idempotent
+from app.models.idempotency import IdempotencyKey
+from tests.conftest import auth_headers
+
+_keys = itertools.count()
+
+
+@pytest.fixture
+def store(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/idempotency.db", connect_args={"check_same_thread": False})
+    IdempotencyKey.__table__.create(engine)
+    yield IdempotencyStore(engine)
+    engine.dispose()
+
+
+def make_app(store: IdempotencyStore):
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/charge")
+    @idempotent
+    async def charge(payload: dict):
+        app.state.calls += 1
+        return {"call": app.state.calls, "amount": payload["amount"]}
+
+    @app.post("/slow")
+    @idempotent
+    async def slow(payload: dict):
+        app.state.calls += 1
+        await app.state.release.wait()
+        return {"call": app.state.calls}
+
+    @app.post("/flaky")
+    @idempotent
+    async def flaky(payload: dict):
+        app.state.calls += 1
+        if app.state.calls == 1:
+            raise HTTPException(status_code=503, detail="Try again")
+        return {"call": app.state.calls}
+
+    app.add_middleware(IdempotencyMiddleware, store=store)
+    return app
+
+
+def headers(key=None):
+    return {**auth_headers("john_doe"), "Idempotency-Key": key or f"key-{next(_keys)}"}
+
+
+async def post(app, path, json, headers):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(path, json=json, headers=headers)
+
+
+def test_repeated_key_replays_stored_response(store):
+    app = make_app(store)
+    request_headers = headers()
+
+    async def run():
+        first = await post(app, "/charge", {"amount": 100}, request_headers)
+        second = await post(app, "/charge", {"amount": 100}, request_headers)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json() == {"call": 1, "amount": 100}
+    assert "idempotent-replayed" not in first.headers
+    assert second.headers["idempotent-replayed"] == "true"
+    assert app.state.calls == 1
+
+
+def test_concurrent_duplicate_waits_for_first_request(store):
+    app = make_app(store)
+    request_headers = headers()
+
+    async def run():
+        # Made inside the loop: before 3.10 an Event binds to the loop current at creation
+        app.state.release = asyncio.Event()
+        first = asyncio.create_task(post(app, "/slow", {}, request_headers))
+        await asyncio.sleep(0.2)
+        second = asyncio.create_task(post(app, "/slow", {}, request_headers))
+        await asyncio.sleep(0.2)
+        assert not second.done()
+        app.state.release.set()
+        return await first, await second
+
+    first, second = asyncio.run(run())
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json() == {"call": 1}
+    assert second.headers["idempotent-replayed"] == "true"
+    assert app.state.calls == 1
+
+
+def test_key_reused_with_different_body_is_rejected(store):
+    app = make_app(store)
+    request_headers = headers()
+
+    async def run():
+        await post(app, "/charge", {"amount": 100}, request_headers)
+        return await post(app, "/charge", {"amount": 200}, request_headers)
+
+    response = asyncio.run(run())
+    assert response.status_code == 422
+    assert app.state.calls == 1
+
+
+def test_key_released_after_server_error(store):
+    app = make_app(store)
+    request_headers = headers()
+
+    async def run():
+        failed = await post(app, "/flaky", {}, request_headers)
+        retried = await post(app, "/flaky", {}, request_headers)
+        return failed, retried
+
+    failed, retried = asyncio.run(run())
+    assert failed.status_code == 503
+    assert retried.status_code == 200
+    assert "idempotent-replayed" not in retried.headers
+    assert app.state.calls == 2
+    assert store.get("john_doe", request_headers["Idempotency-Key"]).status == "completed"
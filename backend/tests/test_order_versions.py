@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy import event, update
+
+from app.core.database import SessionLocal
+from app.models.order import Order
+
+
+def set_status(client, staff_headers, order, status, if_match=None):
+    headers = dict(staff_headers)
+    if if_match is not None:
+        headers["If-Match"] = if_match
+    return client.put(f"/api/v1/orders/{order.id}/status", json={"status": status}, headers=headers)
+
+
+def test_status_update_bumps_version_and_etag(client, staff_headers, customer, make_order):
+    order = make_order(customer)
+    url = f"/api/v1/orders/{order.id}"
+    assert client.get(url, headers={**staff_headers, "Accept-Encoding": "identity"}).headers["ETag"] == '"1"'
+    # Compressed, the same order carries the weak form of its tag, which If-Match accepts
+    etag = client.get(url, headers={**staff_headers, "Accept-Encoding": "gzip"}).headers["ETag"]
+    assert etag == 'W/"1"'
+
+    response = set_status(client, staff_headers, order, "confirmed", if_match=etag)
+    assert response.status_code == 200, response.text
+    assert response.headers["ETag"] in ('"2"', 'W/"2"')
+    assert response.json()["version"] == 2
+
+
+def test_illegal_transition_is_rejected(client, staff_headers, customer, make_order):
+    order = make_order(customer)
+    response = set_status(client, staff_headers, order, "delivered")
+    assert response.status_code == 409
+    assert "placed to delivered" in response.json()["detail"]
+
+    order = make_order(customer, status="cancelled")
+    assert set_status(client, staff_headers, order, "placed").status_code == 409
+
+
+def test_stale_if_match_is_rejected(client, staff_headers, customer, make_order):
+    order = make_order(customer)
+    etag = client.get(f"/api/v1/orders/{order.id}", headers=staff_headers).headers["ETag"]
+    assert set_status(client, staff_headers, order, "confirmed").status_code == 200
+
+    response = set_status(client, staff_headers, order, "collected", if_match=etag)
+    assert response.status_code == 412
+    assert set_status(client, staff_headers, order, "collected", if_match='W/"2", "7"').status_code == 200
+
+
+@pytest.fixture
+def concurrent_update():
+    """Bump the version of orders being written, as another request committing first would"""
+
+    def bump(session, flush_context, instances):
+        for obj in session.dirty:
+            if isinstance(obj, Order):
+                session.connection().execute(
+                    update(Order.__table__).where(Order.__table__.c.id == obj.id)
+                    .values(version=Order.__table__.c.version + 1)
+                )
+
+    event.listen(SessionLocal, "before_flush", bump)
+    yield
+    event.remove(SessionLocal, "before_flush", bump)
+
+
+def test_concurrent_update_is_rejected(client, db, staff_headers, customer, make_order, concurrent_update):
+    order = make_order(customer)
+    response = set_status(client, staff_headers, order, "confirmed")
+    assert response.status_code == 409
+    assert "someone else" in response.json()["detail"]
+    db.refresh(order)
+    assert order.status == "placed"
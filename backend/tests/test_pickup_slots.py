@@ -0,0 +1,92 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.models.pickup_slot import PickupSlot
+from app.models.service import Service
+from app.services.pickup_slots import (
+    PickupSlotFull,
+    default_location_id,
+    release_pickup_slot,
+    reserve_pickup_slot,
+    set_slot_capacity,
+)
+
+
+@pytest.fixture
+def location_id(client, db):
+    return default_location_id(db)
+
+
+def book(client, db, customer, pickup_date, window="evening"):
+    service = db.query(Service).first()
+    return client.post("/api/v1/orders/", headers=customer.headers, json={
+        "service_id": service.id,
+        "estimated_weight": 3,
+        "pickup_date": pickup_date.isoformat(),
+        "pickup_time": window,
+    })
+
+
+def slot(db, location_id, pickup_date, window="evening") -> PickupSlot:
+    db.expire_all()
+    return db.query(PickupSlot).filter_by(location_id=location_id, pickup_date=pickup_date, pickup_time=window).one()
+
+
+def test_reserve_rejects_booking_after_last_place(db, location_id):
+    pickup_date = date.today() + timedelta(days=10)
+    set_slot_capacity(db, location_id, pickup_date, "morning", 2)
+    first = reserve_pickup_slot(db, location_id, pickup_date, "morning")
+    assert reserve_pickup_slot(db, location_id, pickup_date, "morning") == first
+    with pytest.raises(PickupSlotFull):
+        reserve_pickup_slot(db, location_id, pickup_date, "morning")
+
+    assert release_pickup_slot(db, first) == location_id
+    assert reserve_pickup_slot(db, location_id, pickup_date, "morning") == first
+    db.rollback()
+
+
+def test_full_slot_rejects_order_and_cancelling_frees_a_place(client, db, customer, staff_headers, location_id):
+    pickup_date = date.today() + timedelta(days=11)
+    set_slot_capacity(db, location_id, pickup_date, "evening", 2)
+    db.commit()
+    orders = [book(client, db, customer, pickup_date) for _ in range(2)]
+    assert [response.status_code for response in orders] == [200, 200]
+    assert orders[0].json()["pickup_slot_id"] == slot(db, location_id, pickup_date).id
+
+    full = book(client, db, customer, pickup_date)
+    assert full.status_code == 409
+    assert "fully booked" in full.json()["detail"]
+    assert slot(db, location_id, pickup_date).booked == 2
+
+    cancelled = client.put(
+        f"/api/v1/orders/{orders[0].json()['id']}/status", json={"status": "cancelled"}, headers=staff_headers
+    )
+    assert cancelled.status_code == 200, cancelled.text
+    assert slot(db, location_id, pickup_date).booked == 1
+    assert book(client, db, customer, pickup_date).status_code == 200
+
+
+def test_availability_cache_is_cleared_on_commit(client, db, customer, staff_headers, location_id, monkeypatch):
+    monkeypatch.setattr(settings, "PICKUP_AVAILABILITY_CACHE_SECONDS", 3600)
+    pickup_date = date.today() + timedelta(days=12)
+
+    def remaining():
+        response = client.get("/api/v1/pickup-slots/availability", params={"days": 13}, headers=customer.headers)
+        assert response.status_code == 200, response.text
+        windows = {day["pickup_date"]: day["windows"] for day in response.json()["days"]}[pickup_date.isoformat()]
+        return {window["pickup_time"]: window["remaining"] for window in windows}["afternoon"]
+
+    before = remaining()
+    order = book(client, db, customer, pickup_date, "afternoon")
+    assert order.status_code == 200, order.text
+    assert remaining() == before - 1
+
+    client.put(f"/api/v1/orders/{order.json()['id']}/status", json={"status": "cancelled"}, headers=staff_headers)
+    assert remaining() == before
+
+    # A change the worker did not make (another worker's) is not seen until the entry expires
+    set_slot_capacity(db, location_id, pickup_date, "afternoon", 1)
+    db.commit()
+    assert remaining() == before
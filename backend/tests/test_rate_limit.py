@@ -0,0 +1,40 @@
+from app.core.rate_limit import MemoryBackend, RateLimit
+
+
+def make_backend(max_keys: int = 10) -> MemoryBackend:
+    backend = MemoryBackend()
+    backend.MAX_KEYS = max_keys
+    return backend
+
+
+def test_bucket_allows_limit_then_rejects():
+    backend = make_backend()
+    rate = RateLimit(3, 60)
+    assert [backend.hit("login:ip:a", rate, now=0)[0] for _ in range(4)] == [True, True, True, False]
+    allowed, wait = backend.hit("login:ip:a", rate, now=0)
+    assert not allowed and wait == 20
+
+
+def test_flooding_new_keys_keeps_exhausted_bucket_in_use():
+    backend = make_backend(max_keys=10)
+    rate = RateLimit(2, 60)
+    for _ in range(2):
+        backend.hit("login:username:victim", rate, now=0)
+    for i in range(100):
+        backend.hit(f"login:username:fake{i}", rate, now=0)
+        # The attacker keeps trying the exhausted key between the new ones
+        allowed, _ = backend.hit("login:username:victim", rate, now=0)
+        assert not allowed
+    assert len(backend._buckets) <= 10
+
+
+def test_prune_drops_full_buckets_before_recently_used_ones():
+    backend = make_backend(max_keys=4)
+    rate = RateLimit(1, 60)
+    backend.hit("old", rate, now=0)  # refilled by now=100
+    backend.hit("busy", rate, now=90)
+    backend.hit("a", rate, now=95)
+    backend.hit("b", rate, now=96)
+    backend.hit("c", rate, now=100)
+    assert "old" not in backend._buckets
+    assert not backend.hit("busy", rate, now=100)[0]
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core import tracing
+from app.core.config import settings
+from app.core.query_budget import QueryBudgetMiddleware
+from app.core.tracing import TracingMiddleware
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_REQUEST_MS", 50)
+    monkeypatch.setattr(settings, "TRACING_SLOW_REQUEST_MS", 50)
+    monkeypatch.setattr(settings, "TRACING_SAMPLE_RATE", 0)
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.1)
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for i in range(2):
+                await asyncio.sleep(0.05)
+                yield f"data: {i}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app.add_middleware(QueryBudgetMiddleware)
+    app.add_middleware(TracingMiddleware)
+    return app
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    traces = []
+    monkeypatch.setattr(tracing.exporter, "submit", traces.append)
+    return traces
+
+
+def test_slow_request_is_reported(app, exported, caplog):
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        TestClient(app).get("/slow")
+    assert "over SQL/latency budget" in caplog.text
+    assert len(exported) == 1
+
+
+def test_event_stream_duration_is_not_reported_as_slow(app, exported, caplog):
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        response = TestClient(app).get("/stream")
+    assert response.text == "data: 0\n\ndata: 1\n\n"
+    assert "over SQL/latency budget" not in caplog.text
+    assert exported == []
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.sync import SyncToken, as_utc
+
+NAIROBI = timezone(timedelta(hours=3))
+
+
+def sync(client, customer, token=None, limit=500):
+    params = {"limit": limit}
+    if token:
+        params["sync_token"] = token
+    response = client.get("/api/v1/orders/sync", params=params, headers=customer.headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def sync_all(client, customer, token=None, limit=500):
+    """Follow has_more to the end; return every page"""
+    pages = [sync(client, customer, token, limit)]
+    while pages[-1]["has_more"]:
+        pages.append(sync(client, customer, pages[-1]["sync_token"], limit))
+    return pages
+
+
+def test_sync_token_round_trip():
+    since = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=NAIROBI)
+    started = datetime(2026, 3, 1, 9, 0, tzinfo=timezone.utc)
+    token = SyncToken.decode(SyncToken(since, 42, started).encode())
+    assert token.since == since and token.since.tzinfo == timezone.utc
+    assert token.after_id == 42
+    assert token.snapshot_started == started
+
+    token = SyncToken.decode(SyncToken(datetime(2026, 3, 1, 9, 30)).encode())
+    assert token.since == datetime(2026, 3, 1, 9, 30, tzinfo=timezone.utc)  # naive is UTC
+    assert token.snapshot_started is None
+
+
+@pytest.mark.parametrize("token", ["", "not-a-token", "eyJ2Ijo5OSwiaWQiOjB9"])
+def test_sync_token_rejects_garbage(token):
+    with pytest.raises(ValueError):
+        SyncToken.decode(token)
+
+
+def test_sync_with_garbage_token_is_rejected(client, customer):
+    response = client.get("/api/v1/orders/sync", params={"sync_token": "garbage"}, headers=customer.headers)
+    assert response.status_code == 400
+
+
+def test_as_utc():
+    assert as_utc(datetime(2026, 3, 1, 12, 0, tzinfo=NAIROBI)) == datetime(2026, 3, 1, 9, 0, tzinfo=timezone.utc)
+    assert as_utc(datetime(2026, 3, 1, 12, 0)).utcoffset() == timedelta(0)
+
+
+def test_sync_pages_through_equal_timestamps_by_id(client, db, customer, make_order):
+    # Same updated_at for all: only the id tie-break keeps the pages apart
+    updated_at = datetime.now(timezone.utc) - timedelta(hours=1)
+    orders = [make_order(customer, updated_at=updated_at) for _ in range(5)]
+
+    pages = sync_all(client, customer, limit=2)
+    assert [page["has_more"] for page in pages] == [True, True, False]
+    assert [order["id"] for page in pages for order in page["changed"]] == [order.id for order in orders]
+
+    # Deltas continue from the snapshot: only what changed afterwards
+    delta = sync(client, customer, pages[-1]["sync_token"])
+    assert delta["changed"] == [] and delta["removed"] == []
+    orders[2].status = "confirmed"
+    db.commit()
+    delta = sync(client, customer, delta["sync_token"])
+    assert [order["id"] for order in delta["changed"]] == [orders[2].id]
+
+
+def test_sync_reports_cancelled_and_deleted_orders(client, db, customer, make_order):
+    updated_at = datetime.now(timezone.utc) - timedelta(hours=1)
+    _, cancelled, deleted = (make_order(customer, updated_at=updated_at) for _ in range(3))
+    token = sync_all(client, customer)[-1]["sync_token"]
+
+    cancelled.status = "cancelled"
+    db.delete(deleted)
+    db.commit()
+    delta = sync(client, customer, token)
+    assert delta["changed"] == []
+    assert {(row["id"], row["reason"]) for row in delta["removed"]} == {
+        (cancelled.id, "cancelled"),
+        (deleted.id, "deleted"),
+    }
+
+
+def test_updated_since_with_offset_is_compared_in_utc(client, customer, make_order):
+    updated_at = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=2)
+    order = make_order(customer, updated_at=updated_at)
+
+    def changed_since(moment):
+        response = client.get(
+            "/api/v1/orders/", params={"updated_since": moment.isoformat()}, headers=customer.headers
+        )
+        assert response.status_code == 200, response.text
+        return [row["id"] for row in response.json()]
+
+    assert changed_since((updated_at - timedelta(minutes=1)).astimezone(NAIROBI)) == [order.id]
+    assert changed_since((updated_at + timedelta(minutes=1)).astimezone(NAIROBI)) == []
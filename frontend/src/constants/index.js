@@ -27,6 +27,20 @@ export const ORDER_STATUS = {
   CANCELLED: 'cancelled'
 };
 
+// Statuses an order may move to from each status (mirrors ORDER_TRANSITIONS in
+// backend/app/models/order.py; the API rejects any other change with 409)
+export const ORDER_TRANSITIONS = {
+  [ORDER_STATUS.PLACED]: [ORDER_STATUS.CONFIRMED, ORDER_STATUS.CANCELLED],
+  [ORDER_STATUS.CONFIRMED]: [ORDER_STATUS.COLLECTED, ORDER_STATUS.CANCELLED],
+  [ORDER_STATUS.COLLECTED]: [ORDER_STATUS.WASHING, ORDER_STATUS.IRONING, ORDER_STATUS.CANCELLED],
+  [ORDER_STATUS.WASHING]: [ORDER_STATUS.IRONING, ORDER_STATUS.READY],
+  [ORDER_STATUS.IRONING]: [ORDER_STATUS.READY],
+  [ORDER_STATUS.READY]: [ORDER_STATUS.OUT_FOR_DELIVERY],
+  [ORDER_STATUS.OUT_FOR_DELIVERY]: [ORDER_STATUS.DELIVERED, ORDER_STATUS.READY],
+  [ORDER_STATUS.DELIVERED]: [],
+  [ORDER_STATUS.CANCELLED]: []
+};
+
 // Service Types
 export const SERVICE_TYPES = {
   STANDARD: 'standard',
@@ -1,7 +1,7 @@
 import React, { useState } from 'react';
 import { useOrders } from '../../hooks/useOrders';
 import LoadingSpinner from '../../components/common/LoadingSpinner';
-import { ORDER_STATUS, STATUS_LABELS, STATUS_COLORS, PICKUP_TIME_LABELS } from '../../constants';
+import { ORDER_STATUS, ORDER_TRANSITIONS, STATUS_LABELS, STATUS_COLORS, PICKUP_TIME_LABELS } from '../../constants';
 import toast from 'react-hot-toast';
 import { useMutation, useQueryClient } from '@tanstack/react-query';
 import { orderService } from '../../services/orderService';
@@ -326,14 +326,18 @@ const StaffOrdersPage = () => {
 
 // Update Modal Component
 const UpdateModal = ({ order, type, onUpdateStatus, onUpdateWeight, onClose, isUpdating }) => {
-  const [selectedStatus, setSelectedStatus] = React.useState(order.status);
+  // Only the statuses the order can move to next; the API refuses the rest
+  const nextStatuses = ORDER_TRANSITIONS[order.status] || [];
+  const [selectedStatus, setSelectedStatus] = React.useState(nextStatuses[0] || '');
   const [actualWeight, setActualWeight] = React.useState('');
 
   const handleSubmit = (e) => {
     e.preventDefault();
     
     if (type === 'status') {
-      onUpdateStatus(order.id, selectedStatus);
+      if (selectedStatus) {
+        onUpdateStatus(order.id, selectedStatus);
+      }
     } else if (type === 'weight') {
       const weight = parseFloat(actualWeight);
       if (weight > 0) {
@@ -365,16 +369,22 @@ const UpdateModal = ({ order, type, onUpdateStatus, onUpdateWeight, onClose, isU
             {type === 'status' ? (
               <div className="form-group">
                 <label className="form-label">New Status</label>
-                <select
-                  value={selectedStatus}
-                  onChange={(e) => setSelectedStatus(e.target.value)}
-                  className="form-select"
-                  required
-                >
-                  {Object.entries(STATUS_LABELS).map(([status, label]) => (
-                    <option key={status} value={status}>{label}</option>
-                  ))}
-                </select>
+                {nextStatuses.length > 0 ? (
+                  <select
+                    value={selectedStatus}
+                    onChange={(e) => setSelectedStatus(e.target.value)}
+                    className="form-select"
+                    required
+                  >
+                    {nextStatuses.map((status) => (
+                      <option key={status} value={status}>{STATUS_LABELS[status]}</option>
+                    ))}
+                  </select>
+                ) : (
+                  <p className="form-help">
+                    {STATUS_LABELS[order.status]} is final; the status can no longer change
+                  </p>
+                )}
               </div>
             ) : (
               <div className="form-group">
@@ -399,7 +409,7 @@ const UpdateModal = ({ order, type, onUpdateStatus, onUpdateWeight, onClose, isU
               <button type="button" onClick={onClose} className="btn btn-secondary">
                 Cancel
               </button>
-              <button type="submit" className="btn btn-primary" disabled={isUpdating}>
+              <button type="submit" className="btn btn-primary" disabled={isUpdating || (type === 'status' && !selectedStatus)}>
                 {isUpdating ? <LoadingSpinner size="small" color="white" /> : 'Update'}
               </button>
             </div>